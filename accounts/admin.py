@@ -1,13 +1,19 @@
 """
 管理画面のカスタマイズ
 
-CustomUserモデルの管理画面での表示方法を定義します。
+CustomUserモデルと送信待ちメール、チラシ画像の縮小版の生成待ちの管理画面での表示方法を定義します。
+チラシ画像は元の画像ではなく縮小版（サムネイル）を表示します。
 """
 
 from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
+from .archive import stream_flyer_archive
+from .models import FlyerDerivativeTask, OutgoingEmail
 
 CustomUser = get_user_model()
 
@@ -15,14 +21,16 @@ CustomUser = get_user_model()
 class CustomUserAdmin(UserAdmin):
     """カスタムユーザーモデルの管理画面定義"""
 
-    list_display = ('email', 'full_name', 'booth_name', 'is_active', 'is_staff')
+    list_display = ('email', 'full_name', 'booth_name', 'flyer_thumbnail', 'is_active', 'is_staff')
     list_filter = ('is_active', 'is_staff', 'is_superuser')
     search_fields = ('email', 'full_name', 'booth_name')
     ordering = ('email',)
+    readonly_fields = ('flyer_preview',)
+    actions = ['download_flyers']
 
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
-        (_('ブース情報'), {'fields': ('booth_name', 'booth_summary', 'booth_description', 'flyer_image')}),
+        (_('ブース情報'), {'fields': ('booth_name', 'booth_summary', 'booth_description', 'flyer_image', 'flyer_preview')}),
         (_('個人情報'), {'fields': ('full_name', 'phone', 'postal_code', 'address')}),
         (_('権限'), {'fields': ('is_active', 'is_staff', 'is_superuser', 'groups', 'user_permissions')}),
         (_('重要な日付'), {'fields': ('last_login', 'date_joined')}),
@@ -34,3 +42,86 @@ class CustomUserAdmin(UserAdmin):
             'fields': ('email', 'password1', 'password2'),
         }),
     )
+
+    @admin.display(description='チラシ画像')
+    def flyer_thumbnail(self, obj):
+        """一覧に表示するチラシ画像のサムネイル"""
+        if not obj.flyer_image:
+            return '-'
+        return format_html(
+            '<img src="{}" alt="" loading="lazy" style="max-height: 60px;">',
+            obj.flyer_thumbnail_url,
+        )
+
+    @admin.action(description='選択したユーザーのチラシ画像とブース情報をZIPで出力')
+    def download_flyers(self, request, queryset):
+        """チラシ画像とブース情報の一覧をZIPアーカイブとしてストリーミングで出力"""
+        response = StreamingHttpResponse(
+            stream_flyer_archive(queryset), content_type='application/zip'
+        )
+        filename = f'flyers_{timezone.localtime():%Y%m%d%H%M%S}.zip'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @admin.display(description='チラシ画像のプレビュー')
+    def flyer_preview(self, obj):
+        """編集画面に表示するチラシ画像のWeb表示用の縮小版"""
+        if not obj.flyer_image:
+            return '-'
+        return format_html(
+            '<a href="{}" target="_blank"><img src="{}" alt="" style="max-height: 300px;"></a>',
+            obj.flyer_image.url, obj.flyer_derivative_url('web'),
+        )
+
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    """送信待ちメールの管理画面定義（閲覧と再送のみ）"""
+
+    list_display = ('to_email', 'subject', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('to_email',)
+    readonly_fields = (
+        'subject', 'to_email', 'template_name', 'context', 'status',
+        'attempts', 'next_attempt_at', 'last_error', 'created_at', 'sent_at'
+    )
+    actions = ['retry']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='選択したメールを再送する')
+    def retry(self, request, queryset):
+        """送信に失敗したメールを送信待ちに戻す"""
+        count = queryset.filter(status=OutgoingEmail.STATUS_FAILED).update(
+            status=OutgoingEmail.STATUS_PENDING,
+            attempts=0,
+            next_attempt_at=timezone.now(),
+        )
+        self.message_user(request, f'{count}件のメールを送信待ちに戻しました。')
+
+
+@admin.register(FlyerDerivativeTask)
+class FlyerDerivativeTaskAdmin(admin.ModelAdmin):
+    """縮小版の生成待ちの管理画面定義（閲覧と再処理のみ）"""
+
+    list_display = ('source', 'status', 'attempts', 'created_at', 'processed_at')
+    list_filter = ('status',)
+    search_fields = ('source',)
+    readonly_fields = (
+        'source', 'status', 'attempts', 'next_attempt_at', 'last_error', 'created_at', 'processed_at'
+    )
+    actions = ['retry']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='選択したチラシ画像の縮小版を再生成する')
+    def retry(self, request, queryset):
+        """選択したチラシ画像を処理待ちに戻す"""
+        count = queryset.update(
+            status=FlyerDerivativeTask.STATUS_PENDING,
+            attempts=0,
+            next_attempt_at=timezone.now(),
+        )
+        self.message_user(request, f'{count}件のチラシ画像を処理待ちに戻しました。')
@@ -0,0 +1,128 @@
+"""
+出展者のチラシ画像とブース情報のZIPアーカイブ
+
+ZIPアーカイブを生成しながら少しずつバイト列を返すため、
+StreamingHttpResponse でそのまま配信できます。
+zipfile はシークできない出力先にも書き込める（各ファイルの後にデータ記述子を付ける）ため、
+アーカイブ全体をメモリや一時ファイルに作ることはありません。
+チラシ画像はストレージから一定サイズずつ読み込み、ユーザーは .iterator() で順に読み込みます。
+
+一覧の出展者が入力した値は、表計算ソフトで数式として実行されないようエスケープします。
+
+アーカイブの構成:
+    manifest.csv          ブース情報の一覧（BOM付きUTF-8）
+    flyers/<ID>.<拡張子>  各出展者のチラシ画像
+"""
+
+import csv
+import io
+import os
+import zipfile
+from django.utils import timezone
+
+ARCHIVE_CHUNK_SIZE = 64 * 1024
+USER_CHUNK_SIZE = 500
+
+MANIFEST_FIELDS = ('ID', '団体名', 'ブース名', 'ブースの概要', 'チラシ画像')
+
+# 表計算ソフトが数式として解釈するセルの先頭文字
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class ZipOutput(io.RawIOBase):
+    """zipfile が書き込んだバイト列を、取り出されるまで保持するシークできない出力先"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self):
+        """書き込まれたバイト列を取り出す"""
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def escape_csv_cell(value):
+    """数式として解釈される文字で始まる文字列の先頭に ' を付ける（CSVインジェクション対策）"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+
+def flyer_entry_name(user):
+    """アーカイブ内のチラシ画像のパス（チラシ画像がない場合は空文字列）"""
+    if not user.flyer_image:
+        return ''
+    extension = os.path.splitext(user.flyer_image.name)[1].lower()
+    return f'flyers/{user.pk}{extension}'
+
+
+def _entry(name, compress_type):
+    info = zipfile.ZipInfo(name, date_time=timezone.localtime().timetuple()[:6])
+    info.compress_type = compress_type
+    return info
+
+
+def stream_flyer_archive(queryset, chunk_size=ARCHIVE_CHUNK_SIZE):
+    """
+    チラシ画像とブース情報の一覧のZIPアーカイブを少しずつ返すジェネレーター
+
+    空のバイト列は返しません。
+    """
+    return (data for data in _iter_archive(queryset, chunk_size) if data)
+
+
+def _iter_archive(queryset, chunk_size):
+    """
+    ZIPアーカイブを書き込みながら、書き込まれたバイト列を順に返す
+
+    ユーザーを2回（一覧用、チラシ画像用）に分けて順に読み込むため、
+    メモリに保持するのは読み込み中のチャンクのみです。
+    チラシ画像は圧縮済みのため無圧縮で格納し、一覧のみを圧縮します。
+    ストレージにチラシ画像が見つからない出展者は、一覧の「チラシ画像」を空にします。
+    """
+    queryset = queryset.order_by('pk')
+    output = ZipOutput()
+    with zipfile.ZipFile(output, 'w') as archive:
+        with archive.open(_entry('manifest.csv', zipfile.ZIP_DEFLATED), 'w') as manifest:
+            text = io.TextIOWrapper(manifest, encoding='utf-8-sig', newline='')
+            writer = csv.writer(text)
+            writer.writerow(MANIFEST_FIELDS)
+            users = queryset.only(
+                'pk', 'organization_name', 'booth_name', 'booth_summary', 'flyer_image'
+            )
+            for user in users.iterator(chunk_size=USER_CHUNK_SIZE):
+                exists = bool(user.flyer_image) and user.flyer_image.storage.exists(user.flyer_image.name)
+                writer.writerow([
+                    user.pk,
+                    escape_csv_cell(user.organization_name or ''),
+                    escape_csv_cell(user.booth_name or ''),
+                    escape_csv_cell(user.booth_summary or ''),
+                    flyer_entry_name(user) if exists else '',
+                ])
+                text.flush()
+                yield output.pop()
+            text.flush()
+            text.detach()
+        yield output.pop()
+
+        flyers = queryset.exclude(flyer_image='').only('pk', 'flyer_image')
+        for user in flyers.iterator(chunk_size=USER_CHUNK_SIZE):
+            try:
+                source = user.flyer_image.storage.open(user.flyer_image.name)
+            except FileNotFoundError:
+                continue
+            with source, archive.open(_entry(flyer_entry_name(user), zipfile.ZIP_STORED), 'w') as entry:
+                for chunk in source.chunks(chunk_size):
+                    entry.write(chunk)
+                    yield output.pop()
+            yield output.pop()
+    yield output.pop()
@@ -0,0 +1,147 @@
+"""
+チラシ画像の縮小版（サムネイル・Web表示用）の生成
+
+チラシ画像の登録・変更時には生成待ちに登録するだけにして、
+process_flyer_derivatives コマンドのワーカーが Pillow で縮小版を生成します。
+縮小版は settings.FLYER_DERIVATIVES の最大サイズに収まるように縮小し、
+EXIF などのメタデータを除いて WebP または JPEG で保存します（向きは EXIF に従って補正）。
+
+縮小版は元の画像のパスから決まる flyer_derivatives/<縮小版の名前>/ 以下に上書きで保存し、
+見つからない場合は表示時（FlyerDerivativeView）にその場で生成し直します。
+ワーカーと表示時の生成が重なっても、同じパスのファイルを置き換えるだけで別名のファイルは増えません。
+"""
+
+import os
+from datetime import timedelta
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+from .models import FlyerDerivativeTask
+from .storage import derivative_storage, flyer_storage
+
+DERIVATIVE_DIRECTORY = 'flyer_derivatives'
+# 取り出したチラシ画像を他のワーカーに渡さずに確保しておく時間
+CLAIM_TIMEOUT = timedelta(minutes=5)
+# 生成に失敗したチラシ画像を再処理するまでの間隔（失敗回数に比例）
+RETRY_DELAY = timedelta(minutes=1)
+
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpeg'}
+CONTENT_TYPES = {'WEBP': 'image/webp', 'JPEG': 'image/jpeg'}
+
+
+def get_variant(variant):
+    """縮小版の設定を返す（存在しない場合は KeyError）"""
+    return settings.FLYER_DERIVATIVES[variant]
+
+
+def derivative_name(source, variant):
+    """元の画像のパスから縮小版のパスを生成"""
+    root, _extension = os.path.splitext(source)
+    extension = EXTENSIONS[get_variant(variant)['format']]
+    return f'{DERIVATIVE_DIRECTORY}/{variant}/{root}.{extension}'
+
+
+def render_derivative(source, variant):
+    """
+    元の画像から縮小版を生成して保存し、そのパスを返す
+
+    アニメーションGIFは最初のフレームを使用します。
+    """
+    options = get_variant(variant)
+    with flyer_storage.open(source) as file, Image.open(file) as image:
+        # JPEG はデコード時に縮小して読み込む（大きな画像のメモリ使用量を抑える）
+        image.draft('RGB', options['size'])
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(options['size'], Image.Resampling.LANCZOS)
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or (
+            image.mode == 'P' and 'transparency' in image.info
+        )
+        if options['format'] == 'JPEG' or not has_alpha:
+            if has_alpha:
+                # 透過部分は白で塗りつぶす
+                background = Image.new('RGB', image.size, 'white')
+                background.paste(image, mask=image.convert('RGBA').getchannel('A'))
+                image = background
+            else:
+                image = image.convert('RGB')
+        else:
+            image = image.convert('RGBA')
+
+        buffer = BytesIO()
+        # exif などを渡さずに保存するため、メタデータは含まれない
+        image.save(buffer, format=options['format'], quality=options['quality'], optimize=True)
+
+    return derivative_storage.save(derivative_name(source, variant), ContentFile(buffer.getvalue()))
+
+
+def ensure_derivative(source, variant):
+    """縮小版がなければ生成し、そのパスを返す"""
+    name = derivative_name(source, variant)
+    if derivative_storage.exists(name):
+        return name
+    return render_derivative(source, variant)
+
+
+def delete_derivatives(source):
+    """元の画像の全ての縮小版を削除"""
+    for variant in settings.FLYER_DERIVATIVES:
+        derivative_storage.delete(derivative_name(source, variant))
+
+
+def claim_batch(batch_size):
+    """処理対象のチラシ画像を取り出して「処理中」にする"""
+    now = timezone.now()
+    with transaction.atomic():
+        tasks = list(
+            FlyerDerivativeTask.objects.select_for_update(skip_locked=True).filter(
+                Q(status=FlyerDerivativeTask.STATUS_PENDING)
+                | Q(status=FlyerDerivativeTask.STATUS_PROCESSING),
+                next_attempt_at__lte=now,
+            ).order_by('next_attempt_at')[:batch_size]
+        )
+        FlyerDerivativeTask.objects.filter(pk__in=[task.pk for task in tasks]).update(
+            status=FlyerDerivativeTask.STATUS_PROCESSING,
+            next_attempt_at=now + CLAIM_TIMEOUT,
+        )
+    return tasks
+
+
+def process_batch(batch_size=None):
+    """
+    生成待ちのチラシ画像を1バッチ分処理し、全ての縮小版を生成する
+
+    処理前にチラシ画像が差し替えられて元の画像がなくなっている場合は、何もせずに完了にします。
+
+    Returns:
+        tuple: (処理したチラシ画像の件数, 失敗したチラシ画像の件数)
+    """
+    tasks = claim_batch(batch_size or settings.FLYER_DERIVATIVE_BATCH_SIZE)
+    done = failed = 0
+    for task in tasks:
+        task.attempts += 1
+        try:
+            if flyer_storage.exists(task.source):
+                for variant in settings.FLYER_DERIVATIVES:
+                    render_derivative(task.source, variant)
+        except Exception as e:
+            task.last_error = f'{type(e).__name__}: {e}'
+            if task.attempts >= settings.FLYER_DERIVATIVE_MAX_ATTEMPTS:
+                task.status = FlyerDerivativeTask.STATUS_FAILED
+            else:
+                task.status = FlyerDerivativeTask.STATUS_PENDING
+                task.next_attempt_at = timezone.now() + RETRY_DELAY * task.attempts
+            failed += 1
+        else:
+            task.status = FlyerDerivativeTask.STATUS_DONE
+            task.processed_at = timezone.now()
+            task.last_error = ''
+            done += 1
+
+    FlyerDerivativeTask.objects.bulk_update(
+        tasks, ['status', 'attempts', 'next_attempt_at', 'last_error', 'processed_at']
+    )
+    return done, failed
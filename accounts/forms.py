@@ -6,13 +6,72 @@
 ログインはメールアドレスで行うため、メールアドレス認証フォームを定義します。
 """
 
+from django.conf import settings
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth import authenticate
 from django.core.exceptions import ValidationError
-from .models import CustomUser
+from .models import CustomUser, FlyerUpload
+from .uploads import get_session_upload, open_upload
 from django import forms
 
-class GeneralUserCreationForm(UserCreationForm):
+class FlyerImageFormMixin:
+    """
+    チラシ画像を扱うフォームのミックスイン
+
+    チラシ画像はファイルとして直接送信するほか、分割アップロード（uploads モジュール）を
+    完了した ID を flyer_upload で指定することもできます。
+    縮小版はワーカーが生成するため、リクエスト中はファイルサイズと画素数の上限のみを確認します。
+    """
+
+    def __init__(self, *args, upload_session=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.upload_session = upload_session
+        self.flyer_upload = None
+        self.fields['flyer_upload'] = forms.UUIDField(required=False, widget=forms.HiddenInput)
+        if self.data.get('flyer_upload'):
+            self.fields['flyer_image'].required = False
+
+    def clean_flyer_image(self):
+        image = self.cleaned_data.get('flyer_image')
+        # 新しくアップロードされた画像のみを検証（ImageField の検証で image 属性が設定される）
+        if image and hasattr(image, 'image'):
+            if image.size > settings.FLYER_MAX_UPLOAD_SIZE:
+                raise ValidationError(
+                    f'ファイルサイズは{settings.FLYER_MAX_UPLOAD_SIZE // (1024 * 1024)}MB以下にしてください。'
+                )
+            width, height = image.image.size
+            if width * height > settings.FLYER_MAX_PIXELS:
+                raise ValidationError('画像の縦横のサイズが大きすぎます。')
+        return image
+
+    def clean(self):
+        cleaned_data = super().clean()
+        upload_id = cleaned_data.get('flyer_upload')
+        if upload_id:
+            try:
+                # 分割アップロードの完了時に形式・サイズ・画素数を検証済み
+                self.flyer_upload = get_session_upload(
+                    self.upload_session or {}, upload_id, completed_at__isnull=False
+                )
+            except FlyerUpload.DoesNotExist:
+                self.add_error('flyer_image', 'アップロードしたチラシ画像が見つかりません。もう一度選択してください。')
+            else:
+                cleaned_data['flyer_image'] = open_upload(self.flyer_upload)
+        return cleaned_data
+
+    def close_flyer_upload(self):
+        """clean で開いた分割アップロードのファイルを閉じる（保存しなかった場合も必ず呼び出す）"""
+        if self.flyer_upload is not None:
+            self.cleaned_data['flyer_image'].close()
+
+    def finish_flyer_upload(self):
+        """保存後に、使用した分割アップロードを一時ファイルとともに削除"""
+        if self.flyer_upload is not None:
+            self.close_flyer_upload()
+            self.flyer_upload.delete()
+            self.flyer_upload = None
+
+class GeneralUserCreationForm(FlyerImageFormMixin, UserCreationForm):
     """一般ユーザー作成用フォーム"""
     class Meta:
         model = CustomUser
@@ -48,7 +107,7 @@ class EmailAuthenticationForm(AuthenticationForm):
 
         return self.cleaned_data
 
-class UserUpdateForm(forms.ModelForm):
+class UserUpdateForm(FlyerImageFormMixin, forms.ModelForm):
     """ユーザー情報更新用フォーム"""
     class Meta:
         model = CustomUser
@@ -0,0 +1,58 @@
+"""
+どのユーザーからも参照されていないチラシ画像を削除するコマンド
+
+チラシのディレクトリ以下のファイルを順に調べ、CustomUser.flyer_image の索引を使って
+まとめて参照の有無を確認します。アップロード直後でまだユーザーに
+割り当てられていないファイルを消さないよう、更新日時から一定時間が経過したファイルのみを対象にします。
+削除したチラシ画像の縮小版も合わせて削除します。
+期限切れの分割アップロード（FlyerUpload）の一時ファイルもここで削除します。
+
+使い方:
+    python manage.py gc_flyers
+    python manage.py gc_flyers --min-age 3600 --dry-run
+"""
+
+from django.core.management.base import BaseCommand
+from accounts.models import CustomUser
+from accounts.storage import delete_flyer, flyer_storage
+from accounts.uploads import purge_expired
+
+
+class Command(BaseCommand):
+    help = '参照されていないチラシ画像のファイルを削除します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=int, default=24 * 60 * 60, help='対象にするファイルの更新日時からの経過秒数')
+        parser.add_argument('--batch-size', type=int, default=500, help='1回のクエリで参照を確認するファイル数')
+        parser.add_argument('--dry-run', action='store_true', help='削除せずに対象のファイルを表示する')
+
+    def handle(self, *args, **options):
+        deleted = 0
+        batch = []
+        for name in flyer_storage.iter_files(min_age=options['min_age']):
+            batch.append(name)
+            if len(batch) >= options['batch_size']:
+                deleted += self.collect(batch, options['dry_run'])
+                batch = []
+        if batch:
+            deleted += self.collect(batch, options['dry_run'])
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'{deleted}件のチラシ画像が削除対象です。'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{deleted}件のチラシ画像を削除しました。'))
+            expired = purge_expired()
+            self.stdout.write(self.style.SUCCESS(f'{expired}件の期限切れのアップロードを削除しました。'))
+
+    def collect(self, names, dry_run):
+        """names のうち参照されていないファイルを削除し、その件数を返す"""
+        referenced = set(
+            CustomUser.objects.filter(flyer_image__in=names).values_list('flyer_image', flat=True)
+        )
+        orphans = [name for name in names if name not in referenced]
+        for name in orphans:
+            if dry_run:
+                self.stdout.write(name)
+            else:
+                delete_flyer(name)
+        return len(orphans)
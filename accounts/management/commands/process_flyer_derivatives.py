@@ -0,0 +1,49 @@
+"""
+チラシ画像の縮小版を生成するワーカーコマンド
+
+常駐プロセスとして実行し、生成待ちのチラシ画像がなくなると一定時間待ってから再確認します。
+
+使い方:
+    python manage.py process_flyer_derivatives           # 常駐して処理を続ける
+    python manage.py process_flyer_derivatives --once    # 生成待ちがなくなったら終了
+"""
+
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from accounts.derivatives import process_batch
+
+
+class Command(BaseCommand):
+    help = 'チラシ画像の縮小版を生成します'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.FLYER_DERIVATIVE_BATCH_SIZE,
+            help='1回に取り出すチラシ画像の件数'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=settings.FLYER_DERIVATIVE_POLL_INTERVAL,
+            help='生成待ちのチラシ画像がない場合に待つ秒数'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='生成待ちのチラシ画像がなくなったら終了する'
+        )
+
+    def handle(self, *args, **options):
+        total_done = total_failed = 0
+        try:
+            while True:
+                done, failed = process_batch(options['batch_size'])
+                total_done += done
+                total_failed += failed
+                if done or failed:
+                    self.stdout.write(f'{done}件処理、{failed}件失敗')
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'合計 {total_done}件処理、{total_failed}件失敗しました。'))
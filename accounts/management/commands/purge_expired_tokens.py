@@ -0,0 +1,30 @@
+"""
+期限切れのアクティベーショントークンを削除するコマンド
+
+一度に削除する件数を抑え、バッチの間に待ち時間を入れられるため、
+認証処理のトークン検索を長時間妨げません。cron などで定期的に実行してください。
+
+使い方:
+    python manage.py purge_expired_tokens
+    python manage.py purge_expired_tokens --batch-size 500 --sleep 0.1
+"""
+
+import time
+from django.core.management.base import BaseCommand
+from accounts.models import UserActivateToken
+
+
+class Command(BaseCommand):
+    help = '期限切れのアクティベーショントークンを少しずつ削除します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='1回のDELETEで削除する件数')
+        parser.add_argument('--sleep', type=float, default=0, help='バッチの間に待つ秒数')
+
+    def handle(self, *args, **options):
+        total = 0
+        for deleted in UserActivateToken.purge_expired(batch_size=options['batch_size']):
+            total += deleted
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f'{total}件の期限切れトークンを削除しました。'))
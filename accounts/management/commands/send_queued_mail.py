@@ -0,0 +1,49 @@
+"""
+送信待ちメール（アウトボックス）を送信するワーカーコマンド
+
+常駐プロセスとして実行し、送信待ちのメールがなくなると一定時間待ってから再確認します。
+
+使い方:
+    python manage.py send_queued_mail              # 常駐して送信を続ける
+    python manage.py send_queued_mail --once       # 送信待ちがなくなったら終了
+"""
+
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from accounts.outbox import send_batch
+
+
+class Command(BaseCommand):
+    help = '送信待ちのメールをまとめて送信します'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.EMAIL_OUTBOX_BATCH_SIZE,
+            help='1つのSMTP接続で送信するメールの件数'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=settings.EMAIL_OUTBOX_POLL_INTERVAL,
+            help='送信待ちのメールがない場合に待つ秒数'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='送信待ちのメールがなくなったら終了する'
+        )
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        try:
+            while True:
+                sent, failed = send_batch(options['batch_size'])
+                total_sent += sent
+                total_failed += failed
+                if sent or failed:
+                    self.stdout.write(f'{sent}件送信、{failed}件失敗')
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'合計 {total_sent}件送信、{total_failed}件失敗しました。'))
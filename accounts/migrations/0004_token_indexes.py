@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:18
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_outgoingemail'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='useractivatetoken',
+            name='token',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='useractivatetoken',
+            index=models.Index(fields=['expired_at'], name='token_expired_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='useractivatetoken',
+            index=models.Index(fields=['user', 'expired_at'], name='token_user_expired_idx'),
+        ),
+    ]
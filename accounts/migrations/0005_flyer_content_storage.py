@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:21
+
+import accounts.models
+import accounts.storage
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_token_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='flyer_image',
+            field=models.ImageField(db_index=True, storage=accounts.storage.ContentAddressedStorage(), upload_to=accounts.models.get_image_path, validators=[django.core.validators.FileExtensionValidator(['jpg', 'jpeg', 'png', 'gif'])], verbose_name='チラシ画像'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:24
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_flyer_content_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlyerDerivativeTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=100, unique=True, verbose_name='チラシ画像')),
+                ('status', models.CharField(choices=[('pending', '処理待ち'), ('processing', '処理中'), ('done', '完了'), ('failed', '失敗')], default='pending', max_length=10, verbose_name='状態')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='処理回数')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='次回処理日時')),
+                ('last_error', models.TextField(blank=True, verbose_name='最後のエラー')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='登録日時')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='処理日時')),
+            ],
+            options={
+                'verbose_name': '縮小版の生成',
+                'verbose_name_plural': '縮小版の生成',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='flyertask_queue_idx')],
+            },
+        ),
+    ]
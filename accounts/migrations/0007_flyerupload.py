@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:31
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_flyerderivativetask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlyerUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(blank=True, max_length=255, verbose_name='元のファイル名')),
+                ('content_type', models.CharField(blank=True, max_length=50, verbose_name='画像の形式')),
+                ('length', models.PositiveIntegerField(verbose_name='ファイルサイズ')),
+                ('offset', models.PositiveIntegerField(default=0, verbose_name='受信済みのサイズ')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='開始日時')),
+                ('expires_at', models.DateTimeField(verbose_name='有効期限')),
+                ('completed_at', models.DateTimeField(blank=True, null=True, verbose_name='完了日時')),
+            ],
+            options={
+                'verbose_name': 'チラシ画像のアップロード',
+                'verbose_name_plural': 'チラシ画像のアップロード',
+                'indexes': [models.Index(fields=['expires_at'], name='flyerupload_expires_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,67 @@
+"""
+MEDIA_ROOT の設定前に保存されたチラシ画像を、コンテンツアドレス方式のパスに移動する
+
+旧形式のチラシ画像（settings.FLYER_LEGACY_ROOT 以下の flyers/<UUID>/<UUID>.<拡張子>）を
+ハッシュ値を計算し直して flyer_storage に保存し、ユーザーの flyer_image を書き換えます。
+新しいパスの縮小版は生成待ちに登録します。旧形式のファイルは、書き換えがコミットされた後に削除します。
+ファイルが見つからないチラシ画像はそのままにします。
+"""
+
+import os
+from django.conf import settings
+from django.core.files import File
+from django.db import migrations, transaction
+from accounts.storage import flyer_storage, is_hashed_name
+
+
+def legacy_path(name):
+    """旧形式のチラシ画像のファイルのパス（見つからない場合は None）"""
+    for root in (settings.FLYER_LEGACY_ROOT, settings.MEDIA_ROOT):
+        path = os.path.join(root, name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def move_legacy_flyers(apps, schema_editor):
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+    FlyerDerivativeTask = apps.get_model('accounts', 'FlyerDerivativeTask')
+
+    moved = {}
+    legacy_names = CustomUser.objects.exclude(flyer_image='').values_list('flyer_image', flat=True).distinct()
+    for name in legacy_names.iterator():
+        if is_hashed_name(name):
+            continue
+        path = legacy_path(name)
+        if path is None:
+            continue
+        with open(path, 'rb') as file:
+            moved[name] = (path, flyer_storage.save(name, File(file, name)))
+
+    for name, (_path, new_name) in moved.items():
+        CustomUser.objects.filter(flyer_image=name).update(flyer_image=new_name)
+    FlyerDerivativeTask.objects.filter(source__in=list(moved)).delete()
+    FlyerDerivativeTask.objects.bulk_create([
+        FlyerDerivativeTask(source=new_name) for new_name in {new_name for _path, new_name in moved.values()}
+    ], ignore_conflicts=True)
+
+    def remove_legacy_files():
+        for path, _new_name in moved.values():
+            try:
+                os.remove(path)
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass
+
+    transaction.on_commit(remove_legacy_files)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_flyerupload'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_legacy_flyers, migrations.RunPython.noop),
+    ]
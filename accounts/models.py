@@ -2,30 +2,42 @@
 カスタムユーザーモデルとアクティベーショントークン
 
 このモジュールでは、メールアドレス認証を使用したカスタムユーザーモデルと
-アクティベーショントークンモデルを定義します。
+アクティベーショントークンモデル、送信待ちメール（アウトボックス）のモデル、
+チラシ画像の縮小版の生成待ちモデル、分割アップロード中のチラシ画像のモデルを定義します。
 """
 
 import os
 import uuid
 from datetime import timedelta
+from django.conf import settings
 from django.contrib.auth.base_user import AbstractBaseUser, BaseUserManager
 from django.contrib.auth.models import PermissionsMixin
-from django.core.mail import send_mail
 from django.core.validators import FileExtensionValidator
 from django.db import models
+from django.urls import reverse
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from django.template.loader import render_to_string
+from .storage import FLYER_DIRECTORY, flyer_storage
 
 def get_image_path(instance, filename):
-    """チラシ画像のアップロードパスを生成"""
-    unique_id = uuid.uuid4()
+    """
+    チラシ画像のアップロードパスを生成
+
+    実際の保存先は flyer_storage がファイルの内容のハッシュ値から決めるため、
+    ここでは拡張子のみを引き継ぎます。
+    """
     extension = filename.split('.')[-1]
-    return os.path.join('flyers', str(unique_id), f"{uuid.uuid4()}.{extension}")
+    return os.path.join(FLYER_DIRECTORY, f"flyer.{extension}")
 
 class UserActivateToken(models.Model):
-    """ユーザーアクティベーショントークンモデル"""
-    token = models.UUIDField(default=uuid.uuid4, editable=False)
+    """ユーザーアクティベーショントークンモデル
+
+    extra_data が空のトークンは新規登録の認証用、
+    extra_data に新しいメールアドレスを持つトークンはメールアドレス変更の確認用です。
+    """
+    EXPIRE_HOURS = 24
+
+    token = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     user = models.ForeignKey('CustomUser', on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     expired_at = models.DateTimeField()
@@ -34,15 +46,49 @@ class UserActivateToken(models.Model):
     class Meta:
         verbose_name = _('アクティベーショントークン')
         verbose_name_plural = _('アクティベーショントークン')
+        indexes = [
+            # 期限切れトークンの一括削除用
+            models.Index(fields=['expired_at'], name='token_expired_idx'),
+            # ユーザーごとの有効なトークンの検索・失効用
+            models.Index(fields=['user', 'expired_at'], name='token_user_expired_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.email}のトークン"
 
     @classmethod
-    def create_token(cls, user):
-        """トークンを生成"""
-        expired_at = timezone.now() + timedelta(hours=24)
-        return cls.objects.create(user=user, expired_at=expired_at)
+    def create_token(cls, user, extra_data=None):
+        """
+        トークンを生成
+
+        同じユーザーの同じ種類（新規登録の認証用、メールアドレス変更用）の
+        古いトークンは削除し、最後に発行したトークンのみを有効にします。
+        """
+        cls.objects.filter(user=user, extra_data__isnull=extra_data is None).delete()
+        expired_at = timezone.now() + timedelta(hours=cls.EXPIRE_HOURS)
+        return cls.objects.create(user=user, expired_at=expired_at, extra_data=extra_data)
+
+    @classmethod
+    def purge_expired(cls, batch_size=1000, now=None):
+        """
+        期限切れのトークンを batch_size 件ずつ削除する
+
+        1回のDELETEで削除する行数を抑え、ロックを長時間保持しないようにします。
+
+        Yields:
+            int: バッチごとに削除した件数
+        """
+        now = now or timezone.now()
+        while True:
+            ids = list(
+                cls.objects.filter(expired_at__lt=now).order_by('expired_at').values_list(
+                    'id', flat=True
+                )[:batch_size]
+            )
+            if not ids:
+                return
+            deleted, _rows = cls.objects.filter(pk__in=ids).delete()
+            yield deleted
 
 class CustomUserManager(BaseUserManager):
     """カスタムユーザーマネージャー"""
@@ -96,6 +142,9 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     flyer_image = models.ImageField(
         _('チラシ画像'),
         upload_to=get_image_path,
+        storage=flyer_storage,
+        # 同じ画像を参照するユーザーの数え上げ（不要なファイルの削除）に使用
+        db_index=True,
         validators=[FileExtensionValidator(['jpg', 'jpeg', 'png', 'gif'])],
     )
 
@@ -114,30 +163,181 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
         verbose_name = _('ユーザー')
         verbose_name_plural = _('ユーザー')
 
+    def flyer_derivative_url(self, variant):
+        """チラシ画像の縮小版のURL（縮小版がない場合は表示時に生成される）"""
+        if not self.flyer_image:
+            return ''
+        return reverse('accounts:flyer-derivative', kwargs={
+            'variant': variant, 'name': self.flyer_image.name,
+        })
+
+    @property
+    def flyer_thumbnail_url(self):
+        return self.flyer_derivative_url('thumb')
+
     def send_verification_email(self, verification_url, to_email=None):
         """
-        認証メールを送信する
+        認証メールを送信キューに登録する
+
+        実際の送信は send_queued_mail コマンドのワーカーが行います。
 
         Args:
             verification_url (str): 認証用URL
             to_email (str, optional): 送信先メールアドレス。指定がない場合は、ユーザーのメールアドレスを使用。
         """
-        context = {
-            'user': self,
-            'verification_url': verification_url,
-            'expire_hours': 1,  # トークンの有効期限（時間）
-        }
+        return OutgoingEmail.enqueue(
+            subject='メールアドレスの確認',
+            to_email=to_email or self.email,
+            template_name='registration/email/verification',
+            context={
+                'user': {'full_name': self.full_name},
+                'verification_url': verification_url,
+                'expire_hours': UserActivateToken.EXPIRE_HOURS,  # トークンの有効期限（時間）
+            },
+        )
 
-        subject = 'メールアドレスの確認'
-        to_email = to_email or self.email
+class OutgoingEmail(models.Model):
+    """送信待ちメール（アウトボックス）モデル
 
-        text_message = render_to_string('registration/email/verification.txt', context)
-        html_message = render_to_string('registration/email/verification.html', context)
+    リクエスト中はメールを送信せずにこのテーブルへ登録し、
+    send_queued_mail コマンドのワーカーがテンプレートを描画して送信します。
+    送信に失敗した場合は間隔を空けて再送し、結果を status に記録します。
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, _('送信待ち')),
+        (STATUS_SENDING, _('送信中')),
+        (STATUS_SENT, _('送信済み')),
+        (STATUS_FAILED, _('送信失敗')),
+    )
 
-        send_mail(
+    subject = models.CharField(_('件名'), max_length=255)
+    to_email = models.EmailField(_('送信先'))
+    template_name = models.CharField(
+        _('テンプレート'),
+        max_length=255,
+        help_text=_('拡張子を除いたテンプレート名（.txt と .html を使用）')
+    )
+    context = models.JSONField(_('テンプレートの変数'), default=dict, blank=True)
+    status = models.CharField(_('状態'), max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(_('送信試行回数'), default=0)
+    next_attempt_at = models.DateTimeField(_('次回送信日時'), default=timezone.now)
+    last_error = models.TextField(_('最後のエラー'), blank=True)
+    created_at = models.DateTimeField(_('登録日時'), auto_now_add=True)
+    sent_at = models.DateTimeField(_('送信日時'), blank=True, null=True)
+
+    class Meta:
+        verbose_name = _('送信メール')
+        verbose_name_plural = _('送信メール')
+        ordering = ['-created_at']
+        indexes = [
+            # ワーカーが送信対象を取り出すための索引
+            models.Index(fields=['status', 'next_attempt_at'], name='outgoingemail_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.to_email} - {self.subject}"
+
+    @classmethod
+    def enqueue(cls, subject, to_email, template_name, context=None):
+        """メールを送信キューに登録"""
+        return cls.objects.create(
             subject=subject,
-            message=text_message,
-            from_email=None,  # settings.DEFAULT_FROM_EMAILが使用される
-            recipient_list=[to_email],
-            html_message=html_message
+            to_email=to_email,
+            template_name=template_name,
+            context=context or {},
         )
+
+class FlyerDerivativeTask(models.Model):
+    """チラシ画像の縮小版の生成待ちモデル
+
+    チラシ画像が登録・変更されるとこのテーブルへ登録し、
+    process_flyer_derivatives コマンドのワーカーが縮小版を生成します。
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, _('処理待ち')),
+        (STATUS_PROCESSING, _('処理中')),
+        (STATUS_DONE, _('完了')),
+        (STATUS_FAILED, _('失敗')),
+    )
+
+    source = models.CharField(_('チラシ画像'), max_length=100, unique=True)
+    status = models.CharField(_('状態'), max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(_('処理回数'), default=0)
+    next_attempt_at = models.DateTimeField(_('次回処理日時'), default=timezone.now)
+    last_error = models.TextField(_('最後のエラー'), blank=True)
+    created_at = models.DateTimeField(_('登録日時'), auto_now_add=True)
+    processed_at = models.DateTimeField(_('処理日時'), blank=True, null=True)
+
+    class Meta:
+        verbose_name = _('縮小版の生成')
+        verbose_name_plural = _('縮小版の生成')
+        ordering = ['-created_at']
+        indexes = [
+            # ワーカーが処理対象を取り出すための索引
+            models.Index(fields=['status', 'next_attempt_at'], name='flyertask_queue_idx'),
+        ]
+
+    def __str__(self):
+        return self.source
+
+    @classmethod
+    def enqueue(cls, source):
+        """チラシ画像を縮小版の生成待ちに登録（登録済みの場合は処理待ちに戻す）"""
+        task, _created = cls.objects.update_or_create(
+            source=source,
+            defaults={
+                'status': cls.STATUS_PENDING,
+                'attempts': 0,
+                'next_attempt_at': timezone.now(),
+                'last_error': '',
+            },
+        )
+        return task
+
+class FlyerUpload(models.Model):
+    """分割アップロード中のチラシ画像モデル
+
+    tus プロトコルに沿ってチラシ画像を少しずつ受け取り、一時ディレクトリ
+    （settings.FLYER_UPLOAD_DIR）のファイルに追記します。
+    アップロードが完了すると、新規登録・ユーザー情報更新のフォームから ID で参照できます。
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(_('元のファイル名'), max_length=255, blank=True)
+    content_type = models.CharField(_('画像の形式'), max_length=50, blank=True)
+    length = models.PositiveIntegerField(_('ファイルサイズ'))
+    offset = models.PositiveIntegerField(_('受信済みのサイズ'), default=0)
+    created_at = models.DateTimeField(_('開始日時'), auto_now_add=True)
+    expires_at = models.DateTimeField(_('有効期限'))
+    completed_at = models.DateTimeField(_('完了日時'), blank=True, null=True)
+
+    class Meta:
+        verbose_name = _('チラシ画像のアップロード')
+        verbose_name_plural = _('チラシ画像のアップロード')
+        indexes = [
+            # 期限切れのアップロードの削除用
+            models.Index(fields=['expires_at'], name='flyerupload_expires_idx'),
+        ]
+
+    def __str__(self):
+        return str(self.pk)
+
+    @property
+    def path(self):
+        """受信したデータを書き込む一時ファイルのパス"""
+        return os.path.join(settings.FLYER_UPLOAD_DIR, str(self.pk))
+
+    def delete(self, *args, **kwargs):
+        """一時ファイルとともに削除"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        return super().delete(*args, **kwargs)
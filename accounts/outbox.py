@@ -0,0 +1,121 @@
+"""
+送信待ちメール（アウトボックス）の送信処理
+
+send_queued_mail コマンドから呼び出され、送信待ちのメールを一定件数ずつ取り出して
+1つのSMTP接続でまとめて送信します。
+取り出したメールは「送信中」にして一定時間だけ確保するため、
+複数のワーカーを動かしても同じメールを同時に送ることはありません。
+送信に失敗したメールは指数的に間隔を空けて再送し、上限に達すると「送信失敗」にします。
+"""
+
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+from .models import OutgoingEmail
+
+# 取り出したメールを他のワーカーに渡さずに確保しておく時間
+CLAIM_TIMEOUT = timedelta(minutes=5)
+# 再送間隔の上限
+MAX_RETRY_DELAY = timedelta(hours=6)
+
+
+def claim_batch(batch_size):
+    """
+    送信対象のメールを取り出して「送信中」にする
+
+    送信待ちのメールに加え、確保したまま時間が経過した送信中のメール
+    （ワーカーが途中で停止した場合）も対象にします。
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True).filter(
+                Q(status=OutgoingEmail.STATUS_PENDING) | Q(status=OutgoingEmail.STATUS_SENDING),
+                next_attempt_at__lte=now,
+            ).order_by('next_attempt_at')[:batch_size]
+        )
+        OutgoingEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+            status=OutgoingEmail.STATUS_SENDING,
+            next_attempt_at=now + CLAIM_TIMEOUT,
+        )
+    return emails
+
+
+def build_message(email, connection):
+    """テンプレートを描画してメールを組み立てる"""
+    message = EmailMultiAlternatives(
+        subject=email.subject,
+        body=render_to_string(f'{email.template_name}.txt', email.context),
+        from_email=None,  # settings.DEFAULT_FROM_EMAILが使用される
+        to=[email.to_email],
+        connection=connection,
+    )
+    message.attach_alternative(
+        render_to_string(f'{email.template_name}.html', email.context), 'text/html'
+    )
+    return message
+
+
+def retry_delay(attempts):
+    """送信に失敗した回数に応じた再送までの間隔"""
+    delay = timedelta(seconds=settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1))
+    return min(delay, MAX_RETRY_DELAY)
+
+
+def mark_failed(email, error, now):
+    """送信の失敗を記録し、上限に達していなければ再送を予約"""
+    email.attempts += 1
+    email.last_error = f'{type(error).__name__}: {error}'
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = OutgoingEmail.STATUS_FAILED
+    else:
+        email.status = OutgoingEmail.STATUS_PENDING
+        email.next_attempt_at = now + retry_delay(email.attempts)
+
+
+def send_batch(batch_size=None):
+    """
+    送信待ちのメールを1バッチ分送信する
+
+    Returns:
+        tuple: (送信したメールの件数, 失敗したメールの件数)
+    """
+    emails = claim_batch(batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE)
+    if not emails:
+        return 0, 0
+
+    sent = failed = 0
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        # 接続できない場合はバッチ全体を再送対象にする
+        now = timezone.now()
+        for email in emails:
+            mark_failed(email, e, now)
+        failed = len(emails)
+    else:
+        try:
+            for email in emails:
+                try:
+                    build_message(email, connection).send()
+                except Exception as e:
+                    mark_failed(email, e, timezone.now())
+                    failed += 1
+                else:
+                    email.status = OutgoingEmail.STATUS_SENT
+                    email.attempts += 1
+                    email.sent_at = timezone.now()
+                    email.last_error = ''
+                    sent += 1
+        finally:
+            connection.close()
+
+    OutgoingEmail.objects.bulk_update(
+        emails, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+    )
+    return sent, failed
@@ -0,0 +1,51 @@
+"""
+アカウントのシグナル
+
+チラシ画像の登録・変更時に縮小版の生成待ちに登録し、
+チラシ画像の変更・ユーザーの削除に合わせて、
+どのユーザーからも参照されなくなったチラシ画像のファイルを削除します。
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .models import CustomUser, FlyerDerivativeTask
+from .storage import delete_if_unreferenced
+
+
+@receiver(pre_save, sender=CustomUser)
+def remember_previous_flyer(sender, instance, update_fields=None, **kwargs):
+    """保存前のチラシ画像のパスを記録"""
+    if instance.pk is None:
+        instance._previous_flyer_image = None
+        return
+    if update_fields is not None and 'flyer_image' not in update_fields:
+        instance._previous_flyer_image = instance.flyer_image.name
+        return
+    instance._previous_flyer_image = sender.objects.filter(pk=instance.pk).values_list(
+        'flyer_image', flat=True
+    ).first()
+
+
+@receiver(post_save, sender=CustomUser)
+def flyer_changed(sender, instance, **kwargs):
+    """
+    チラシ画像が登録・差し替えられた場合、縮小版の生成待ちに登録し、
+    コミット後に古いファイルを削除
+    """
+    previous = getattr(instance, '_previous_flyer_image', None)
+    name = instance.flyer_image.name
+    if previous == name:
+        return
+    if name:
+        FlyerDerivativeTask.enqueue(name)
+    if previous:
+        transaction.on_commit(lambda: delete_if_unreferenced(previous))
+
+
+@receiver(post_delete, sender=CustomUser)
+def collect_deleted_user_flyer(sender, instance, **kwargs):
+    """削除したユーザーのチラシ画像を、コミット後に参照がなければ削除"""
+    name = instance.flyer_image.name
+    if name:
+        transaction.on_commit(lambda: delete_if_unreferenced(name))
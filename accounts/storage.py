@@ -0,0 +1,182 @@
+"""
+チラシ画像のコンテンツアドレス方式のストレージ
+
+アップロードされたファイルを少しずつ一時ファイルに書き出しながら SHA-256 を計算し、
+ハッシュ値から決まるパス（flyers/ab/cd/<ハッシュ値>.<拡張子>）に保存します。
+同じ内容の画像は同じパスになるため、2回目以降は保存せずに既存のファイルを共有します。
+ディレクトリはハッシュ値の先頭4文字で2階層に分けるため、1つのディレクトリの
+ファイル数が増えすぎることもありません。
+
+ファイルの参照数は CustomUser.flyer_image（索引付き）の件数で数え、
+どのユーザーからも参照されなくなったファイルを削除します。
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+import time
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+FLYER_DIRECTORY = 'flyers'
+# 更新日時からこの秒数が経過するまでは、参照がなくてもファイルを削除しない
+# （同じ内容の画像のアップロードが既存のファイルを共有した直後に削除しないため）
+DELETE_GRACE_PERIOD = 60 * 60
+# 同じ形式の拡張子の表記ゆれを揃える（同じ内容の画像を1つのファイルにまとめるため）
+EXTENSION_ALIASES = {'jpg': 'jpeg'}
+HASHED_NAME = re.compile(r'^flyers/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$')
+
+
+def hashed_name(digest, extension):
+    """ハッシュ値から保存先のパスを生成"""
+    return '/'.join([FLYER_DIRECTORY, digest[:2], digest[2:4], f'{digest}.{extension}'])
+
+
+def is_hashed_name(name):
+    """コンテンツアドレス方式のパス（flyers/ab/cd/<ハッシュ値>.<拡張子>）かどうか"""
+    return bool(HASHED_NAME.match(name))
+
+
+def normalize_extension(name):
+    """ファイル名から小文字に揃えた拡張子を取り出す"""
+    extension = os.path.splitext(name)[1].lstrip('.').lower()
+    return EXTENSION_ALIASES.get(extension, extension)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """ファイルの内容のハッシュ値をファイル名にするストレージ"""
+
+    def save(self, name, content, max_length=None):
+        """
+        ファイルを内容のハッシュ値のパスに保存し、保存先のパスを返す
+
+        同じ内容のファイルが既にある場合は書き込まず、既存のファイルのパスを返します。
+        """
+        if content is None:
+            raise ValueError('保存するファイルの内容がありません。')
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        temp_dir = self.path(os.path.join(FLYER_DIRECTORY, 'tmp'))
+        os.makedirs(temp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        # 同じファイルシステム上の一時ファイルに書き出し、最後に名前を変えて配置する
+        with tempfile.NamedTemporaryFile(dir=temp_dir, delete=False) as temp_file:
+            try:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+            except BaseException:
+                temp_file.close()
+                os.remove(temp_file.name)
+                raise
+
+        name = hashed_name(digest.hexdigest(), normalize_extension(name))
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            os.remove(temp_file.name)
+            # 削除の猶予期間の判定に使うため、更新日時を新しくする
+            os.utime(full_path)
+        else:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_file.name, self.file_permissions_mode)
+            os.replace(temp_file.name, full_path)
+        return name
+
+    def iter_files(self, min_age=0):
+        """
+        チラシのディレクトリ以下のファイルのパスを順に返す
+
+        アップロードが中断されて残った一時ファイルも含みます。
+
+        Args:
+            min_age (int): 更新日時からこの秒数以上経過したファイルのみを対象にする
+        """
+        threshold = time.time() - min_age
+        for directory, _dirnames, filenames in os.walk(self.path(FLYER_DIRECTORY)):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                if os.path.getmtime(path) > threshold:
+                    continue
+                yield os.path.relpath(path, self.location).replace(os.sep, '/')
+
+
+flyer_storage = ContentAddressedStorage()
+
+
+@deconstructible
+class OverwriteStorage(FileSystemStorage):
+    """
+    同じパスへの保存で既存のファイルを置き換えるストレージ（チラシ画像の縮小版用）
+
+    一時ファイルに書き出してから名前を変えて置き換えるため、同じパスに並行して保存しても
+    別名（_abc1234 などの接尾辞付き）のファイルが増えず、読み込み中のファイルが
+    書きかけの状態で見えることもありません。
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=directory, prefix='.tmp', delete=False) as temp_file:
+            try:
+                for chunk in content.chunks():
+                    temp_file.write(chunk)
+            except BaseException:
+                temp_file.close()
+                os.remove(temp_file.name)
+                raise
+        if self.file_permissions_mode is not None:
+            os.chmod(temp_file.name, self.file_permissions_mode)
+        os.replace(temp_file.name, full_path)
+        return name
+
+
+derivative_storage = OverwriteStorage()
+
+
+def is_referenced(name):
+    """いずれかのユーザーがチラシ画像として参照しているかどうか"""
+    from .models import CustomUser
+    return CustomUser.objects.filter(flyer_image=name).exists()
+
+
+def delete_flyer(name):
+    """チラシ画像を縮小版・生成待ちの登録とともに削除する"""
+    from .derivatives import delete_derivatives
+    from .models import FlyerDerivativeTask
+    flyer_storage.delete(name)
+    delete_derivatives(name)
+    FlyerDerivativeTask.objects.filter(source=name).delete()
+
+
+def is_recently_used(name, grace_period=DELETE_GRACE_PERIOD):
+    """更新日時（同じ内容の画像が保存されるたびに更新）から猶予期間内かどうか"""
+    try:
+        return flyer_storage.get_modified_time(name).timestamp() > time.time() - grace_period
+    except FileNotFoundError:
+        return False
+
+
+def delete_if_unreferenced(name):
+    """
+    どのユーザーからも参照されていないチラシ画像を削除する
+
+    猶予期間内のファイルは、参照するユーザーの保存がまだコミットされていない
+    可能性があるため削除せず、gc_flyers コマンドに任せます。
+    """
+    if name and not is_recently_used(name) and not is_referenced(name):
+        delete_flyer(name)
+        return True
+    return False
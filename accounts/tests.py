@@ -1,3 +1,632 @@
-from django.test import TestCase
+import base64
+import csv
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import timedelta
+from importlib import import_module
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from .archive import stream_flyer_archive
+from .derivatives import derivative_name, ensure_derivative
+from .forms import UserUpdateForm
+from .models import FlyerDerivativeTask, FlyerUpload, OutgoingEmail, UserActivateToken
+from .outbox import send_batch
+from .storage import derivative_storage, flyer_storage, is_hashed_name
+from .uploads import MAX_SESSION_UPLOADS, UploadError, append_chunk, open_upload
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    """常に送信に失敗するメールバックエンド"""
+
+    def send_messages(self, email_messages):
+        raise ConnectionError('SMTPサーバーに接続できません')
+
+
+def create_image_file(name='flyer.png', color='red', size=(40, 30)):
+    """テスト用の画像ファイルを作成"""
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+def age_flyer(name, seconds=2 * 60 * 60):
+    """チラシ画像の更新日時を過去にずらす（削除の猶予期間を過ぎた状態にする）"""
+    path = flyer_storage.path(name)
+    mtime = os.path.getmtime(path) - seconds
+    os.utime(path, (mtime, mtime))
+
+
+class MediaRootMixin:
+    """テストごとに一時的なMEDIA_ROOTを使う"""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OutboxTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='pass', full_name='出展者'
+        )
+
+    def test_signup_only_enqueues_mail(self):
+        response = self.client.post(reverse('accounts:signup'), {
+            'email': 'new@example.com',
+            'password1': 'pass1234',
+            'password2': 'pass1234',
+            'full_name': '新規 出展者',
+            'phone': '000-0000-0000',
+            'postal_code': '100-0001',
+            'address': '東京都',
+            'flyer_image': create_image_file(),
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+        queued = OutgoingEmail.objects.get(to_email='new@example.com')
+        self.assertEqual(queued.status, OutgoingEmail.STATUS_PENDING)
+        self.assertEqual(queued.context['user']['full_name'], '新規 出展者')
+
+    def test_worker_sends_batch_over_one_connection(self):
+        for i in range(3):
+            self.user.send_verification_email(f'https://example.com/verify/{i}/')
+
+        call_command('send_queued_mail', '--once', stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIn('出展者', mail.outbox[0].body)
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        self.assertEqual(
+            OutgoingEmail.objects.filter(status=OutgoingEmail.STATUS_SENT).count(), 3
+        )
+
+    @override_settings(
+        EMAIL_BACKEND='accounts.tests.FailingEmailBackend',
+        EMAIL_OUTBOX_MAX_ATTEMPTS=2,
+        EMAIL_OUTBOX_RETRY_DELAY=60,
+    )
+    def test_failed_mail_is_retried_with_backoff(self):
+        queued = self.user.send_verification_email('https://example.com/verify/')
+
+        self.assertEqual(send_batch(), (0, 1))
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, OutgoingEmail.STATUS_PENDING)
+        self.assertEqual(queued.attempts, 1)
+        self.assertIn('SMTPサーバーに接続できません', queued.last_error)
+        self.assertGreater(queued.next_attempt_at, timezone.now() + timedelta(seconds=50))
+
+        # 再送時刻になるまでは取り出されない
+        self.assertEqual(send_batch(), (0, 0))
+
+        OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+        send_batch()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, OutgoingEmail.STATUS_FAILED)
+        self.assertEqual(queued.attempts, 2)
+
+    def test_email_change_notification_is_queued(self):
+        self.user.is_active = True
+        self.user.save()
+        self.client.force_login(self.user)
+        token = UserActivateToken.create_token(self.user)
+        token.extra_data = 'changed@example.com'
+        token.save()
+
+        self.client.get(reverse('accounts:verify-email-change', kwargs={'token': token.token}))
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertTrue(OutgoingEmail.objects.filter(
+            to_email='user@example.com',
+            template_name='registration/email/email_change_notification',
+        ).exists())
+
+    def test_email_change_request_is_rolled_back_on_error(self):
+        self.user.is_active = True
+        self.user.save()
+        self.client.force_login(self.user)
+
+        with mock.patch.object(OutgoingEmail, 'enqueue', side_effect=DatabaseError):
+            response = self.client.post(reverse('accounts:email-change'), {
+                'current_password': 'pass', 'new_email': 'changed@example.com',
+            })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(UserActivateToken.objects.filter(user=self.user).exists())
+
+    def test_email_change_is_rolled_back_on_error(self):
+        self.user.is_active = True
+        self.user.save()
+        self.client.force_login(self.user)
+        token = UserActivateToken.create_token(self.user, extra_data='changed@example.com')
+
+        with mock.patch.object(OutgoingEmail, 'enqueue', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.client.get(reverse('accounts:verify-email-change', kwargs={'token': token.token}))
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.email, 'user@example.com')
+        self.assertTrue(UserActivateToken.objects.filter(pk=token.pk).exists())
+
+
+class ActivateTokenTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='pass', full_name='出展者'
+        )
+
+    def test_create_token_revokes_older_tokens_of_same_kind(self):
+        first = UserActivateToken.create_token(self.user)
+        change = UserActivateToken.create_token(self.user, extra_data='new@example.com')
+        second = UserActivateToken.create_token(self.user)
+
+        self.assertEqual(
+            set(UserActivateToken.objects.values_list('pk', flat=True)), {change.pk, second.pk}
+        )
+        self.assertNotEqual(first.token, second.token)
+
+    def test_verify_email_with_latest_token(self):
+        UserActivateToken.create_token(self.user)
+        token = UserActivateToken.create_token(self.user)
+
+        response = self.client.get(reverse('accounts:verify-email', kwargs={'token': token.token}))
+
+        self.assertTrue(response.context['success'])
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_active)
+
+    def test_purge_expired_tokens_in_batches(self):
+        now = timezone.now()
+        users = [
+            get_user_model().objects.create_user(email=f'user{i}@example.com', password='pass')
+            for i in range(5)
+        ]
+        for user in users:
+            UserActivateToken.objects.create(user=user, expired_at=now - timedelta(hours=1))
+        valid = UserActivateToken.create_token(self.user)
+
+        self.assertEqual(list(UserActivateToken.purge_expired(batch_size=2)), [2, 2, 1])
+        self.assertEqual(list(UserActivateToken.objects.values_list('pk', flat=True)), [valid.pk])
+
+        out = StringIO()
+        call_command('purge_expired_tokens', stdout=out)
+        self.assertIn('0件', out.getvalue())
+
+
+class FlyerStorageTests(MediaRootMixin, TestCase):
+    def create_user(self, email, flyer):
+        user = get_user_model()(email=email, full_name='出展者')
+        user.flyer_image = flyer
+        user.save()
+        return user
+
+    def test_identical_images_share_one_sharded_file(self):
+        first = self.create_user('a@example.com', create_image_file('a.JPG'))
+        second = self.create_user('b@example.com', create_image_file('b.jpeg'))
+
+        name = first.flyer_image.name
+        self.assertEqual(second.flyer_image.name, name)
+        self.assertRegex(name, r'^flyers/([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}\.jpeg$')
+        files = [
+            os.path.join(directory, filename)
+            for directory, _dirnames, filenames in os.walk(os.path.join(self.media_root, 'flyers'))
+            for filename in filenames
+        ]
+        self.assertEqual(files, [os.path.join(self.media_root, name)])
+
+    def test_legacy_flyers_are_moved_to_hashed_paths(self):
+        legacy_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, legacy_root, ignore_errors=True)
+        legacy_name = 'flyers/0b7c/legacy.jpeg'
+        os.makedirs(os.path.join(legacy_root, 'flyers/0b7c'))
+        with open(os.path.join(legacy_root, legacy_name), 'wb') as file:
+            file.write(create_image_file().read())
+        user = get_user_model().objects.create_user(email='a@example.com', password='pass')
+        get_user_model().objects.filter(pk=user.pk).update(flyer_image=legacy_name)
+
+        migration = import_module('accounts.migrations.0008_move_legacy_flyers')
+        with override_settings(FLYER_LEGACY_ROOT=legacy_root), self.captureOnCommitCallbacks(execute=True):
+            migration.move_legacy_flyers(apps, None)
+
+        user.refresh_from_db()
+        self.assertTrue(is_hashed_name(user.flyer_image.name))
+        self.assertTrue(flyer_storage.exists(user.flyer_image.name))
+        self.assertTrue(FlyerDerivativeTask.objects.filter(source=user.flyer_image.name).exists())
+        self.assertFalse(os.path.exists(os.path.join(legacy_root, legacy_name)))
+
+    def test_replaced_flyer_is_deleted_when_unreferenced(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.create_user('a@example.com', create_image_file())
+            second = self.create_user('b@example.com', create_image_file())
+        shared = first.flyer_image.name
+        age_flyer(shared)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.flyer_image = create_image_file(color='blue')
+            first.save()
+        self.assertTrue(flyer_storage.exists(shared))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(flyer_storage.exists(shared))
+        self.assertTrue(flyer_storage.exists(first.flyer_image.name))
+
+    def test_recently_shared_flyer_is_kept_for_grace_period(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.create_user('a@example.com', create_image_file())
+        shared = first.flyer_image.name
+        age_flyer(shared)
+        # 別のユーザーが同じ内容の画像を保存（コミット前）すると、更新日時が新しくなる
+        self.assertEqual(flyer_storage.save('flyer.png', create_image_file()), shared)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.flyer_image = create_image_file(color='blue')
+            first.save()
+
+        self.assertTrue(flyer_storage.exists(shared))
+
+    def test_gc_command_removes_orphans(self):
+        user = self.create_user('a@example.com', create_image_file())
+        orphan = flyer_storage.save('flyer.png', create_image_file(color='green'))
+
+        out = StringIO()
+        call_command('gc_flyers', '--min-age', '0', '--batch-size', '1', stdout=out)
+
+        self.assertIn('1件', out.getvalue())
+        self.assertFalse(flyer_storage.exists(orphan))
+        self.assertTrue(flyer_storage.exists(user.flyer_image.name))
+
+
+class FlyerDerivativeTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        buffer = BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6  # 90度回転して表示する向き
+        exif[0x010F] = 'Camera'
+        Image.new('RGB', (2000, 1000), 'red').save(buffer, format='JPEG', exif=exif)
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='pass', full_name='出展者',
+            flyer_image=SimpleUploadedFile('flyer.jpg', buffer.getvalue()),
+        )
+        self.source = self.user.flyer_image.name
+
+    def test_worker_generates_capped_derivatives_without_exif(self):
+        self.assertEqual(
+            FlyerDerivativeTask.objects.get(source=self.source).status,
+            FlyerDerivativeTask.STATUS_PENDING,
+        )
+
+        call_command('process_flyer_derivatives', '--once', stdout=StringIO())
+
+        self.assertEqual(
+            FlyerDerivativeTask.objects.get(source=self.source).status,
+            FlyerDerivativeTask.STATUS_DONE,
+        )
+        with default_storage.open(derivative_name(self.source, 'thumb')) as file, Image.open(file) as image:
+            self.assertEqual(image.format, 'WEBP')
+            # 向きを補正してから最大サイズに収める
+            self.assertEqual(image.size, (160, 320))
+            self.assertFalse(image.getexif())
+        with default_storage.open(derivative_name(self.source, 'web')) as file, Image.open(file) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (800, 1600))
+            self.assertFalse(image.getexif())
+
+    def test_view_regenerates_missing_derivative(self):
+        response = self.client.get(self.user.flyer_thumbnail_url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertTrue(default_storage.exists(derivative_name(self.source, 'thumb')))
+
+        missing = reverse('accounts:flyer-derivative', kwargs={'variant': 'thumb', 'name': 'flyers/other.png'})
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+    def test_concurrent_generation_overwrites_same_name(self):
+        name = derivative_name(self.source, 'thumb')
+        # 2つのリクエストが同時に縮小版がないと判定した場合を再現する
+        with mock.patch.object(derivative_storage, 'exists', return_value=False):
+            first = ensure_derivative(self.source, 'thumb')
+            second = ensure_derivative(self.source, 'thumb')
+
+        self.assertEqual((first, second), (name, name))
+        self.assertEqual(os.listdir(os.path.dirname(derivative_storage.path(name))), [os.path.basename(name)])
+        with derivative_storage.open(name) as file, Image.open(file) as image:
+            self.assertEqual(image.size, (160, 320))
+
+    def test_replaced_flyer_removes_derivatives(self):
+        ensure_derivative(self.source, 'thumb')
+        age_flyer(self.source)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.flyer_image = create_image_file()
+            self.user.save()
+
+        self.assertFalse(default_storage.exists(derivative_name(self.source, 'thumb')))
+        self.assertFalse(FlyerDerivativeTask.objects.filter(source=self.source).exists())
+        self.assertTrue(FlyerDerivativeTask.objects.filter(source=self.user.flyer_image.name).exists())
+
+    @override_settings(FLYER_MAX_UPLOAD_SIZE=100)
+    def test_update_form_rejects_large_image(self):
+        form = UserUpdateForm(
+            data={
+                'full_name': '出展者', 'phone': '000', 'postal_code': '100-0001', 'address': '東京都',
+            },
+            files={'flyer_image': create_image_file(size=(400, 400))},
+            instance=self.user,
+        )
+
+        self.assertFalse(form.is_valid())
+        self.assertIn('flyer_image', form.errors)
+
+
+class FlyerArchiveTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = get_user_model().objects.create_superuser(email='admin@example.com', password='pass')
+        self.users = [
+            get_user_model().objects.create_user(
+                email=f'user{i}@example.com', password='pass', full_name='出展者',
+                organization_name=f'団体{i}', booth_name=f'ブース{i}', booth_summary='概要,改行\nあり',
+                flyer_image=create_image_file(color=color),
+            )
+            for i, color in enumerate(['red', 'blue'])
+        ]
+        self.client.force_login(self.admin)
+
+    def test_download_flyers_action_streams_zip(self):
+        response = self.client.post(reverse('admin:accounts_customuser_changelist'), {
+            'action': 'download_flyers',
+            '_selected_action': [user.pk for user in self.users],
+        })
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertEqual(archive.namelist(), [
+                'manifest.csv', f'flyers/{self.users[0].pk}.png', f'flyers/{self.users[1].pk}.png',
+            ])
+            rows = list(csv.reader(StringIO(archive.read('manifest.csv').decode('utf-8-sig'))))
+            self.assertEqual(rows[0], ['ID', '団体名', 'ブース名', 'ブースの概要', 'チラシ画像'])
+            self.assertEqual(rows[1], [
+                str(self.users[0].pk), '団体0', 'ブース0', '概要,改行\nあり', f'flyers/{self.users[0].pk}.png',
+            ])
+            with self.users[1].flyer_image.open() as flyer:
+                self.assertEqual(archive.read(f'flyers/{self.users[1].pk}.png'), flyer.read())
+            self.assertIsNone(archive.testzip())
+
+    def test_manifest_escapes_formula_cells(self):
+        get_user_model().objects.filter(pk=self.users[0].pk).update(
+            organization_name='=cmd|calc', booth_name='-1+2', booth_summary='@SUM(A1)'
+        )
+
+        data = b''.join(stream_flyer_archive(get_user_model().objects.filter(pk=self.users[0].pk)))
+
+        with zipfile.ZipFile(BytesIO(data)) as archive:
+            rows = list(csv.reader(StringIO(archive.read('manifest.csv').decode('utf-8-sig'))))
+        self.assertEqual(rows[1][1:4], ["'=cmd|calc", "'-1+2", "'@SUM(A1)"])
+
+    def test_missing_flyer_file_is_skipped(self):
+        flyer_storage.delete(self.users[0].flyer_image.name)
+
+        data = b''.join(stream_flyer_archive(get_user_model().objects.filter(pk=self.users[0].pk)))
+
+        with zipfile.ZipFile(BytesIO(data)) as archive:
+            self.assertEqual(archive.namelist(), ['manifest.csv'])
+            rows = list(csv.reader(StringIO(archive.read('manifest.csv').decode('utf-8-sig'))))
+            self.assertEqual(rows[1][-1], '')
+
+
+class FlyerUploadTests(MediaRootMixin, TestCase):
+    TUS = {'Tus-Resumable': '1.0.0'}
+
+    def setUp(self):
+        super().setUp()
+        self.upload_dir = os.path.join(self.media_root, 'uploads')
+        override = override_settings(FLYER_UPLOAD_DIR=self.upload_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.data = create_image_file().read()
+
+    def create(self, length=None):
+        return self.client.post(reverse('accounts:flyer-upload-create'), headers={
+            **self.TUS,
+            'Upload-Length': str(len(self.data) if length is None else length),
+            'Upload-Metadata': 'filename ' + base64.b64encode('チラシ.png'.encode()).decode(),
+        })
+
+    def patch(self, location, offset, data):
+        return self.client.patch(
+            location, data, content_type='application/offset+octet-stream',
+            headers={**self.TUS, 'Upload-Offset': str(offset)},
+        )
+
+    def upload(self):
+        location = self.create()['Location']
+        self.patch(location, 0, self.data)
+        return location
+
+    def test_resumable_upload_and_signup(self):
+        response = self.create()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response['Tus-Resumable'], '1.0.0')
+        location = response['Location']
+        upload = FlyerUpload.objects.get()
+        self.assertEqual(upload.filename, 'チラシ.png')
+
+        response = self.patch(location, 0, self.data[:20])
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response['Upload-Offset'], '20')
+        # 先頭のデータで形式を判定済み
+        self.assertEqual(FlyerUpload.objects.get().content_type, 'image/png')
+
+        # 途中から再開
+        response = self.client.head(location, headers=self.TUS)
+        self.assertEqual(response['Upload-Offset'], '20')
+        self.assertEqual(self.patch(location, 0, self.data).status_code, 409)
+        response = self.patch(location, 20, self.data[20:])
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNotNone(FlyerUpload.objects.get().completed_at)
+
+        response = self.client.post(reverse('accounts:signup'), {
+            'email': 'new@example.com',
+            'password1': 'pass1234',
+            'password2': 'pass1234',
+            'full_name': '新規 出展者',
+            'phone': '000-0000-0000',
+            'postal_code': '100-0001',
+            'address': '東京都',
+            'flyer_upload': str(upload.pk),
+        })
+
+        self.assertTemplateUsed(response, 'registration/signup_done.html')
+        user = get_user_model().objects.get(email='new@example.com')
+        self.assertRegex(user.flyer_image.name, r'^flyers/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        with user.flyer_image.open() as flyer:
+            self.assertEqual(flyer.read(), self.data)
+        self.assertFalse(FlyerUpload.objects.exists())
+        self.assertEqual(os.listdir(self.upload_dir), [])
+
+    def test_update_form_uses_upload(self):
+        user = get_user_model().objects.create_user(
+            email='user@example.com', password='pass', full_name='出展者', is_active=True,
+            flyer_image=create_image_file(color='blue'),
+        )
+        self.client.force_login(user)
+        upload_id = self.upload().rstrip('/').rsplit('/', 1)[-1]
+
+        self.client.post(reverse('accounts:update'), {
+            'full_name': '出展者', 'phone': '000', 'postal_code': '100-0001', 'address': '東京都',
+            'flyer_upload': upload_id,
+        })
+
+        user.refresh_from_db()
+        with user.flyer_image.open() as flyer:
+            self.assertEqual(flyer.read(), self.data)
+
+    def test_upload_file_is_closed_when_signup_form_is_invalid(self):
+        upload_id = self.upload().rstrip('/').rsplit('/', 1)[-1]
+        opened = []
+
+        def record_open(upload):
+            opened.append(open_upload(upload))
+            return opened[-1]
+
+        with mock.patch('accounts.forms.open_upload', side_effect=record_open):
+            response = self.client.post(reverse('accounts:signup'), {
+                'email': 'new@example.com', 'password1': 'pass1234', 'password2': 'mismatch',
+                'full_name': '新規 出展者', 'phone': '000', 'postal_code': '100-0001', 'address': '東京都',
+                'flyer_upload': upload_id,
+            })
+
+        self.assertIn('password2', response.context['form'].errors)
+        self.assertEqual(len(opened), 1)
+        self.assertTrue(opened[0].closed)
+        # 保存しなかったアップロードは再送信で使えるよう残す
+        self.assertTrue(FlyerUpload.objects.filter(pk=upload_id).exists())
+
+    def test_rejects_non_image_from_first_chunk(self):
+        location = self.create()['Location']
+
+        response = self.patch(location, 0, b'%PDF-1.7 not an image')
+
+        self.assertEqual(response.status_code, 415)
+        self.assertFalse(FlyerUpload.objects.exists())
+        self.assertEqual(os.listdir(self.upload_dir), [])
+
+    @override_settings(FLYER_MAX_UPLOAD_SIZE=100)
+    def test_rejects_oversized_upload_before_transfer(self):
+        self.assertEqual(self.create(length=101).status_code, 413)
+        self.assertFalse(FlyerUpload.objects.exists())
+
+    def test_protocol_errors(self):
+        response = self.client.post(reverse('accounts:flyer-upload-create'), headers={'Upload-Length': '10'})
+        self.assertEqual(response.status_code, 412)
+
+        response = self.client.options(reverse('accounts:flyer-upload-create'))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response['Tus-Extension'], 'creation,expiration')
+
+        location = self.create()['Location']
+        self.assertEqual(self.patch(location, 0, self.data + b'extra').status_code, 413)
+
+        # 別のセッションからは操作できない
+        self.client.logout()
+        self.assertEqual(self.client.head(location, headers=self.TUS).status_code, 404)
+
+    def test_body_is_received_outside_transaction(self):
+        location = self.create()['Location']
+        upload = FlyerUpload.objects.get()
+        data = self.data
+        in_transaction = []
+        # TestCase 自体のトランザクションより内側のブロックで読み込んでいないことを確認する
+        depth = len(connection.atomic_blocks)
+
+        class Stream:
+            """読み込み時にトランザクションの状態を記録し、別のリクエストの追記を割り込ませる"""
+
+            def __init__(self):
+                self.buffer = BytesIO(data)
+
+            def read(self, size):
+                in_transaction.append(len(connection.atomic_blocks) > depth)
+                if self.buffer.tell() == 0:
+                    FlyerUpload.objects.filter(pk=upload.pk).update(offset=10)
+                return self.buffer.read(size)
+
+        with self.assertRaises(UploadError) as raised:
+            append_chunk(upload.pk, '0', Stream())
+
+        self.assertEqual(raised.exception.status, 409)
+        self.assertEqual(set(in_transaction), {False})
+        self.assertEqual(FlyerUpload.objects.get().offset, 10)
+        self.assertEqual(os.path.getsize(upload.path), 0)
+        self.assertEqual(os.listdir(self.upload_dir), [str(upload.pk)])
+        self.assertEqual(self.client.head(location, headers=self.TUS)['Upload-Offset'], '10')
+
+    def test_upload_count_is_capped_per_session(self):
+        for _ in range(MAX_SESSION_UPLOADS):
+            self.assertEqual(self.create().status_code, 201)
+
+        self.assertEqual(self.create().status_code, 429)
+        self.assertEqual(FlyerUpload.objects.count(), MAX_SESSION_UPLOADS)
+
+        # 期限切れのアップロードは件数に含まない
+        FlyerUpload.objects.update(expires_at=timezone.now())
+        self.assertEqual(self.create().status_code, 201)
+
+    def test_signup_rejects_upload_from_other_session(self):
+        location = self.upload()
+        self.client.logout()
+
+        response = self.client.post(reverse('accounts:signup'), {
+            'email': 'new@example.com', 'password1': 'pass1234', 'password2': 'pass1234',
+            'full_name': '新規 出展者', 'phone': '000', 'postal_code': '100-0001', 'address': '東京都',
+            'flyer_upload': location.rstrip('/').rsplit('/', 1)[-1],
+        })
+
+        self.assertIn('flyer_image', response.context['form'].errors)
+        self.assertFalse(get_user_model().objects.filter(email='new@example.com').exists())
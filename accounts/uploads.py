@@ -0,0 +1,253 @@
+"""
+チラシ画像の分割・再開可能なアップロード（tus プロトコル 1.0.0 の core と creation・expiration 拡張）
+
+1. POST でファイルサイズ（Upload-Length）を申告してアップロードを作成し、
+2. PATCH で受信済みのサイズ（Upload-Offset）から続きのデータを送信します。
+3. 通信が切れた場合は HEAD で受信済みのサイズを確認して、その位置から再開できます。
+
+受信したデータはメモリに溜めずに一時ファイルへ少しずつ追記します。
+ファイルサイズは作成時に、画像の形式は先頭のデータを受信した時点で確認し、
+受け付けられないアップロードはすぐに中止します。完了時には画像全体を Pillow で検証します。
+作成したアップロードの ID はセッションに記録し、同じセッションからのみ操作できます。
+1つのセッションで作成できるアップロードの件数には上限があります。
+"""
+
+import base64
+import binascii
+import os
+import shutil
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.http import UnreadablePostError
+from django.utils import timezone
+from PIL import Image
+from .models import FlyerUpload
+
+TUS_VERSION = '1.0.0'
+TUS_EXTENSIONS = 'creation,expiration'
+# リクエストの本文を読み込む単位
+READ_CHUNK_SIZE = 64 * 1024
+# アップロードの ID を記録するセッションのキー
+SESSION_KEY = 'flyer_uploads'
+# 1つのセッションで同時に保持できる有効期限内のアップロードの件数
+MAX_SESSION_UPLOADS = 5
+
+# 画像の形式を判定する先頭のバイト列（先頭のバイト列, 拡張子, Content-Type）
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpeg', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png', 'image/png'),
+    (b'GIF87a', 'gif', 'image/gif'),
+    (b'GIF89a', 'gif', 'image/gif'),
+)
+SNIFF_LENGTH = max(len(signature) for signature, _extension, _content_type in SIGNATURES)
+EXTENSIONS = {content_type: extension for _signature, extension, content_type in SIGNATURES}
+
+
+class UploadError(Exception):
+    """アップロードを受け付けられない場合の例外（HTTPのステータスコードを保持する）"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def detect_content_type(header):
+    """ファイルの先頭のバイト列から画像の Content-Type を判定（対応していない形式は None）"""
+    for signature, _extension, content_type in SIGNATURES:
+        if header.startswith(signature):
+            return content_type
+    return None
+
+
+def parse_metadata(value):
+    """Upload-Metadata ヘッダー（キーと Base64 の値の組をカンマで区切る）を辞書に変換"""
+    metadata = {}
+    for pair in value.split(','):
+        key, _separator, encoded = pair.strip().partition(' ')
+        if not key:
+            continue
+        try:
+            metadata[key] = base64.b64decode(encoded, validate=True).decode()
+        except (binascii.Error, UnicodeDecodeError):
+            metadata[key] = ''
+    return metadata
+
+
+def session_upload_ids(session):
+    """セッションで作成したアップロードの ID のリスト"""
+    return session.get(SESSION_KEY, [])
+
+
+def get_session_upload(session, pk, **filters):
+    """
+    セッションで作成した有効期限内のアップロードを返す
+
+    Raises:
+        FlyerUpload.DoesNotExist: 見つからない場合
+    """
+    if str(pk) not in session_upload_ids(session):
+        raise FlyerUpload.DoesNotExist
+    return FlyerUpload.objects.get(pk=pk, expires_at__gt=timezone.now(), **filters)
+
+
+def create_upload(session, length, filename=''):
+    """
+    申告されたファイルサイズでアップロードを作成し、ID をセッションに記録
+
+    1つのセッションで同時に保持できる有効期限内のアップロードは MAX_SESSION_UPLOADS 件までです
+    （フォームで使用したアップロードは削除されるため、件数に含まれません）。
+
+    Raises:
+        UploadError: ファイルサイズが不正または上限を超える場合、
+            セッションのアップロードの件数が上限に達している場合
+    """
+    if length is None or not (length.isascii() and length.isdigit()):
+        raise UploadError(400, 'Upload-Length を指定してください。')
+    length = int(length)
+    if length == 0:
+        raise UploadError(400, '空のファイルはアップロードできません。')
+    if length > settings.FLYER_MAX_UPLOAD_SIZE:
+        raise UploadError(413, 'ファイルサイズが上限を超えています。')
+
+    active = [
+        str(pk) for pk in FlyerUpload.objects.filter(
+            pk__in=session_upload_ids(session), expires_at__gt=timezone.now()
+        ).values_list('pk', flat=True)
+    ]
+    if len(active) >= MAX_SESSION_UPLOADS:
+        raise UploadError(429, 'アップロードの件数が上限に達しました。しばらくしてからやり直してください。')
+
+    upload = FlyerUpload.objects.create(
+        filename=filename[:255],
+        length=length,
+        expires_at=timezone.now() + timedelta(hours=settings.FLYER_UPLOAD_EXPIRE_HOURS),
+    )
+    os.makedirs(settings.FLYER_UPLOAD_DIR, exist_ok=True)
+    open(upload.path, 'wb').close()
+    session[SESSION_KEY] = active + [str(upload.pk)]
+    return upload
+
+
+def _receive(stream, path, limit):
+    """
+    stream のデータを path のファイルに書き出し、受信したバイト数を返す
+
+    Raises:
+        UploadError: limit を超えるデータを受信した場合
+    """
+    received = 0
+    with open(path, 'wb') as file:
+        while True:
+            try:
+                chunk = stream.read(min(READ_CHUNK_SIZE, limit - received + 1))
+            except UnreadablePostError:
+                # 通信が切れた場合は受信できた分までを記録し、続きから再開できるようにする
+                break
+            if not chunk:
+                break
+            if received + len(chunk) > limit:
+                raise UploadError(413, '申告したファイルサイズを超えています。')
+            file.write(chunk)
+            received += len(chunk)
+    return received
+
+
+def _copy_part(part_path, path, offset):
+    """受信したデータを一時ファイルの offset の位置に書き込む"""
+    with open(part_path, 'rb') as part, open(path, 'r+b') as file:
+        file.seek(offset)
+        shutil.copyfileobj(part, file, READ_CHUNK_SIZE)
+
+
+def append_chunk(upload_id, offset, stream):
+    """
+    受信済みのサイズ offset の位置から stream のデータを一時ファイルに追記
+
+    本文は通信の遅いクライアントからでもトランザクションの外で受信し、リクエストごとの
+    部分ファイルに書き出します。その後の短いトランザクションで、受信済みのサイズが
+    offset のままの場合のみ（UPDATE ... WHERE offset = offset）サイズを更新して
+    部分ファイルを一時ファイルに書き込むため、同じ位置への同時の追記は1つだけが成功します。
+    画像の形式が判定できるだけのデータを受信した時点で形式を確認し、
+    全てのデータを受信すると画像全体を検証して完了にします。
+    受け付けられない画像の場合はアップロードを削除します。
+
+    Returns:
+        FlyerUpload: 追記後のアップロード
+
+    Raises:
+        UploadError: offset が受信済みのサイズと一致しない場合、申告したサイズを超える場合、
+            画像として受け付けられない場合
+    """
+    if offset is None or not (offset.isascii() and offset.isdigit()):
+        raise UploadError(400, 'Upload-Offset を指定してください。')
+    offset = int(offset)
+
+    upload = FlyerUpload.objects.get(pk=upload_id)
+    if upload.completed_at is not None or offset != upload.offset:
+        raise UploadError(409, 'Upload-Offset が受信済みのサイズと一致しません。')
+
+    part_path = f'{upload.path}.{uuid.uuid4().hex}.part'
+    try:
+        received = _receive(stream, part_path, upload.length - offset)
+        with transaction.atomic():
+            updated = FlyerUpload.objects.filter(
+                pk=upload.pk, offset=offset, completed_at__isnull=True
+            ).update(offset=offset + received)
+            if not updated:
+                raise UploadError(409, 'Upload-Offset が受信済みのサイズと一致しません。')
+            _copy_part(part_path, upload.path, offset)
+    finally:
+        try:
+            os.remove(part_path)
+        except FileNotFoundError:
+            pass
+    upload.offset = offset + received
+
+    try:
+        if not upload.content_type and upload.offset >= min(SNIFF_LENGTH, upload.length):
+            upload.content_type = _check_header(upload)
+        if upload.offset == upload.length:
+            _check_image(upload)
+            upload.completed_at = timezone.now()
+    except UploadError:
+        upload.delete()
+        raise
+    upload.save(update_fields=['content_type', 'completed_at'])
+    return upload
+
+
+def _check_header(upload):
+    with open(upload.path, 'rb') as file:
+        content_type = detect_content_type(file.read(SNIFF_LENGTH))
+    if content_type is None:
+        raise UploadError(415, 'JPEG・PNG・GIF の画像を選択してください。')
+    return content_type
+
+
+def _check_image(upload):
+    try:
+        with Image.open(upload.path) as image:
+            width, height = image.size
+            image.verify()
+    except Exception:
+        raise UploadError(415, '画像ファイルを読み込めません。')
+    if width * height > settings.FLYER_MAX_PIXELS:
+        raise UploadError(413, '画像の縦横のサイズが大きすぎます。')
+
+
+def open_upload(upload):
+    """完了したアップロードをモデルの ImageField に代入できるファイルとして開く"""
+    name = f'flyer.{EXTENSIONS[upload.content_type]}'
+    return File(open(upload.path, 'rb'), name=name)
+
+
+def purge_expired(now=None):
+    """期限切れのアップロードを一時ファイルとともに削除し、その件数を返す"""
+    count = 0
+    for upload in FlyerUpload.objects.filter(expires_at__lte=now or timezone.now()).iterator():
+        upload.delete()
+        count += 1
+    return count
@@ -1,7 +1,7 @@
 """
 認証関連のURL設定
 
-カスタムビュー（ユーザー登録、メール認証）のURLパターンを定義します。
+カスタムビュー（ユーザー登録、メール認証、チラシ画像のアップロード・縮小版）のURLパターンを定義します。
 標準の認証ビューは django.contrib.auth.urls で提供されます。
 """
 
@@ -25,4 +25,7 @@ urlpatterns = [
     path('update/', views.UserUpdateView.as_view(), name='update'),
     path('email/change/', views.EmailChangeView.as_view(), name='email-change'),
     path('email/verify/<str:token>/', views.VerifyEmailChangeView.as_view(), name='verify-email-change'),
+    path('uploads/', views.FlyerUploadView.as_view(), name='flyer-upload-create'),
+    path('uploads/<uuid:upload_id>/', views.FlyerUploadView.as_view(), name='flyer-upload'),
+    path('flyers/<str:variant>/<path:name>', views.FlyerDerivativeView.as_view(), name='flyer-derivative'),
 ]
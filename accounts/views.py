@@ -3,19 +3,30 @@
 
 ユーザー登録とメール認証機能を提供します。
 一般ユーザーの登録時はメール認証が必要です。
+メールはリクエスト中には送信せず、送信キュー（OutgoingEmail）に登録するだけです。
+チラシ画像の縮小版もワーカーが生成し、見つからない場合のみ表示時に生成します。
+チラシ画像は分割・再開可能なアップロード（tus プロトコル）でも受け付けます。
 """
 
+from django.conf import settings
 from django.contrib.auth import login
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import FileResponse, Http404, HttpResponse
 from django.shortcuts import render
 from django.urls import reverse, reverse_lazy
-from django.views.generic import CreateView, TemplateView, UpdateView, FormView
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date
+from django.views.decorators.cache import never_cache
+from django.views.generic import CreateView, TemplateView, UpdateView, FormView, View
 from django.contrib import messages
 from django.utils import timezone
-from django.template.loader import render_to_string
-from django.core.mail import send_mail
+from django.db import transaction
 from .forms import GeneralUserCreationForm, UserUpdateForm, EmailChangeForm
-from .models import UserActivateToken, CustomUser
+from PIL import UnidentifiedImageError
+from .derivatives import CONTENT_TYPES, ensure_derivative
+from . import uploads
+from .models import FlyerUpload, OutgoingEmail, UserActivateToken, CustomUser
+from .storage import derivative_storage, is_referenced
 from django.contrib.auth.mixins import UserPassesTestMixin
 from django.shortcuts import redirect
 
@@ -27,24 +38,50 @@ class AnonymousUserRequiredMixin(UserPassesTestMixin):
     def handle_no_permission(self):
         return redirect('home')
 
-class SignUpView(AnonymousUserRequiredMixin, CreateView):
+class FlyerUploadFormMixin:
+    """
+    分割アップロードしたチラシ画像をフォームで参照できるようにするミックスイン
+
+    フォームの検証で開いたアップロードのファイルは、保存の成否にかかわらずリクエストの最後に閉じます。
+    """
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['upload_session'] = self.request.session
+        return kwargs
+
+    def get_form(self, form_class=None):
+        self.flyer_form = super().get_form(form_class)
+        return self.flyer_form
+
+    def post(self, request, *args, **kwargs):
+        self.flyer_form = None
+        try:
+            return super().post(request, *args, **kwargs)
+        finally:
+            if self.flyer_form is not None:
+                self.flyer_form.close_flyer_upload()
+
+class SignUpView(AnonymousUserRequiredMixin, FlyerUploadFormMixin, CreateView):
     """ユーザー登録ビュー"""
     form_class = GeneralUserCreationForm
     template_name = 'registration/signup.html'
 
     def form_valid(self, form):
         try:
-            # ユーザーを作成（メール認証前なのでis_active=False）
-            user = form.save(commit=False)
-            user.is_active = False
-            user.save()
-
-            # アクティベーショントークンを生成し、認証メールを送信
-            token = UserActivateToken.create_token(user)
-            verification_url = self.request.build_absolute_uri(
-                reverse('accounts:verify-email', kwargs={'token': token.token})
-            )
-            user.send_verification_email(verification_url)
+            with transaction.atomic():
+                # ユーザーを作成（メール認証前なのでis_active=False）
+                user = form.save(commit=False)
+                user.is_active = False
+                user.save()
+
+                # アクティベーショントークンを生成し、認証メールを送信キューに登録
+                token = UserActivateToken.create_token(user)
+                verification_url = self.request.build_absolute_uri(
+                    reverse('accounts:verify-email', kwargs={'token': token.token})
+                )
+                user.send_verification_email(verification_url)
+            form.finish_flyer_upload()
 
             return render(self.request, 'registration/signup_done.html', {
                 'email': user.email
@@ -82,7 +119,7 @@ class VerifyEmailView(TemplateView):
         except UserActivateToken.DoesNotExist:
             return render(request, self.template_name, {'success': False})
 
-class UserUpdateView(LoginRequiredMixin, UpdateView):
+class UserUpdateView(LoginRequiredMixin, FlyerUploadFormMixin, UpdateView):
     """ユーザー情報更新ビュー"""
     model = CustomUser
     form_class = UserUpdateForm
@@ -96,6 +133,7 @@ class UserUpdateView(LoginRequiredMixin, UpdateView):
     def form_valid(self, form):
         """フォームのバリデーションが成功した時の処理"""
         response = super().form_valid(form)
+        form.finish_flyer_upload()
         messages.success(self.request, '登録情報を更新しました。')
         return response
 
@@ -116,37 +154,32 @@ class EmailChangeView(LoginRequiredMixin, FormView):
         return kwargs
 
     def form_valid(self, form):
+        user = self.request.user
+        new_email = form.cleaned_data['new_email']
         try:
-            user = self.request.user
-            new_email = form.cleaned_data['new_email']
-
-            # アクティベーショントークンを生成
-            token = UserActivateToken.create_token(user)
-            verification_url = self.request.build_absolute_uri(
-                reverse('accounts:verify-email-change', kwargs={'token': token.token})
-            )
-
-            # 新しいメールアドレスを一時的に保存
-            token.extra_data = new_email
-            token.save()
-
-            # 確認メールを送信
-            user.send_verification_email(verification_url, new_email)
-
-            messages.success(
-                self.request,
-                f'確認メールを {new_email} に送信しました。'
-                'メール内のリンクをクリックして、メールアドレスの変更を完了してください。'
-            )
-            return super().form_valid(form)
+            # トークンの作成と確認メールの登録を1つのトランザクションで行い、
+            # 失敗した場合はトークンも残さない
+            with transaction.atomic():
+                # 新しいメールアドレスを保持したアクティベーショントークンを生成
+                token = UserActivateToken.create_token(user, extra_data=new_email)
+                verification_url = self.request.build_absolute_uri(
+                    reverse('accounts:verify-email-change', kwargs={'token': token.token})
+                )
+
+                # 確認メールを送信キューに登録
+                user.send_verification_email(verification_url, new_email)
 
         except Exception:
-            # エラーが発生した場合、トークンを削除（存在する場合）
-            if 'token' in locals():
-                token.delete()
             messages.error(self.request, 'メール送信中にエラーが発生しました。')
             return self.form_invalid(form)
 
+        messages.success(
+            self.request,
+            f'確認メールを {new_email} に送信しました。'
+            'メール内のリンクをクリックして、メールアドレスの変更を完了してください。'
+        )
+        return super().form_valid(form)
+
     def form_invalid(self, form):
         """フォームのバリデーションが失敗した時の処理"""
         messages.error(self.request, '入力内容に誤りがあります。')
@@ -159,40 +192,37 @@ class VerifyEmailChangeView(LoginRequiredMixin, TemplateView):
     def get(self, request, *args, **kwargs):
         """GETリクエストの処理"""
         try:
-            # トークンが有効なものを取得
-            activate_token = UserActivateToken.objects.select_related('user').get(
-                token=kwargs.get('token'),
-                expired_at__gte=timezone.now(),
-                user=request.user
-            )
-
-            # メールアドレスを更新
-            user = activate_token.user
-            new_email = activate_token.extra_data
-            old_email = user.email
-            user.email = new_email
-            user.save()
-
-            # 使用済みトークンを削除
-            activate_token.delete()
-
-            # 古いメールアドレスに通知を送信
-            context = {
-                'user': user,
-                'old_email': old_email,
-                'new_email': new_email,
-            }
-            subject = 'メールアドレスが変更されました'
-            text_message = render_to_string('registration/email/email_change_notification.txt', context)
-            html_message = render_to_string('registration/email/email_change_notification.html', context)
-
-            send_mail(
-                subject=subject,
-                message=text_message,
-                from_email=None,
-                recipient_list=[old_email],
-                html_message=html_message
-            )
+            # メールアドレスの更新・トークンの削除・通知の登録を1つのトランザクションで行う
+            # （トークンの行をロックし、同じトークンが同時に使われても1回だけ反映する）
+            with transaction.atomic():
+                # トークンが有効なものを取得
+                activate_token = UserActivateToken.objects.select_for_update().select_related('user').get(
+                    token=kwargs.get('token'),
+                    expired_at__gte=timezone.now(),
+                    user=request.user
+                )
+
+                # メールアドレスを更新
+                user = activate_token.user
+                new_email = activate_token.extra_data
+                old_email = user.email
+                user.email = new_email
+                user.save()
+
+                # 使用済みトークンを削除
+                activate_token.delete()
+
+                # 古いメールアドレスへの通知を送信キューに登録
+                OutgoingEmail.enqueue(
+                    subject='メールアドレスが変更されました',
+                    to_email=old_email,
+                    template_name='registration/email/email_change_notification',
+                    context={
+                        'user': {'full_name': user.full_name},
+                        'old_email': old_email,
+                        'new_email': new_email,
+                    },
+                )
 
             messages.success(request, 'メールアドレスを変更しました。')
             return render(request, self.template_name, {'success': True})
@@ -200,3 +230,88 @@ class VerifyEmailChangeView(LoginRequiredMixin, TemplateView):
         except UserActivateToken.DoesNotExist:
             messages.error(request, '無効なトークンです。')
             return render(request, self.template_name, {'success': False})
+
+class FlyerDerivativeView(View):
+    """
+    チラシ画像の縮小版を返すビュー
+
+    縮小版が見つからない場合（ワーカーの処理前、削除後など）はその場で生成し直します。
+    """
+
+    def get(self, request, variant, name):
+        if variant not in settings.FLYER_DERIVATIVES or not is_referenced(name):
+            raise Http404('チラシ画像が見つかりません。')
+        try:
+            derivative = ensure_derivative(name, variant)
+        except (OSError, UnidentifiedImageError):
+            raise Http404('チラシ画像を読み込めません。')
+        response = FileResponse(
+            derivative_storage.open(derivative),
+            content_type=CONTENT_TYPES[settings.FLYER_DERIVATIVES[variant]['format']],
+        )
+        # チラシ画像を差し替えるとパスが変わるため、ブラウザに長く保持させる
+        response['Cache-Control'] = 'public, max-age=86400'
+        return response
+
+@method_decorator(never_cache, name='dispatch')
+class FlyerUploadView(View):
+    """
+    チラシ画像の分割アップロード（tus プロトコル）のビュー
+
+    upload_id なしの URL で OPTIONS（対応状況）と POST（作成）、
+    upload_id 付きの URL で HEAD（受信済みのサイズ）と PATCH（追記）を受け付けます。
+    """
+    http_method_names = ['options', 'post', 'head', 'patch']
+
+    def dispatch(self, request, *args, **kwargs):
+        if (request.method in ('POST', 'OPTIONS')) == ('upload_id' in kwargs):
+            return self.http_method_not_allowed(request, *args, **kwargs)
+        if request.method != 'OPTIONS' and request.headers.get('Tus-Resumable') != uploads.TUS_VERSION:
+            response = self.tus_response(412)
+            response['Tus-Version'] = uploads.TUS_VERSION
+            return response
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except uploads.UploadError as e:
+            return self.tus_response(e.status, str(e))
+        except FlyerUpload.DoesNotExist:
+            return self.tus_response(404)
+
+    def tus_response(self, status, content=''):
+        response = HttpResponse(content, status=status, content_type='text/plain; charset=utf-8')
+        response['Tus-Resumable'] = uploads.TUS_VERSION
+        return response
+
+    def upload_headers(self, response, upload):
+        response['Upload-Offset'] = upload.offset
+        response['Upload-Length'] = upload.length
+        response['Upload-Expires'] = http_date(upload.expires_at.timestamp())
+        return response
+
+    def options(self, request, *args, **kwargs):
+        response = self.tus_response(204)
+        response['Tus-Version'] = uploads.TUS_VERSION
+        response['Tus-Extension'] = uploads.TUS_EXTENSIONS
+        response['Tus-Max-Size'] = settings.FLYER_MAX_UPLOAD_SIZE
+        return response
+
+    def post(self, request, *args, **kwargs):
+        upload = uploads.create_upload(
+            request.session,
+            request.headers.get('Upload-Length'),
+            filename=uploads.parse_metadata(request.headers.get('Upload-Metadata', '')).get('filename', ''),
+        )
+        response = self.upload_headers(self.tus_response(201), upload)
+        response['Location'] = reverse('accounts:flyer-upload', kwargs={'upload_id': upload.pk})
+        return response
+
+    def head(self, request, upload_id):
+        upload = uploads.get_session_upload(request.session, upload_id)
+        return self.upload_headers(self.tus_response(200), upload)
+
+    def patch(self, request, upload_id):
+        if request.content_type != 'application/offset+octet-stream':
+            return self.tus_response(415, 'Content-Type は application/offset+octet-stream にしてください。')
+        uploads.get_session_upload(request.session, upload_id)
+        upload = uploads.append_chunk(upload_id, request.headers.get('Upload-Offset'), request)
+        return self.upload_headers(self.tus_response(204), upload)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -84,6 +85,31 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+# アンケート定義・一覧ページ・回答済みアンケートなどのキャッシュとその無効化用のバージョンは
+# 全てのワーカープロセスで共有する必要がある。複数プロセスで動かす本番環境では環境変数
+# CACHE_REDIS_URL（例: redis://127.0.0.1:6379/1）を設定して Redis を使うこと（redis パッケージが必要）。
+# キャッシュの読み書きが回答保存と同じDBへのクエリにならないよう、DatabaseCache は使用しない。
+# 未設定の場合は開発・テスト用にプロセスごとの LocMemCache を使う（単一プロセスでのみ整合する）
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -121,6 +147,33 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 
+# アップロードされたファイル（チラシ画像とその縮小版）
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+# MEDIA_ROOT の設定前に保存されたチラシ画像（flyers/<UUID>/<UUID>.<拡張子>）の保存先
+# （accounts のマイグレーション 0008 でコンテンツアドレス方式のパスに移動します）
+FLYER_LEGACY_ROOT = BASE_DIR
+
+# チラシ画像として受け付ける最大のファイルサイズ（バイト）
+FLYER_MAX_UPLOAD_SIZE = 5 * 1024 * 1024
+# チラシ画像として受け付ける最大の画素数（幅 × 高さ）
+FLYER_MAX_PIXELS = 40_000_000
+# チラシ画像から生成する縮小版（名前: 最大の幅・高さ、形式、画質）
+FLYER_DERIVATIVES = {
+    'thumb': {'size': (320, 320), 'format': 'WEBP', 'quality': 80},
+    'web': {'size': (1600, 1600), 'format': 'JPEG', 'quality': 85},
+}
+# 縮小版を生成するワーカーが1回に取り出す件数
+FLYER_DERIVATIVE_BATCH_SIZE = 20
+# 縮小版の生成に失敗したチラシ画像を再処理する最大回数
+FLYER_DERIVATIVE_MAX_ATTEMPTS = 3
+# 処理待ちのチラシ画像がない場合にワーカーが待つ秒数
+FLYER_DERIVATIVE_POLL_INTERVAL = 5
+# 分割アップロード中のチラシ画像を書き込む一時ディレクトリ（公開しない）
+FLYER_UPLOAD_DIR = BASE_DIR / 'uploads'
+# 分割アップロードを開始してから完了・フォームで使用するまでの有効期限（時間）
+FLYER_UPLOAD_EXPIRE_HOURS = 24
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -151,3 +204,26 @@ DEFAULT_FROM_EMAIL = 'hoge@hoge.com'
 EMAIL_HOST_USER = 'hoge@hoge.com'
 EMAIL_HOST_PASSWORD = 'password'
 EMAIL_USE_TLS = True
+
+# 送信待ちメール（アウトボックス）のワーカーが1つのSMTP接続で送信する件数
+EMAIL_OUTBOX_BATCH_SIZE = 50
+# 送信に失敗したメールを再送する最大回数
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+# 最初の再送までの秒数（以降は失敗するたびに2倍）
+EMAIL_OUTBOX_RETRY_DELAY = 60
+# 送信待ちのメールがない場合にワーカーが待つ秒数
+EMAIL_OUTBOX_POLL_INTERVAL = 5
+
+# ホーム画面でカテゴリーごとに表示するアンケートの件数
+SURVEY_HOME_SURVEYS_PER_CATEGORY = 2
+
+# カテゴリー別一覧の1ページあたりのアンケートの件数
+SURVEY_CATEGORY_PAGE_SIZE = 20
+
+# ホーム画面・カテゴリー別一覧のアンケート一覧部分をキャッシュするかどうか
+SURVEY_PAGE_CACHE = True
+# 一覧部分のキャッシュの最大保持秒数（公開期間の境界でも失効します）
+SURVEY_PAGE_CACHE_TIMEOUT = 60 * 10
+
+# 回答の集計行のシャード数（同時回答時の行ロックの競合を分散）
+SURVEY_TALLY_SHARDS = 8
@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 
@@ -8,3 +10,6 @@ urlpatterns = [
     path('accounts/', include('django.contrib.auth.urls')),  # 標準認証ビュー用
     path('nested_admin/', include('nested_admin.urls')),
 ]
+
+# 開発サーバーでアップロードされたファイルを配信（本番環境ではWebサーバーで配信）
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,85 @@
+/**
+ * カテゴリー一覧のドラッグ&ドロップによる並べ替え
+ *
+ * 一覧の行をドラッグ&ドロップで並べ替えると、全てのカテゴリーの新しい順序を
+ * JSON {"ids": [カテゴリーID, ...]} で送信し、完了後に一覧を再読み込みします。
+ * 絞り込み・検索・ページ分割をしていない一覧（全てのカテゴリーが表示される場合）のみ有効です。
+ */
+
+class CategoryReorder {
+    constructor(container) {
+        this.container = container;
+        this.tbody = container.querySelector('#result_list tbody');
+        this.dragging = null;
+        if (this.tbody) {
+            this.initializeRows();
+        }
+    }
+
+    /**
+     * 各行をドラッグ可能にする
+     */
+    initializeRows() {
+        this.rows().forEach((row) => {
+            row.draggable = true;
+            row.style.cursor = 'move';
+            row.addEventListener('dragstart', (event) => {
+                this.dragging = row;
+                event.dataTransfer.effectAllowed = 'move';
+            });
+            row.addEventListener('dragover', (event) => {
+                event.preventDefault();
+                if (!this.dragging || this.dragging === row) {
+                    return;
+                }
+                // カーソルが行の上半分にあれば前に、下半分にあれば後ろに移動する
+                const rect = row.getBoundingClientRect();
+                const before = event.clientY < rect.top + rect.height / 2;
+                this.tbody.insertBefore(this.dragging, before ? row : row.nextSibling);
+            });
+            row.addEventListener('dragend', () => {
+                if (this.dragging) {
+                    this.dragging = null;
+                    this.save();
+                }
+            });
+        });
+    }
+
+    rows() {
+        return Array.from(this.tbody.querySelectorAll('tr'));
+    }
+
+    /**
+     * 行のチェックボックスの値（カテゴリーID）を表示順に取得
+     */
+    ids() {
+        return this.rows().map((row) => Number(row.querySelector('input.action-select').value));
+    }
+
+    /**
+     * 新しい順序を送信
+     */
+    async save() {
+        const response = await fetch(this.container.dataset.reorderUrl, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value,
+            },
+            body: JSON.stringify({ids: this.ids()}),
+        });
+        if (!response.ok) {
+            const data = await response.json().catch(() => ({}));
+            alert(data.error || '表示順を保存できませんでした。');
+        }
+        window.location.reload();
+    }
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+    const container = document.getElementById('category-reorder');
+    if (container && window.fetch) {
+        new CategoryReorder(container);
+    }
+});
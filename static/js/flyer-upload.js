@@ -0,0 +1,178 @@
+/**
+ * チラシ画像の分割・再開可能なアップロード（tus プロトコル）
+ *
+ * ファイルが選択されると、フォームの送信を待たずにチラシ画像を一定サイズずつ送信します。
+ * 通信が切れた場合は受信済みのサイズを確認して続きから再送し、
+ * 完了したアップロードの ID を hidden の flyer_upload に設定します。
+ * アップロードに失敗した場合は、従来どおりフォームと一緒にファイルを送信します。
+ */
+
+class FlyerUploader {
+    constructor(input) {
+        this.TUS_VERSION = '1.0.0';
+        this.CHUNK_SIZE = 512 * 1024;
+        this.MAX_RETRIES = 5;
+        this.input = input;
+        this.target = document.getElementById(input.dataset.uploadTarget);
+        this.progress = document.getElementById('flyerUploadProgress');
+        this.form = input.form;
+        this.uploading = false;
+        this.initializeEventListeners();
+    }
+
+    /**
+     * イベントリスナーの初期化
+     */
+    initializeEventListeners() {
+        this.input.addEventListener('change', () => {
+            const file = this.input.files[0];
+            if (file) {
+                this.upload(file);
+            }
+        });
+
+        // アップロード中はフォームを送信しない
+        this.form.addEventListener('submit', (event) => {
+            if (this.uploading) {
+                event.preventDefault();
+                event.stopPropagation();
+            }
+        });
+    }
+
+    /**
+     * tus プロトコルの共通ヘッダー
+     */
+    headers(extra = {}) {
+        return {
+            'Tus-Resumable': this.TUS_VERSION,
+            'X-CSRFToken': this.form.querySelector('[name=csrfmiddlewaretoken]').value,
+            ...extra,
+        };
+    }
+
+    /**
+     * ファイルを分割して送信
+     */
+    async upload(file) {
+        this.uploading = true;
+        this.target.value = '';
+        this.setProgress(0);
+        try {
+            const location = await this.create(file);
+            let offset = 0;
+            let retries = 0;
+            while (offset < file.size) {
+                try {
+                    offset = await this.sendChunk(location, file, offset);
+                    retries = 0;
+                } catch (error) {
+                    if (error.fatal || ++retries > this.MAX_RETRIES) {
+                        throw error;
+                    }
+                    await new Promise((resolve) => setTimeout(resolve, 1000 * retries));
+                    offset = await this.fetchOffset(location);
+                }
+                this.setProgress(offset / file.size);
+            }
+            this.complete(location);
+        } catch (error) {
+            // 分割アップロードが使えない場合は、フォームと一緒にファイルを送信する
+            this.target.value = '';
+            this.progress.classList.add('d-none');
+            if (error.message) {
+                this.showError(error.message);
+            }
+        } finally {
+            this.uploading = false;
+        }
+    }
+
+    /**
+     * アップロードを作成し、その URL を返す
+     */
+    async create(file) {
+        const metadata = `filename ${btoa(unescape(encodeURIComponent(file.name)))}`;
+        const response = await fetch(this.input.dataset.uploadUrl, {
+            method: 'POST',
+            headers: this.headers({
+                'Upload-Length': String(file.size),
+                'Upload-Metadata': metadata,
+            }),
+        });
+        if (response.status !== 201) {
+            throw await this.responseError(response);
+        }
+        return response.headers.get('Location');
+    }
+
+    /**
+     * offset の位置から1つのチャンクを送信し、受信済みのサイズを返す
+     */
+    async sendChunk(location, file, offset) {
+        const response = await fetch(location, {
+            method: 'PATCH',
+            headers: this.headers({
+                'Upload-Offset': String(offset),
+                'Content-Type': 'application/offset+octet-stream',
+            }),
+            body: file.slice(offset, offset + this.CHUNK_SIZE),
+        });
+        if (response.status !== 204) {
+            throw await this.responseError(response);
+        }
+        return Number(response.headers.get('Upload-Offset'));
+    }
+
+    /**
+     * 受信済みのサイズを確認
+     */
+    async fetchOffset(location) {
+        const response = await fetch(location, {method: 'HEAD', headers: this.headers()});
+        if (response.status !== 200) {
+            throw await this.responseError(response);
+        }
+        return Number(response.headers.get('Upload-Offset'));
+    }
+
+    /**
+     * エラーのレスポンスを例外に変換（再送しても成功しないものは fatal にする）
+     */
+    async responseError(response) {
+        const error = new Error(response.status === 409 ? '' : await response.text());
+        error.fatal = response.status !== 409 && response.status < 500;
+        return error;
+    }
+
+    /**
+     * アップロードの完了をフォームに反映
+     */
+    complete(location) {
+        this.target.value = location.replace(/\/$/, '').split('/').pop();
+        // ファイルはアップロード済みのため、フォームと一緒には送信しない
+        this.input.value = '';
+        this.input.required = false;
+        this.input.classList.remove('is-invalid');
+        this.setProgress(1);
+    }
+
+    setProgress(ratio) {
+        this.progress.classList.remove('d-none');
+        this.progress.querySelector('.progress-bar').style.width = `${Math.round(ratio * 100)}%`;
+    }
+
+    showError(message) {
+        this.input.classList.add('is-invalid');
+        const feedback = this.input.parentElement.querySelector('.invalid-feedback');
+        if (feedback) {
+            feedback.textContent = message;
+        }
+    }
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+    const input = document.querySelector('input[type=file][data-upload-url]');
+    if (input && window.fetch) {
+        new FlyerUploader(input);
+    }
+});
@@ -4,12 +4,35 @@
 django-nested-adminを使用して、アンケート、質問、選択肢の3階層の編集を可能にします。
 """
 
+import json
+import tempfile
+from datetime import datetime, timedelta
 from django.contrib import admin
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.core.paginator import Paginator
+from django import forms
 from django.forms import ModelForm
 import nested_admin
-from .models import Survey, Question, QuestionChoice, Answer, SurveyCategory
-from django.db.models import Max
-from django.utils.safestring import mark_safe
+from .models import Survey, Question, QuestionChoice, Answer, SurveyCategory, SurveyResponse, SurveyTally
+from django.db.models import Exists, Max, Min, OuterRef, Prefetch, Sum
+from .analytics import SEGMENT_FIELDS, build_report
+from .bulk import clone_surveys
+from .cache import invalidate_answered_surveys
+from .definitions import get_survey_definition
+from .exports import stream_responses_csv
+from .matrix import write_response_matrix
+from .ordering import InvalidOrderError, reorder_categories, reorder_choices, reorder_questions
+from .services import delete_responses
+from .tallies import get_survey_results
+from .transfer import SurveyImportError, import_surveys, open_upload, stream_surveys_csv, stream_surveys_json
+from django.contrib import messages
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.html import format_html, format_html_join
 
 class QuestionChoiceInline(nested_admin.NestedTabularInline):
     """質問編集画面で選択肢を追加できるようにするインライン"""
@@ -54,23 +77,433 @@ class QuestionInline(nested_admin.NestedTabularInline):
             return 1
         return 0  # 編集時
 
+def reorder_response(request, reorder):
+    """並べ替えのリクエスト（JSONのIDのリスト）を reorder(ids) で処理してJSONで結果を返す"""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    try:
+        ids = json.loads(request.body)['ids']
+    except (ValueError, KeyError, TypeError):
+        ids = None
+    if not isinstance(ids, list):
+        return JsonResponse({'error': '{"ids": [ID, ...]} の形式で送信してください。'}, status=400)
+    try:
+        count = reorder(ids)
+    except InvalidOrderError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'updated': count})
+
+
+class SurveyImportForm(forms.Form):
+    """アンケート定義のインポートフォーム"""
+    file = forms.FileField(label='ファイル', help_text='JSON（.json）または CSV（.csv、UTF-8）')
+
+    def clean_file(self):
+        file = self.cleaned_data['file']
+        if not file.name.lower().endswith(('.json', '.csv')):
+            raise forms.ValidationError('拡張子が .json または .csv のファイルを選択してください。')
+        return file
+
+
+class SurveyDuplicateForm(forms.Form):
+    """アンケートの複製の設定フォーム"""
+    shift_days = forms.IntegerField(
+        label='公開期間をずらす日数', initial=0,
+        help_text='公開開始・終了日時をこの日数だけ後ろにずらします（負の値で前に）。'
+    )
+    title_suffix = forms.CharField(
+        label='タイトルの末尾に付ける文字列', initial='（コピー）', required=False, max_length=50
+    )
+
+
 class SurveyAdmin(nested_admin.NestedModelAdmin):
     """アンケート管理画面の設定"""
-    list_display = ('title', 'start_date', 'end_date', 'created_at')
+    list_display = ('title', 'start_date', 'end_date', 'created_at', 'results_link', 'analytics_link', 'export_link')
     search_fields = ('title', 'description', 'summary')
     inlines = [QuestionInline]
+    actions = ['duplicate_surveys', 'export_responses_csv', 'export_definitions_json', 'export_definitions_csv']
+    change_list_template = 'admin/survey/survey/change_list.html'
+
+    def get_urls(self):
+        """集計結果ページと回答データのダウンロードのURLを追加"""
+        urls = [
+            path(
+                'import/',
+                self.admin_site.admin_view(self.import_view),
+                name='survey_survey_import'
+            ),
+            path(
+                '<path:object_id>/questions/<int:question_id>/reorder/',
+                self.admin_site.admin_view(self.reorder_choices_view),
+                name='survey_survey_reorder_choices'
+            ),
+            path(
+                '<path:object_id>/reorder/',
+                self.admin_site.admin_view(self.reorder_questions_view),
+                name='survey_survey_reorder_questions'
+            ),
+            path(
+                '<path:object_id>/results/',
+                self.admin_site.admin_view(self.results_view),
+                name='survey_survey_results'
+            ),
+            path(
+                '<path:object_id>/analytics/',
+                self.admin_site.admin_view(self.analytics_view),
+                name='survey_survey_analytics'
+            ),
+            path(
+                '<path:object_id>/export/csv/',
+                self.admin_site.admin_view(self.export_csv_view),
+                name='survey_survey_export_csv'
+            ),
+            path(
+                '<path:object_id>/export/npz/',
+                self.admin_site.admin_view(self.export_npz_view),
+                name='survey_survey_export_npz'
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def results_link(self, obj):
+        """集計結果ページへのリンクを表示"""
+        return format_html(
+            '<a href="{}">集計結果</a>',
+            reverse('admin:survey_survey_results', args=[obj.pk])
+        )
+    results_link.short_description = '集計'
+
+    def analytics_link(self, obj):
+        """クロス集計ページへのリンクを表示"""
+        return format_html(
+            '<a href="{}">クロス集計</a>',
+            reverse('admin:survey_survey_analytics', args=[obj.pk])
+        )
+    analytics_link.short_description = '分析'
+
+    def export_link(self, obj):
+        """回答データのダウンロードリンクを表示"""
+        return format_html(
+            '<a href="{}">CSV</a> / <a href="{}">NPZ</a>',
+            reverse('admin:survey_survey_export_csv', args=[obj.pk]),
+            reverse('admin:survey_survey_export_npz', args=[obj.pk])
+        )
+    export_link.short_description = '回答データ'
+
+    def export_csv_view(self, request, object_id):
+        """アンケートの回答をCSVとしてストリーミングで出力"""
+        survey = self.get_object(request, object_id)
+        if survey is None or not self.has_view_permission(request, survey):
+            raise Http404
+        response = StreamingHttpResponse(
+            stream_responses_csv(survey.pk),
+            content_type='text/csv; charset=utf-8'
+        )
+        response['Content-Disposition'] = f'attachment; filename="survey_{survey.pk}_responses.csv"'
+        return response
+
+    def export_npz_view(self, request, object_id):
+        """
+        アンケートの回答を分析用の .npz ファイルとして出力
+
+        一時ファイルに書き出してから、ファイルのままレスポンスとして返します。
+        """
+        survey = self.get_object(request, object_id)
+        if survey is None or not self.has_view_permission(request, survey):
+            raise Http404
+        file = tempfile.TemporaryFile()
+        try:
+            write_response_matrix(file, survey.pk, include_user_fields=True)
+        except ImportError as e:
+            file.close()
+            self.message_user(request, str(e), messages.ERROR)
+            return redirect('admin:survey_survey_changelist')
+        file.seek(0)
+        return FileResponse(
+            file, as_attachment=True, filename=f'survey_{survey.pk}_responses.npz'
+        )
+
+    @admin.action(description='選択したアンケートの回答をCSVで出力')
+    def export_responses_csv(self, request, queryset):
+        """回答CSVの出力（アンケートを1件だけ選択した場合のみ）"""
+        if queryset.count() != 1:
+            self.message_user(request, 'CSVを出力するアンケートを1件だけ選択してください。', messages.WARNING)
+            return None
+        return self.export_csv_view(request, str(queryset.get().pk))
 
-@admin.register(Answer)
+    @admin.action(description='選択したアンケートを複製', permissions=['add'])
+    def duplicate_surveys(self, request, queryset):
+        """
+        選択したアンケートを質問・選択肢ごと複製
+
+        確認画面で公開期間をずらす日数とタイトルの末尾を指定します。
+        何件選択しても、複製は階層ごとの一括登録で行います。
+        """
+        form = SurveyDuplicateForm(request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            surveys = clone_surveys(
+                queryset.order_by('id'),
+                date_shift=timedelta(days=form.cleaned_data['shift_days']),
+                title_suffix=form.cleaned_data['title_suffix'],
+            )
+            self.message_user(request, f'{len(surveys)}件のアンケートを複製しました。', messages.SUCCESS)
+            return None
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'アンケートの複製',
+            'opts': self.model._meta,
+            'form': form,
+            'queryset': queryset,
+            'action_checkbox_name': ACTION_CHECKBOX_NAME,
+            'select_across': request.POST.get('select_across', '0'),
+        }
+        return TemplateResponse(request, 'admin/survey/survey/duplicate.html', context)
+
+    @admin.action(description='選択したアンケートの定義をJSONで出力')
+    def export_definitions_json(self, request, queryset):
+        """アンケート・質問・選択肢の定義をJSONとしてストリーミングで出力"""
+        response = StreamingHttpResponse(
+            stream_surveys_json(queryset), content_type='application/json; charset=utf-8'
+        )
+        response['Content-Disposition'] = 'attachment; filename="surveys.json"'
+        return response
+
+    @admin.action(description='選択したアンケートの定義をCSVで出力')
+    def export_definitions_csv(self, request, queryset):
+        """アンケート・質問・選択肢の定義をCSVとしてストリーミングで出力"""
+        response = StreamingHttpResponse(
+            stream_surveys_csv(queryset), content_type='text/csv; charset=utf-8'
+        )
+        response['Content-Disposition'] = 'attachment; filename="surveys.csv"'
+        return response
+
+    def import_view(self, request):
+        """
+        アンケート定義をJSON・CSVからインポート
+
+        ファイル全体を検証し、エラーがなければ1つのトランザクションで一括登録します。
+        """
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        errors = []
+        form = SurveyImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            uploaded_file = form.cleaned_data['file']
+            file_format = 'json' if uploaded_file.name.lower().endswith('.json') else 'csv'
+            try:
+                surveys = import_surveys(open_upload(uploaded_file), file_format)
+            except SurveyImportError as e:
+                errors = e.errors
+            else:
+                self.message_user(request, f'{len(surveys)}件のアンケートを登録しました。', messages.SUCCESS)
+                return redirect('admin:survey_survey_changelist')
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'アンケート定義のインポート',
+            'opts': self.model._meta,
+            'form': form,
+            'errors': errors,
+        }
+        return TemplateResponse(request, 'admin/survey/survey/import.html', context)
+
+    def reorder_questions_view(self, request, object_id):
+        """
+        アンケートの質問の並び順をまとめて更新
+
+        POST のJSON {"ids": [質問ID, ...]} でアンケートの全ての質問の新しい順序を受け取ります。
+        """
+        survey = self.get_object(request, object_id)
+        if survey is None:
+            raise Http404
+        if not self.has_change_permission(request, survey):
+            raise PermissionDenied
+        return reorder_response(request, lambda ids: reorder_questions(survey.pk, ids))
+
+    def reorder_choices_view(self, request, object_id, question_id):
+        """
+        質問の選択肢の並び順をまとめて更新
+
+        POST のJSON {"ids": [選択肢ID, ...]} で質問の全ての選択肢の新しい順序を受け取ります。
+        """
+        survey = self.get_object(request, object_id)
+        if survey is None:
+            raise Http404
+        if not self.has_change_permission(request, survey):
+            raise PermissionDenied
+        question = survey.questions.filter(pk=question_id).first()
+        if question is None:
+            raise Http404
+        return reorder_response(request, lambda ids: reorder_choices(question, ids))
+
+    def results_view(self, request, object_id):
+        """
+        アンケートの集計結果を表示
+
+        回答データは読まず、集計テーブルのみを参照します。
+        """
+        survey = self.get_object(request, object_id)
+        if survey is None or not self.has_view_permission(request, survey):
+            raise Http404
+        respondent_count, results = get_survey_results(survey.pk)
+        context = {
+            **self.admin_site.each_context(request),
+            'title': f'{survey.title} の集計結果',
+            'opts': self.model._meta,
+            'original': survey,
+            'respondent_count': respondent_count,
+            'results': results,
+        }
+        return TemplateResponse(request, 'admin/survey/survey/results.html', context)
+
+    def analytics_view(self, request, object_id):
+        """
+        選択式の質問のクロス集計・同時選択・属性別集計を表示
+
+        集計する質問と属性はGETパラメータ（row, column, cooccurrence, segment）で指定します。
+        """
+        survey = self.get_object(request, object_id)
+        if survey is None or not self.has_view_permission(request, survey):
+            raise Http404
+
+        def question_param(name):
+            value = request.GET.get(name, '')
+            # isdigit() は '²' などの非ASCIIの数字も True になり int() で失敗するため ASCII に限定する
+            return int(value) if value.isascii() and value.isdigit() else None
+
+        selected = {
+            'row': question_param('row'),
+            'column': question_param('column'),
+            'cooccurrence': question_param('cooccurrence'),
+            'segment': request.GET.get('segment', ''),
+        }
+        questions = [
+            question for question in get_survey_definition(survey.pk).questions
+            if question.is_choice
+        ]
+        try:
+            report = build_report(
+                survey.pk,
+                row_question_id=selected['row'],
+                column_question_id=selected['column'],
+                cooccurrence_question_id=selected['cooccurrence'],
+                segment_field=selected['segment'],
+            )
+        except ImportError as e:
+            self.message_user(request, str(e), messages.ERROR)
+            return redirect('admin:survey_survey_changelist')
+        context = {
+            **self.admin_site.each_context(request),
+            'title': f'{survey.title} のクロス集計',
+            'opts': self.model._meta,
+            'original': survey,
+            'questions': questions,
+            'checkbox_questions': [
+                question for question in questions if question.question_type == 'checkbox'
+            ],
+            'segment_fields': SEGMENT_FIELDS.items(),
+            'selected': selected,
+            'report': report,
+        }
+        return TemplateResponse(request, 'admin/survey/survey/analytics.html', context)
+
+class PrecountedPaginator(Paginator):
+    """件数を事前に計算済みの値で与えられるページネーター（未指定の場合はCOUNTクエリ）"""
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, count=None):
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page)
+        if count is not None:
+            self.count = count
+
+
+class RespondentEmailFilter(admin.SimpleListFilter):
+    """
+    回答者のメールアドレスでの絞り込み
+
+    全ユーザーを一覧表示せず、入力されたメールアドレスに完全一致する回答者で絞り込みます。
+    """
+    title = '回答者'
+    parameter_name = 'email'
+    template = 'admin/survey/input_filter.html'
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        yield {
+            'parameter_name': self.parameter_name,
+            'value': self.value() or '',
+            'hidden_params': [
+                (key, value) for key, value in changelist.params.items()
+                if key != self.parameter_name
+            ],
+            'clear_query_string': changelist.get_query_string(remove=[self.parameter_name]),
+        }
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(user__email=self.value().strip())
+        return queryset
+
+
+class CompletedMonthFilter(admin.SimpleListFilter):
+    """
+    回答月での絞り込み
+
+    回答日時の最小値・最大値（インデックスのみで求まる）から月の一覧を作るため、
+    回答数が増えても DISTINCT による日付の集計は行いません。
+    """
+    title = '回答月'
+    parameter_name = 'completed_month'
+
+    def lookups(self, request, model_admin):
+        bounds = SurveyResponse.objects.aggregate(first=Min('completed_at'), last=Max('completed_at'))
+        if bounds['first'] is None:
+            return ()
+        first = timezone.localtime(bounds['first'])
+        last = timezone.localtime(bounds['last'])
+        months = []
+        year, month = last.year, last.month
+        while (year, month) >= (first.year, first.month):
+            months.append((f'{year}-{month:02d}', f'{year}年{month}月'))
+            year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+        return months
+
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+        try:
+            start = datetime.strptime(self.value(), '%Y-%m')
+        except ValueError:
+            return queryset.none()
+        end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+        return queryset.filter(
+            completed_at__gte=timezone.make_aware(start),
+            completed_at__lt=timezone.make_aware(end),
+        )
+
+@admin.register(SurveyResponse)
 class AnswerAdmin(admin.ModelAdmin):
-    """回答管理画面の設定"""
+    """回答管理画面の設定
+
+    回答レコード（SurveyResponse）を1行として、1回の回答（提出）ごとに表示します。
+    回答が大量にある場合でも一覧表示のクエリが増えないよう、
+    件数は集計テーブルから求め、絞り込みの候補はDBを走査せずに作ります。
+    ただし集計テーブルの件数を使うのは、絞り込みがない（またはアンケートのみの）場合で、
+    回答のある全ての対象アンケートに集計行がある場合に限ります（それ以外はCOUNTクエリ）。
+    """
     list_display = ('survey_title', 'user_full_name', 'user_email', 'answer_date')
-    list_filter = ('question__survey', 'user', 'created_at')
-    search_fields = ('question__survey__title', 'user__email', 'text')
+    list_filter = ('survey', RespondentEmailFilter, CompletedMonthFilter)
+    search_fields = ('survey__title', 'user__email')
     readonly_fields = (
         'survey_title', 'user_full_name', 'user_email',
-        'created_at', 'updated_at', 'all_answers'
+        'completed_at', 'all_answers'
     )
-    date_hierarchy = 'created_at'
+    paginator = PrecountedPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
 
     fieldsets = (
         ('回答者情報', {
@@ -80,29 +513,69 @@ class AnswerAdmin(admin.ModelAdmin):
             'fields': ('survey_title', 'all_answers')
         }),
         ('システム情報', {
-            'fields': ('created_at', 'updated_at'),
+            'fields': ('completed_at',),
             'classes': ('collapse',)
         }),
     )
 
     def get_queryset(self, request):
-        """アンケートごとに最初の回答のみを表示"""
+        """アンケートとユーザーを結合して取得"""
         return super().get_queryset(request).select_related(
-            'question__survey',
+            'survey',
             'user'
-        ).filter(
-            question__order=1
-        ).order_by(
-            'question__survey',
-            'user',
-            '-created_at'
         )
 
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        """
+        絞り込みなし、またはアンケートでの絞り込みのみの場合は
+        集計テーブルの回答者数を件数として使う（集計を確認できない場合はCOUNTクエリ）
+        """
+        params = set(request.GET) - {'p', 'o'}
+        count = None
+        if not params:
+            count = self.tally_count(Survey.objects.all())
+        elif params == {'survey__id__exact'}:
+            survey_id = request.GET['survey__id__exact']
+            if survey_id.isascii() and survey_id.isdigit():
+                count = self.tally_count(Survey.objects.filter(pk=survey_id))
+        return self.paginator(queryset, per_page, orphans, allow_empty_first_page, count=count)
+
+    def tally_count(self, surveys):
+        """
+        アンケートの集計テーブルの回答者数の合計を返す
+
+        回答があるのに集計行がない（集計の作成前の）アンケートが含まれる場合は、
+        集計テーブルの件数を信頼できないため None を返します。
+        """
+        unbuilt = surveys.filter(
+            Exists(SurveyResponse.objects.filter(survey_id=OuterRef('pk'))),
+            ~Exists(SurveyTally.objects.filter(survey_id=OuterRef('pk'))),
+        )
+        if unbuilt.exists():
+            return None
+        return SurveyTally.objects.filter(
+            survey__in=surveys
+        ).aggregate(total=Sum('respondent_count'))['total'] or 0
+
+    def get_search_results(self, request, queryset, search_term):
+        """アンケート・ユーザーに加えて回答内容でも検索"""
+        queryset, may_have_duplicates = super().get_search_results(
+            request, queryset, search_term
+        )
+        if search_term:
+            matching_answers = Answer.objects.filter(
+                user_id=OuterRef('user_id'),
+                question__survey_id=OuterRef('survey_id'),
+                text__icontains=search_term
+            )
+            queryset |= self.get_queryset(request).filter(Exists(matching_answers))
+        return queryset, may_have_duplicates
+
     def survey_title(self, obj):
         """アンケートのタイトルを表示"""
-        return obj.question.survey.title
+        return obj.survey.title
     survey_title.short_description = 'アンケート'
-    survey_title.admin_order_field = 'question__survey__title'
+    survey_title.admin_order_field = 'survey__title'
 
     def user_full_name(self, obj):
         """回答者の氏名を表示"""
@@ -118,34 +591,32 @@ class AnswerAdmin(admin.ModelAdmin):
 
     def answer_date(self, obj):
         """回答日時を表示"""
-        return obj.created_at
+        return obj.completed_at
     answer_date.short_description = '回答日'
-    answer_date.admin_order_field = 'created_at'
+    answer_date.admin_order_field = 'completed_at'
 
     def all_answers(self, obj):
-        """ユーザーの全回答を表示"""
-        survey = obj.question.survey
-        user = obj.user
+        """ユーザーの全回答を表示（選択肢はまとめて取得）"""
         answers = Answer.objects.filter(
-            question__survey=survey,
-            user=user
-        ).select_related('question').order_by('question__order')
-
-        html = ['<table class="table">']
-        html.append('<thead><tr><th>質問</th><th>回答</th></tr></thead>')
-        html.append('<tbody>')
+            question__survey_id=obj.survey_id,
+            user_id=obj.user_id
+        ).select_related('question').prefetch_related(
+            Prefetch('choices', queryset=QuestionChoice.objects.order_by('order'))
+        ).order_by('question__order')
 
+        rows = []
         for answer in answers:
-            question_text = answer.question.text
             if answer.question.question_type in ['radio', 'checkbox', 'select']:
                 answer_text = ', '.join([choice.text for choice in answer.choices.all()])
             else:
                 answer_text = answer.text
+            rows.append((answer.question.text, answer_text))
 
-            html.append(f'<tr><td>{question_text}</td><td>{answer_text}</td></tr>')
-
-        html.append('</tbody></table>')
-        return mark_safe(''.join(html))
+        return format_html(
+            '<table class="table"><thead><tr><th>質問</th><th>回答</th></tr></thead>'
+            '<tbody>{}</tbody></table>',
+            format_html_join('', '<tr><td>{}</td><td>{}</td></tr>', rows)
+        )
     all_answers.short_description = '回答内容'
 
     def has_add_permission(self, request):
@@ -160,40 +631,66 @@ class AnswerAdmin(admin.ModelAdmin):
         """
         回答を削除する際に、同じユーザーの同じアンケートの全ての回答を削除
         """
-        survey = obj.question.survey
-        user = obj.user
-        Answer.objects.filter(
-            question__survey=survey,
-            user=user
-        ).delete()
+        deleted = delete_responses(SurveyResponse.objects.filter(pk=obj.pk))
+        invalidate_answered_surveys(deleted.user_ids)
 
     def delete_queryset(self, request, queryset):
         """
-        複数の回答を一括削除する際に、関連する全ての回答も削除
+        複数の回答を一括削除する際に、関連する全ての回答も集合演算でまとめて削除
         """
-        processed_pairs = set()  # (survey_id, user_id) のペアを記録
-
-        for obj in queryset:
-            pair = (obj.question.survey_id, obj.user_id)
-            if pair not in processed_pairs:
-                Answer.objects.filter(
-                    question__survey=obj.question.survey,
-                    user=obj.user
-                ).delete()
-                processed_pairs.add(pair)
+        deleted = delete_responses(queryset)
+        invalidate_answered_surveys(deleted.user_ids)
+        self.message_user(
+            request,
+            f'回答レコード{deleted.responses}件、回答{deleted.answers}件、'
+            f'選択肢の選択{deleted.selections}件を削除しました。',
+            messages.SUCCESS
+        )
 
 @admin.register(SurveyCategory)
 class SurveyCategoryAdmin(admin.ModelAdmin):
-    """アンケートカテゴリー管理画面の設定"""
+    """アンケートカテゴリー管理画面の設定
+
+    一覧画面では行のドラッグ&ドロップで並べ替え、全体の新しい順序を reorder_view に送信します。
+    """
     list_display = ('name', 'order', 'created_at')
     search_fields = ('name', 'description')
     ordering = ['order', 'name']
+    change_list_template = 'admin/survey/surveycategory/change_list.html'
+
+    class Media:
+        js = ('js/category_reorder.js',)
+
+    def get_exclude(self, request, obj=None):
+        """新規作成時は表示順を入力させない（保存時に末尾の表示順を採番する）"""
+        if obj is None:
+            return ('order',)
+        return super().get_exclude(request, obj)
 
-    def get_form(self, request, obj=None, **kwargs):
-        form = super().get_form(request, obj, **kwargs)
-        if obj is None:  # 新規作成時のみ
-            max_order = SurveyCategory.objects.aggregate(Max('order'))['order__max']
-            form.base_fields['order'].initial = (max_order or 0) + 1
-        return form
+    def get_urls(self):
+        """並べ替えのURLを追加"""
+        urls = [
+            path(
+                'reorder/',
+                self.admin_site.admin_view(self.reorder_view),
+                name='survey_surveycategory_reorder'
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def changelist_view(self, request, extra_context=None):
+        """変更権限がある場合のみ、一覧画面で並べ替えを有効にする"""
+        extra_context = {**(extra_context or {}), 'can_reorder': self.has_change_permission(request)}
+        return super().changelist_view(request, extra_context)
+
+    def reorder_view(self, request):
+        """
+        カテゴリーの並び順をまとめて更新
+
+        POST のJSON {"ids": [カテゴリーID, ...]} で全てのカテゴリーの新しい順序を受け取ります。
+        """
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        return reorder_response(request, reorder_categories)
 
 admin.site.register(Survey, SurveyAdmin)
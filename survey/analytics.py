@@ -0,0 +1,210 @@
+"""
+選択式の質問の集計分析
+
+アンケートの選択結果を「回答者 × 選択肢」の真偽値の行列として読み込み、
+クロス集計・チェックボックスの同時選択・回答者属性ごとの集計を
+行列演算でまとめて計算します。NumPy は任意の依存パッケージです。
+
+計算結果はアンケート定義のバージョンと回答の件数をキーにキャッシュされるため、
+質問や回答が変わらない限り再計算されません。
+"""
+
+from dataclasses import dataclass
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Count, Max
+from .definitions import get_definition_version, get_survey_definition
+from .matrix import import_numpy
+from .models import Answer, SurveyResponse
+
+ANALYTICS_KEY = 'survey:analytics:{survey_id}:{version}:{responses}:{name}'
+ANALYTICS_TIMEOUT = 60 * 60
+ANALYTICS_CHUNK_SIZE = 20000
+
+SEGMENT_FIELDS = {
+    'organization_name': '団体名',
+    'booth_name': 'ブース名',
+}
+
+
+@dataclass
+class ChoiceMatrix:
+    """回答者 × 選択肢の選択結果"""
+    user_ids: object
+    matrix: object
+    questions: dict
+    column_slices: dict
+
+    def question_columns(self, question_id):
+        """質問の選択肢に対応する列を取り出す"""
+        return self.matrix[:, self.column_slices[question_id]]
+
+
+def load_choice_matrix(survey_id, chunk_size=ANALYTICS_CHUNK_SIZE):
+    """
+    選択式の質問の回答を真偽値の行列として読み込む
+
+    列は質問の表示順・選択肢の表示順に並びます。
+    選択結果は中間テーブルからIDのキーセット順にチャンク単位で読み込みます。
+    """
+    np = import_numpy()
+    definition = get_survey_definition(survey_id)
+
+    user_ids = np.fromiter(
+        SurveyResponse.objects.filter(survey_id=survey_id).order_by('id').values_list(
+            'user_id', flat=True
+        ).iterator(chunk_size=chunk_size),
+        dtype=np.int64
+    )
+    row_index = {int(user_id): index for index, user_id in enumerate(user_ids)}
+
+    questions = {}
+    column_slices = {}
+    column_index = {}
+    offset = 0
+    for question in definition.questions:
+        if not question.is_choice:
+            continue
+        questions[question.id] = question
+        column_slices[question.id] = slice(offset, offset + len(question.choices))
+        for choice in question.choices:
+            column_index[choice.id] = offset
+            offset += 1
+
+    matrix = np.zeros((len(user_ids), offset), dtype=bool)
+    through_model = Answer.choices.through
+    last_id = 0
+    while True:
+        rows = list(through_model.objects.filter(
+            answer__question__survey_id=survey_id, id__gt=last_id
+        ).order_by('id').values_list('id', 'answer__user_id', 'questionchoice_id')[:chunk_size])
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        pairs = np.array([
+            (row_index[user_id], column_index[choice_id])
+            for _id, user_id, choice_id in rows
+            if user_id in row_index and choice_id in column_index
+        ], dtype=np.int64).reshape(-1, 2)
+        matrix[pairs[:, 0], pairs[:, 1]] = True
+
+    return ChoiceMatrix(
+        user_ids=user_ids,
+        matrix=matrix,
+        questions=questions,
+        column_slices=column_slices,
+    )
+
+
+def crosstab(choice_matrix, row_question_id, column_question_id):
+    """2つの質問のクロス集計（行の選択肢 × 列の選択肢の回答者数）"""
+    rows = choice_matrix.question_columns(row_question_id).astype(int)
+    columns = choice_matrix.question_columns(column_question_id).astype(int)
+    return rows.T @ columns
+
+
+def cooccurrence(choice_matrix, question_id):
+    """チェックボックスの選択肢どうしが同時に選ばれた回答者数"""
+    columns = choice_matrix.question_columns(question_id).astype(int)
+    return columns.T @ columns
+
+
+def segment_counts(choice_matrix, segment_values):
+    """
+    回答者の属性値ごとの選択数
+
+    Args:
+        segment_values (list): 回答者（行）ごとの属性値
+
+    Returns:
+        tuple: (属性値の配列, 属性値 × 選択肢の回答者数, 属性値ごとの回答者数)
+    """
+    np = import_numpy()
+    segments, inverse = np.unique(np.array(segment_values, dtype=str), return_inverse=True)
+    one_hot = np.zeros((len(choice_matrix.user_ids), len(segments)), dtype=int)
+    one_hot[np.arange(len(inverse)), inverse] = 1
+    return segments, one_hot.T @ choice_matrix.matrix.astype(int), one_hot.sum(axis=0)
+
+
+def load_segment_values(choice_matrix, field):
+    """回答者（行）ごとのユーザー属性値を読み込む（未入力は空文字）"""
+    if field not in SEGMENT_FIELDS:
+        raise ValueError(f'集計できない属性です: {field}')
+    user_ids = choice_matrix.user_ids.tolist()
+    values = {}
+    for start in range(0, len(user_ids), ANALYTICS_CHUNK_SIZE):
+        values.update(get_user_model().objects.filter(
+            id__in=user_ids[start:start + ANALYTICS_CHUNK_SIZE]
+        ).values_list('id', field))
+    return [values.get(user_id) or '' for user_id in user_ids]
+
+
+def _analytics_key(survey_id, name):
+    """アンケート定義のバージョンと回答の件数・最終IDを含むキャッシュキー"""
+    responses = SurveyResponse.objects.filter(survey_id=survey_id).aggregate(
+        count=Count('id'), last_id=Max('id')
+    )
+    return ANALYTICS_KEY.format(
+        survey_id=survey_id,
+        version=get_definition_version(survey_id),
+        responses=f"{responses['count']}-{responses['last_id']}",
+        name=name,
+    )
+
+
+def build_report(survey_id, row_question_id=None, column_question_id=None,
+                 cooccurrence_question_id=None, segment_field=None):
+    """
+    管理画面の分析ページ用の集計結果を組み立てる（キャッシュ付き）
+
+    指定された質問・属性についてのみ計算し、結果は選択肢の文字列と
+    回答者数のリストに変換してキャッシュします。
+    """
+    name = f'{row_question_id}:{column_question_id}:{cooccurrence_question_id}:{segment_field}'
+    key = _analytics_key(survey_id, name)
+    report = cache.get(key)
+    if report is not None:
+        return report
+
+    choice_matrix = load_choice_matrix(survey_id)
+    report = {'respondent_count': len(choice_matrix.user_ids)}
+
+    def labels(question_id):
+        return [choice.text for choice in choice_matrix.questions[question_id].choices]
+
+    if row_question_id in choice_matrix.questions and column_question_id in choice_matrix.questions:
+        table = crosstab(choice_matrix, row_question_id, column_question_id)
+        report['crosstab'] = {
+            'row_question': choice_matrix.questions[row_question_id].text,
+            'column_question': choice_matrix.questions[column_question_id].text,
+            'columns': labels(column_question_id),
+            'rows': list(zip(labels(row_question_id), table.tolist())),
+        }
+
+    question = choice_matrix.questions.get(cooccurrence_question_id)
+    if question is not None and question.question_type == 'checkbox':
+        table = cooccurrence(choice_matrix, cooccurrence_question_id)
+        report['cooccurrence'] = {
+            'question': question.text,
+            'columns': labels(cooccurrence_question_id),
+            'rows': list(zip(labels(cooccurrence_question_id), table.tolist())),
+        }
+
+    if segment_field in SEGMENT_FIELDS:
+        segments, table, sizes = segment_counts(
+            choice_matrix, load_segment_values(choice_matrix, segment_field)
+        )
+        report['segments'] = {
+            'field': SEGMENT_FIELDS[segment_field],
+            'questions': [
+                (question.text, labels(question_id), len(question.choices))
+                for question_id, question in choice_matrix.questions.items()
+            ],
+            'rows': [
+                (segment or '（未入力）', size, counts)
+                for segment, size, counts in zip(segments.tolist(), sizes.tolist(), table.tolist())
+            ],
+        }
+
+    cache.set(key, report, ANALYTICS_TIMEOUT)
+    return report
@@ -0,0 +1,135 @@
+"""
+アンケート定義の一括登録
+
+アンケート・質問・選択肢を階層ごとに1回ずつの bulk_create で登録します。
+インポートや複製のように多数の質問・選択肢をまとめて作成する処理で使用し、
+1件ずつ保存する場合と違ってクエリ数が質問数・選択肢数に比例しません。
+
+bulk_create ではモデルのシグナルが送信されないため、
+登録後にキャッシュのバージョンを明示的に更新します。
+"""
+
+from dataclasses import dataclass, field
+from datetime import timedelta
+from django.db import transaction
+from .cache import bump_navigation_version
+from .definitions import bump_definition_version
+from .models import Question, QuestionChoice, Survey
+from .pagecache import bump_listing_version
+
+BULK_BATCH_SIZE = 500
+
+
+@dataclass
+class QuestionTree:
+    """未保存の質問とその選択肢"""
+    question: Question
+    choices: list = field(default_factory=list)
+
+
+@dataclass
+class SurveyTree:
+    """未保存のアンケートとその質問"""
+    survey: Survey
+    questions: list = field(default_factory=list)
+
+
+def bulk_create_surveys(trees, batch_size=BULK_BATCH_SIZE):
+    """
+    アンケート・質問・選択肢を階層ごとにまとめて登録する
+
+    先に登録した階層で採番されたIDを、次の階層の外部キーに割り当てます。
+    呼び出し元がトランザクション内でない場合は、全体を1つのトランザクションで実行します。
+
+    Args:
+        trees (list): SurveyTree のリスト
+
+    Returns:
+        list: 登録したアンケート
+    """
+    with transaction.atomic():
+        surveys = Survey.objects.bulk_create(
+            [tree.survey for tree in trees], batch_size=batch_size
+        )
+
+        questions = []
+        for tree in trees:
+            for question_tree in tree.questions:
+                question_tree.question.survey_id = tree.survey.id
+                questions.append(question_tree.question)
+        Question.objects.bulk_create(questions, batch_size=batch_size)
+
+        choices = []
+        for tree in trees:
+            for question_tree in tree.questions:
+                for choice in question_tree.choices:
+                    choice.question_id = question_tree.question.id
+                    choices.append(choice)
+        QuestionChoice.objects.bulk_create(choices, batch_size=batch_size)
+
+        transaction.on_commit(lambda: _bump_versions([survey.id for survey in surveys]))
+    return surveys
+
+
+def _bump_versions(survey_ids):
+    """登録したアンケートの定義と一覧ページ・ナビゲーションのキャッシュを更新"""
+    for survey_id in survey_ids:
+        bump_definition_version(survey_id)
+    bump_listing_version()
+    bump_navigation_version()
+
+
+def clone_surveys(surveys, date_shift=timedelta(0), title_suffix=''):
+    """
+    アンケートを質問・選択肢ごと複製する
+
+    質問と選択肢をそれぞれ1回のクエリで読み込み、bulk_create_surveys で
+    階層ごとにまとめて登録します。表示順（order）はそのまま引き継ぎます。
+
+    Args:
+        surveys (iterable): 複製元のアンケート
+        date_shift (timedelta): 公開開始・終了日時をずらす期間
+        title_suffix (str): 複製したアンケートのタイトルの末尾に付ける文字列
+
+    Returns:
+        list: 複製したアンケート（複製元と同じ順序）
+    """
+    surveys = list(surveys)
+    survey_ids = [survey.id for survey in surveys]
+    questions_by_survey = {}
+    for question in Question.objects.filter(survey_id__in=survey_ids).order_by('survey_id', 'order', 'id'):
+        questions_by_survey.setdefault(question.survey_id, []).append(question)
+    choices_by_question = {}
+    for choice in QuestionChoice.objects.filter(
+        question__survey_id__in=survey_ids
+    ).order_by('question_id', 'order', 'id'):
+        choices_by_question.setdefault(choice.question_id, []).append(choice)
+
+    trees = []
+    for survey in surveys:
+        trees.append(SurveyTree(
+            survey=Survey(
+                title=f'{survey.title}{title_suffix}'[:200],
+                category_id=survey.category_id,
+                description=survey.description,
+                summary=survey.summary,
+                start_date=survey.start_date + date_shift,
+                end_date=survey.end_date + date_shift,
+            ),
+            questions=[
+                QuestionTree(
+                    question=Question(
+                        text=question.text,
+                        question_type=question.question_type,
+                        order=question.order,
+                        is_required=question.is_required,
+                    ),
+                    choices=[
+                        QuestionChoice(text=choice.text, order=choice.order)
+                        for choice in choices_by_question.get(question.id, [])
+                    ],
+                )
+                for question in questions_by_survey.get(survey.id, [])
+            ],
+        ))
+    return bulk_create_surveys(trees)
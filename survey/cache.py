@@ -0,0 +1,101 @@
+"""
+アンケートのキャッシュ
+
+Djangoのキャッシュフレームワークを使用して、
+ページごとに繰り返し実行されるクエリの結果を保持します。
+"""
+
+import uuid
+from dataclasses import dataclass
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+from .models import SurveyCategory, SurveyResponse
+from .pagecache import seconds_until_window_change
+
+ANSWERED_SURVEYS_KEY = 'survey:answered:{user_id}'
+ANSWERED_SURVEYS_TIMEOUT = 60 * 60 * 24
+
+NAVIGATION_VERSION_KEY = 'survey:navigation-version'
+NAVIGATION_KEY = 'survey:navigation:{version}'
+
+
+@dataclass(frozen=True)
+class NavigationCategory:
+    """サイドバー・ホーム画面に表示するカテゴリー"""
+    id: int
+    name: str
+    open_survey_count: int
+
+
+def _answered_surveys_key(user_id):
+    return ANSWERED_SURVEYS_KEY.format(user_id=user_id)
+
+
+def get_answered_survey_ids(user):
+    """
+    ユーザーの回答済みアンケートIDの集合を取得
+
+    キャッシュにない場合は1回のクエリで再構築します。
+    """
+    key = _answered_surveys_key(user.pk)
+    survey_ids = cache.get(key)
+    if survey_ids is None:
+        survey_ids = frozenset(
+            SurveyResponse.objects.filter(user=user).values_list('survey_id', flat=True)
+        )
+        cache.set(key, survey_ids, ANSWERED_SURVEYS_TIMEOUT)
+    return survey_ids
+
+
+def invalidate_answered_surveys(user_ids):
+    """
+    回答の保存・削除時に対象ユーザーのキャッシュを破棄
+
+    キャッシュ済みの集合を取得して書き換えると、同時に保存された回答を上書きで失う
+    おそれがあるため、破棄して次回の参照時にDBから再構築します。
+    """
+    cache.delete_many([_answered_surveys_key(user_id) for user_id in set(user_ids)])
+
+
+def get_navigation_version():
+    """ナビゲーションの現在のバージョンを取得"""
+    version = cache.get(NAVIGATION_VERSION_KEY)
+    if version is None:
+        cache.add(NAVIGATION_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(NAVIGATION_VERSION_KEY)
+    return version
+
+
+def bump_navigation_version():
+    """ナビゲーションのバージョンを更新して、キャッシュ済みのデータを無効化"""
+    cache.set(NAVIGATION_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def get_navigation_categories():
+    """
+    表示順に並んだカテゴリーと公開中のアンケート数を取得
+
+    1回の集計クエリで取得し、次に公開期間が切り替わる時刻までキャッシュします。
+    """
+    key = NAVIGATION_KEY.format(version=get_navigation_version())
+    categories = cache.get(key)
+    if categories is None:
+        now = timezone.now()
+        categories = tuple(
+            NavigationCategory(
+                id=category.id,
+                name=category.name,
+                open_survey_count=category.open_survey_count,
+            )
+            for category in SurveyCategory.objects.annotate(
+                open_survey_count=Count('surveys', filter=Q(
+                    surveys__start_date__lte=now,
+                    surveys__end_date__gte=now
+                ))
+            ).order_by('order', 'name')
+        )
+        timeout = seconds_until_window_change(now)
+        if timeout > 0:
+            cache.set(key, categories, timeout)
+    return categories
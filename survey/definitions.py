@@ -0,0 +1,107 @@
+"""
+アンケート定義のキャッシュ
+
+アンケートの質問・選択肢を変更不可能な定義オブジェクトにまとめ、
+詳細画面の表示と回答の検証の両方で共有します。
+定義はバージョンキーとともにキャッシュされ、アンケート・質問・選択肢が
+変更されるとバージョンが更新されて古い定義は参照されなくなります。
+"""
+
+import uuid
+from dataclasses import dataclass
+from django.core.cache import cache
+from django.db.models import Prefetch
+from .models import Question, QuestionChoice
+
+CHOICE_QUESTION_TYPES = ('radio', 'checkbox', 'select')
+
+DEFINITION_VERSION_KEY = 'survey:definition-version:{survey_id}'
+DEFINITION_KEY = 'survey:definition:{survey_id}:{version}'
+DEFINITION_TIMEOUT = 60 * 60 * 24
+
+
+@dataclass(frozen=True)
+class ChoiceDefinition:
+    """選択肢の定義"""
+    id: int
+    text: str
+
+
+@dataclass(frozen=True)
+class QuestionDefinition:
+    """質問の定義"""
+    id: int
+    text: str
+    question_type: str
+    is_required: bool
+    choices: tuple
+    choice_ids: frozenset
+
+    @property
+    def is_choice(self):
+        """選択式の質問かどうか"""
+        return self.question_type in CHOICE_QUESTION_TYPES
+
+
+@dataclass(frozen=True)
+class SurveyDefinition:
+    """アンケートの定義（表示順に並んだ質問の一覧）"""
+    survey_id: int
+    version: str
+    questions: tuple
+
+
+def get_definition_version(survey_id):
+    """アンケート定義の現在のバージョンを取得"""
+    key = DEFINITION_VERSION_KEY.format(survey_id=survey_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_definition_version(survey_id):
+    """アンケート定義のバージョンを更新して、キャッシュ済みの定義を無効化"""
+    cache.set(DEFINITION_VERSION_KEY.format(survey_id=survey_id), uuid.uuid4().hex, None)
+
+
+def build_survey_definition(survey_id, version=''):
+    """質問と選択肢をプリフェッチしてアンケート定義を組み立てる"""
+    questions = Question.objects.filter(survey_id=survey_id).order_by('order').prefetch_related(
+        Prefetch('choices', queryset=QuestionChoice.objects.order_by('order'))
+    )
+    question_definitions = []
+    for question in questions:
+        choices = tuple(
+            ChoiceDefinition(id=choice.id, text=choice.text)
+            for choice in question.choices.all()
+        )
+        question_definitions.append(QuestionDefinition(
+            id=question.id,
+            text=question.text,
+            question_type=question.question_type,
+            is_required=question.is_required,
+            choices=choices,
+            choice_ids=frozenset(choice.id for choice in choices),
+        ))
+    return SurveyDefinition(
+        survey_id=survey_id,
+        version=version,
+        questions=tuple(question_definitions),
+    )
+
+
+def get_survey_definition(survey_id):
+    """
+    キャッシュからアンケート定義を取得
+
+    キャッシュにない場合は組み立ててから現在のバージョンで保存します。
+    """
+    version = get_definition_version(survey_id)
+    key = DEFINITION_KEY.format(survey_id=survey_id, version=version)
+    definition = cache.get(key)
+    if definition is None:
+        definition = build_survey_definition(survey_id, version)
+        cache.set(key, definition, DEFINITION_TIMEOUT)
+    return definition
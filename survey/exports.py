@@ -0,0 +1,112 @@
+"""
+回答データのエクスポート
+
+アンケートの回答を1回答者1行・1質問1列のCSVとしてストリーミングで出力します。
+回答レコードをIDのキーセット順にチャンク単位で読み込むため、
+回答者数が増えてもメモリ使用量は一定のままです。
+回答者が入力した値は、表計算ソフトで数式として実行されないようエスケープします。
+"""
+
+import csv
+from django.db.models import Prefetch
+from django.utils import timezone
+from .definitions import get_survey_definition
+from .models import Answer, QuestionChoice, SurveyResponse
+
+EXPORT_CHUNK_SIZE = 1000
+
+# 表計算ソフトが数式として解釈するセルの先頭文字
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class Echo:
+    """csv.writer の出力をそのまま返す疑似ファイル"""
+
+    def write(self, value):
+        return value
+
+
+def escape_csv_cell(value):
+    """数式として解釈される文字で始まる文字列の先頭に ' を付ける（CSVインジェクション対策）"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+
+def iter_response_chunks(survey_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    回答レコードをIDのキーセット順にチャンク単位で取得
+
+    Yields:
+        list: 回答レコード（ユーザーを結合済み）のリスト
+    """
+    last_id = 0
+    while True:
+        responses = list(
+            SurveyResponse.objects.filter(
+                survey_id=survey_id, id__gt=last_id
+            ).select_related('user').order_by('id')[:chunk_size]
+        )
+        if not responses:
+            return
+        yield responses
+        last_id = responses[-1].id
+
+
+def get_chunk_answers(survey_id, responses):
+    """
+    チャンク内の回答者の回答を選択肢とともに取得
+
+    Returns:
+        dict: {ユーザーID: {質問ID: Answer}}
+    """
+    answers = Answer.objects.filter(
+        question__survey_id=survey_id,
+        user_id__in=[response.user_id for response in responses]
+    ).prefetch_related(
+        Prefetch('choices', queryset=QuestionChoice.objects.order_by('order'))
+    )
+    answers_by_user = {}
+    for answer in answers:
+        answers_by_user.setdefault(answer.user_id, {})[answer.question_id] = answer
+    return answers_by_user
+
+
+def iter_response_rows(survey_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """CSVの行（ヘッダー行を含む）を順に返す"""
+    definition = get_survey_definition(survey_id)
+    yield ['回答者ID', '氏名', 'メールアドレス', '回答日時'] + [
+        question.text for question in definition.questions
+    ]
+
+    for responses in iter_response_chunks(survey_id, chunk_size):
+        answers_by_user = get_chunk_answers(survey_id, responses)
+        for response in responses:
+            user_answers = answers_by_user.get(response.user_id, {})
+            row = [
+                response.user_id,
+                response.user.full_name,
+                response.user.email,
+                timezone.localtime(response.completed_at).strftime('%Y-%m-%d %H:%M:%S'),
+            ]
+            for question in definition.questions:
+                answer = user_answers.get(question.id)
+                if answer is None:
+                    row.append('')
+                elif question.is_choice:
+                    row.append(', '.join(choice.text for choice in answer.choices.all()))
+                else:
+                    row.append(answer.text)
+            yield row
+
+
+def stream_responses_csv(survey_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    回答データをCSVとして1行ずつ返すジェネレーター
+
+    Excelで文字化けしないよう、先頭にBOMを出力します。
+    """
+    writer = csv.writer(Echo())
+    yield '\ufeff'
+    for row in iter_response_rows(survey_id, chunk_size):
+        yield writer.writerow([escape_csv_cell(value) for value in row])
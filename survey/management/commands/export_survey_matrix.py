@@ -0,0 +1,47 @@
+"""
+回答データを列指向の .npz ファイルに書き出すコマンド
+
+使い方:
+    python manage.py export_survey_matrix 1 responses.npz
+    python manage.py export_survey_matrix 1 responses.npz --include-user-fields --workers 4
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from survey.matrix import MATRIX_CHUNK_SIZE, write_response_matrix
+from survey.models import Survey
+
+
+class Command(BaseCommand):
+    help = 'アンケートの回答を分析用の .npz ファイルに書き出します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('survey_id', type=int, help='対象のアンケートID')
+        parser.add_argument('output', help='出力先のファイルパス（.npz）')
+        parser.add_argument(
+            '--include-user-fields', action='store_true',
+            help='回答者の属性（メールアドレス、氏名、団体名、ブース名）を含める'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=MATRIX_CHUNK_SIZE,
+            help='1回に読み込む回答者数'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='チャンクを並列に読み込むプロセス数'
+        )
+
+    def handle(self, *args, **options):
+        if not Survey.objects.filter(pk=options['survey_id']).exists():
+            raise CommandError(f'アンケート（ID: {options["survey_id"]}）が見つかりません。')
+        try:
+            with open(options['output'], 'wb') as file:
+                write_response_matrix(
+                    file,
+                    options['survey_id'],
+                    include_user_fields=options['include_user_fields'],
+                    chunk_size=options['chunk_size'],
+                    workers=options['workers'],
+                )
+        except ImportError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f'{options["output"]} に書き出しました。'))
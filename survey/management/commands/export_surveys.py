@@ -0,0 +1,40 @@
+"""
+アンケート定義（アンケート・質問・選択肢）を JSON または CSV でエクスポートするコマンド
+
+使い方:
+    python manage.py export_surveys surveys.json
+    python manage.py export_surveys surveys.csv --format csv --survey 1 --survey 2
+"""
+
+import os
+from django.core.management.base import BaseCommand, CommandError
+from survey.models import Survey
+from survey.transfer import stream_surveys_csv, stream_surveys_json
+
+
+class Command(BaseCommand):
+    help = 'アンケート定義を JSON または CSV に書き出します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='出力先のファイルパス（.json / .csv）')
+        parser.add_argument(
+            '--format', choices=['json', 'csv'],
+            help='ファイル形式（省略時は拡張子から判定）'
+        )
+        parser.add_argument(
+            '--survey', type=int, action='append', dest='survey_ids',
+            help='対象のアンケートID（複数指定可。省略時は全てのアンケート）'
+        )
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or os.path.splitext(options['output'])[1].lstrip('.').lower()
+        if file_format not in ('json', 'csv'):
+            raise CommandError('ファイル形式を --format json または --format csv で指定してください。')
+        surveys = Survey.objects.all()
+        if options['survey_ids']:
+            surveys = surveys.filter(pk__in=options['survey_ids'])
+        stream = stream_surveys_json if file_format == 'json' else stream_surveys_csv
+        with open(options['output'], 'w', encoding='utf-8', newline='') as file:
+            for chunk in stream(surveys):
+                file.write(chunk)
+        self.stdout.write(self.style.SUCCESS(f'{options["output"]} に書き出しました。'))
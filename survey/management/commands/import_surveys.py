@@ -0,0 +1,35 @@
+"""
+アンケート定義（アンケート・質問・選択肢）を JSON または CSV からインポートするコマンド
+
+使い方:
+    python manage.py import_surveys surveys.json
+    python manage.py import_surveys surveys.csv --format csv
+"""
+
+import os
+from django.core.management.base import BaseCommand, CommandError
+from survey.transfer import SurveyImportError, import_surveys
+
+
+class Command(BaseCommand):
+    help = 'アンケート定義を JSON または CSV からまとめて登録します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='読み込むファイルのパス（.json / .csv）')
+        parser.add_argument(
+            '--format', choices=['json', 'csv'],
+            help='ファイル形式（省略時は拡張子から判定）'
+        )
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or os.path.splitext(options['input'])[1].lstrip('.').lower()
+        if file_format not in ('json', 'csv'):
+            raise CommandError('ファイル形式を --format json または --format csv で指定してください。')
+        try:
+            with open(options['input'], encoding='utf-8-sig', newline='') as file:
+                surveys = import_surveys(file, file_format)
+        except OSError as e:
+            raise CommandError(str(e))
+        except SurveyImportError as e:
+            raise CommandError('インポートできませんでした。\n' + '\n'.join(e.errors))
+        self.stdout.write(self.style.SUCCESS(f'{len(surveys)}件のアンケートを登録しました。'))
@@ -0,0 +1,26 @@
+"""
+回答の集計を作り直すコマンド
+
+集計テーブルと回答データの不整合を修復するために使用します。
+
+使い方:
+    python manage.py rebuild_survey_tallies          # 全てのアンケート
+    python manage.py rebuild_survey_tallies 1 2 3    # 指定したアンケートのみ
+"""
+
+from django.core.management.base import BaseCommand
+from survey.models import Survey
+from survey.tallies import rebuild_tallies
+
+
+class Command(BaseCommand):
+    help = '回答データからアンケートの集計を作り直します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('survey_ids', nargs='*', type=int, help='対象のアンケートID（省略時は全て）')
+
+    def handle(self, *args, **options):
+        survey_ids = options['survey_ids'] or list(Survey.objects.values_list('id', flat=True))
+        for survey_id in survey_ids:
+            rebuild_tallies([survey_id])
+        self.stdout.write(self.style.SUCCESS(f'{len(survey_ids)}件のアンケートの集計を作り直しました。'))
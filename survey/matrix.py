@@ -0,0 +1,300 @@
+"""
+回答データの列指向エクスポート
+
+アンケートの回答を回答者ごとの行・質問ごとの列に並べた配列に変換し、
+NumPyの .npz 形式で保存します。
+
+- ラジオボタン・セレクトボックス: 選択肢の表示順の番号（int16、未回答は -1）
+- チェックボックス: 選択肢の表示順をビット位置とするビットマスク（uint64、65個以上は複数列）
+- テキスト: UTF-8のバイト列を連結した列（uint8）と、各行の開始位置の列（<列名>_offsets、行数+1 の int64）
+
+回答は回答者のチャンク単位で読み込んで列に変換し、.npz への書き出しでは
+チャンクごとに列の一時ファイルへ追記するため、全ての列をメモリに保持することはありません。
+回答者が多い場合はチャンクの読み込みをプロセスプールに分散できます。NumPy は任意の依存パッケージです。
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import shutil
+import tempfile
+import zipfile
+import django
+from django.db import connections
+from .definitions import get_survey_definition
+from .models import Answer, SurveyResponse
+
+MATRIX_CHUNK_SIZE = 5000
+
+USER_FIELDS = ('email', 'full_name', 'organization_name', 'booth_name')
+
+
+def import_numpy():
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError('回答データの列指向エクスポート・分析には NumPy が必要です。') from e
+    return numpy
+
+
+def _init_worker():
+    """ワーカープロセスの初期化（親プロセスのDB接続は引き継がない）"""
+    django.setup()
+    for connection in connections.all(initialized_only=True):
+        connection.close()
+
+
+def load_chunk(survey_id, user_ids):
+    """
+    チャンク内の回答者の回答を読み込む
+
+    プロセスプールでも実行できるよう、値のタプルのみを返します。
+
+    Returns:
+        tuple: ([(ユーザーID, 質問ID, 回答テキスト)], [(ユーザーID, 質問ID, 選択肢ID)])
+    """
+    answers = list(Answer.objects.filter(
+        question__survey_id=survey_id, user_id__in=user_ids
+    ).values_list('user_id', 'question_id', 'text').order_by())
+    selections = list(Answer.choices.through.objects.filter(
+        answer__question__survey_id=survey_id, answer__user_id__in=user_ids
+    ).values_list('answer__user_id', 'answer__question_id', 'questionchoice_id').order_by())
+    return answers, selections
+
+
+def decode_text_column(data, offsets):
+    """テキストの列（UTF-8のバイト列と開始位置）を文字列のリストに戻す"""
+    buffer = data.tobytes()
+    return [buffer[begin:end].decode() for begin, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+def _encode_texts(np, values):
+    """文字列のリストを UTF-8 のバイト列（uint8）と各行のバイト数（int64）に変換"""
+    encoded = [value.encode() for value in values]
+    return (
+        np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        np.array([len(value) for value in encoded], dtype=np.int64),
+    )
+
+
+def _iter_respondent_chunks(survey_id, chunk_size):
+    """回答レコードをID順のキーセットで chunk_size 件ずつ読み込む"""
+    last_id = 0
+    while True:
+        rows = list(SurveyResponse.objects.filter(
+            survey_id=survey_id, id__gt=last_id
+        ).order_by('id').values_list('id', 'user_id', 'completed_at')[:chunk_size])
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield [(user_id, completed_at) for _id, user_id, completed_at in rows]
+
+
+def _iter_loaded_chunks(survey_id, chunk_size, workers):
+    """回答者のチャンクとその回答を順番に返す（workers が2以上の場合は先読みして並列に読み込む）"""
+    respondent_chunks = _iter_respondent_chunks(survey_id, chunk_size)
+    if workers <= 1:
+        for rows in respondent_chunks:
+            yield rows, load_chunk(survey_id, [user_id for user_id, _ in rows])
+        return
+    for connection in connections.all(initialized_only=True):
+        connection.close()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        pending = deque()
+        for rows in respondent_chunks:
+            pending.append((rows, executor.submit(load_chunk, survey_id, [user_id for user_id, _ in rows])))
+            if len(pending) >= workers * 2:
+                rows, future = pending.popleft()
+                yield rows, future.result()
+        while pending:
+            rows, future = pending.popleft()
+            yield rows, future.result()
+
+
+def _static_columns(np, definition):
+    """回答者によらない列（質問と選択肢の一覧）"""
+    columns = {
+        'question_ids': np.array([question.id for question in definition.questions], dtype=np.int64),
+        'question_texts': np.array([question.text for question in definition.questions], dtype=str),
+        'question_types': np.array([question.question_type for question in definition.questions], dtype=str),
+    }
+    for question in definition.questions:
+        if question.is_choice:
+            columns[f'q{question.id}_choices'] = np.array(
+                [choice.text for choice in question.choices], dtype=str
+            )
+    return columns
+
+
+def _build_chunk(np, definition, survey_id, rows, loaded, include_user_fields):
+    """
+    1チャンク分の回答者の行を列に変換する
+
+    テキストの列は (バイト列, 各行のバイト数) のタプルで返します。
+    """
+    answers, selections = loaded
+    count = len(rows)
+    user_ids = np.array([user_id for user_id, _ in rows], dtype=np.int64)
+    row_index = {user_id: index for index, (user_id, _) in enumerate(rows)}
+
+    columns = {
+        'respondent_id': user_ids,
+        'completed_at': np.array([int(value.timestamp()) for _, value in rows], dtype='datetime64[s]'),
+    }
+    choice_positions = {}
+    text_columns = {}
+    for question in definition.questions:
+        key = f'q{question.id}'
+        if question.is_choice:
+            choice_positions[question.id] = {
+                choice.id: position for position, choice in enumerate(question.choices)
+            }
+            if question.question_type == 'checkbox':
+                words = max(1, -(-len(question.choices) // 64))
+                columns[key] = np.zeros((count, words), dtype=np.uint64)
+            else:
+                columns[key] = np.full(count, -1, dtype=np.int16)
+        else:
+            text_columns[question.id] = [''] * count
+
+    for user_id, question_id, text in answers:
+        if question_id in text_columns:
+            text_columns[question_id][row_index[user_id]] = text
+    for user_id, question_id, choice_id in selections:
+        position = choice_positions.get(question_id, {}).get(choice_id)
+        if position is None:
+            continue
+        column = columns[f'q{question_id}']
+        if column.ndim == 2:
+            column[row_index[user_id], position // 64] |= np.uint64(1 << (position % 64))
+        else:
+            column[row_index[user_id]] = position
+
+    for question_id, values in text_columns.items():
+        columns[f'q{question_id}'] = _encode_texts(np, values)
+
+    if include_user_fields:
+        user_values = {field: [''] * count for field in USER_FIELDS}
+        for user_id, *values in SurveyResponse.objects.filter(
+            survey_id=survey_id, user_id__in=list(row_index)
+        ).values_list('user_id', *[f'user__{field}' for field in USER_FIELDS]).order_by():
+            for field, value in zip(USER_FIELDS, values):
+                user_values[field][row_index[user_id]] = value or ''
+        for field, values in user_values.items():
+            columns[f'user_{field}'] = _encode_texts(np, values)
+
+    return columns
+
+
+def iter_matrix_chunks(survey_id, include_user_fields=False,
+                       chunk_size=MATRIX_CHUNK_SIZE, workers=1):
+    """
+    アンケートの回答を回答者のチャンクごとの列に変換して順番に返す
+
+    回答がない場合も列の型が分かるよう、空のチャンクを1つ返します。
+
+    Args:
+        survey_id (int): アンケートID
+        include_user_fields (bool): 回答者の属性（メールアドレス、氏名、団体名、ブース名）を含めるか
+        chunk_size (int): 1回に読み込む回答者数
+        workers (int): 2以上の場合はプロセスプールでチャンクを並列に読み込む
+
+    Yields:
+        dict: {列名: numpy.ndarray}（テキストの列は (バイト列, 各行のバイト数)）
+    """
+    np = import_numpy()
+    definition = get_survey_definition(survey_id)
+    empty = True
+    for rows, loaded in _iter_loaded_chunks(survey_id, chunk_size, workers):
+        empty = False
+        yield _build_chunk(np, definition, survey_id, rows, loaded, include_user_fields)
+    if empty:
+        yield _build_chunk(np, definition, survey_id, [], ([], []), include_user_fields)
+
+
+def build_response_matrix(survey_id, include_user_fields=False,
+                          chunk_size=MATRIX_CHUNK_SIZE, workers=1):
+    """
+    アンケートの回答を列ごとの配列に変換する（全ての列をメモリ上に作る）
+
+    大きなアンケートをファイルに出力する場合は write_response_matrix を使ってください。
+
+    Returns:
+        dict: {列名: numpy.ndarray}
+    """
+    np = import_numpy()
+    parts = {}
+    for chunk in iter_matrix_chunks(survey_id, include_user_fields, chunk_size, workers):
+        for name, value in chunk.items():
+            parts.setdefault(name, []).append(value)
+
+    columns = _static_columns(np, get_survey_definition(survey_id))
+    for name, values in parts.items():
+        if isinstance(values[0], tuple):
+            lengths = np.concatenate([length for _data, length in values])
+            columns[name] = np.concatenate([data for data, _length in values])
+            columns[f'{name}_offsets'] = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        else:
+            columns[name] = np.concatenate(values)
+    return columns
+
+
+class _ColumnSpool:
+    """書き出し中の列のデータを一時ファイルに追記する"""
+
+    def __init__(self, dtype, shape):
+        self.file = tempfile.TemporaryFile()
+        self.dtype = dtype
+        self.shape = shape
+        self.rows = 0
+
+    def append(self, np, array):
+        self.file.write(np.ascontiguousarray(array, dtype=self.dtype).tobytes())
+        self.rows += len(array)
+
+
+def write_response_matrix(file, survey_id, **kwargs):
+    """
+    アンケートの回答を .npz 形式で書き出す
+
+    チャンクごとに各列の一時ファイルへ追記し、最後に行数を確定した .npy のヘッダーを付けて
+    zip にまとめるため、メモリに保持するのは1チャンク分の列のみです。
+    """
+    np = import_numpy()
+    spools = {}
+
+    def spool(name, array):
+        if name not in spools:
+            spools[name] = _ColumnSpool(array.dtype, array.shape[1:])
+        spools[name].append(np, array)
+
+    try:
+        text_ends = {}
+        for chunk in iter_matrix_chunks(survey_id, **kwargs):
+            for name, value in chunk.items():
+                if isinstance(value, tuple):
+                    data, lengths = value
+                    if name not in text_ends:
+                        text_ends[name] = 0
+                        spool(f'{name}_offsets', np.zeros(1, dtype=np.int64))
+                    spool(name, data)
+                    spool(f'{name}_offsets', np.cumsum(lengths) + text_ends[name])
+                    text_ends[name] += int(lengths.sum())
+                else:
+                    spool(name, value)
+
+        with zipfile.ZipFile(file, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+            for name, array in _static_columns(np, get_survey_definition(survey_id)).items():
+                with archive.open(f'{name}.npy', 'w', force_zip64=True) as member:
+                    np.lib.format.write_array(member, array, allow_pickle=False)
+            for name, column in spools.items():
+                with archive.open(f'{name}.npy', 'w', force_zip64=True) as member:
+                    np.lib.format.write_array_header_1_0(member, {
+                        'descr': np.lib.format.dtype_to_descr(column.dtype),
+                        'fortran_order': False,
+                        'shape': (column.rows, *column.shape),
+                    })
+                    column.file.seek(0)
+                    shutil.copyfileobj(column.file, member)
+    finally:
+        for column in spools.values():
+            column.file.close()
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:50
+
+from django.db import migrations
+from django.db.models import Min
+
+
+def backfill_survey_responses(apps, schema_editor):
+    """既存の回答から (ユーザー, アンケート) ごとの回答レコードを作成"""
+    Answer = apps.get_model('survey', 'Answer')
+    SurveyResponse = apps.get_model('survey', 'SurveyResponse')
+
+    pairs = Answer.objects.values(
+        'user_id', 'question__survey_id'
+    ).annotate(completed_at=Min('created_at')).order_by()
+
+    batch = []
+    for pair in pairs.iterator(chunk_size=2000):
+        batch.append(SurveyResponse(
+            user_id=pair['user_id'],
+            survey_id=pair['question__survey_id'],
+            completed_at=pair['completed_at'],
+        ))
+        if len(batch) >= 2000:
+            SurveyResponse.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        SurveyResponse.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0002_surveyresponse'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_survey_responses, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0005_survey_window_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChoiceTally',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField(verbose_name='シャード')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='選択数')),
+                ('choice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tallies', to='survey.questionchoice', verbose_name='選択肢')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='choice_tallies', to='survey.question', verbose_name='質問')),
+            ],
+            options={
+                'verbose_name': '選択数の集計',
+                'verbose_name_plural': '選択数の集計',
+                'constraints': [models.UniqueConstraint(fields=('choice', 'shard'), name='unique_choice_tally_shard')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SurveyTally',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField(verbose_name='シャード')),
+                ('respondent_count', models.PositiveIntegerField(default=0, verbose_name='回答者数')),
+                ('survey', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tallies', to='survey.survey', verbose_name='アンケート')),
+            ],
+            options={
+                'verbose_name': '回答者数の集計',
+                'verbose_name_plural': '回答者数の集計',
+                'constraints': [models.UniqueConstraint(fields=('survey', 'shard'), name='unique_survey_tally_shard')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0006_tallies'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='surveyresponse',
+            index=models.Index(fields=['-completed_at'], name='response_completed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='surveyresponse',
+            index=models.Index(fields=['survey', '-completed_at'], name='response_survey_completed_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+def backfill_tallies(apps, schema_editor):
+    """既存の回答から回答者数・選択数の集計を作成（シャード0にまとめて登録）"""
+    Answer = apps.get_model('survey', 'Answer')
+    ChoiceTally = apps.get_model('survey', 'ChoiceTally')
+    SurveyResponse = apps.get_model('survey', 'SurveyResponse')
+    SurveyTally = apps.get_model('survey', 'SurveyTally')
+    through_model = Answer.choices.through
+
+    SurveyTally.objects.all().delete()
+    ChoiceTally.objects.all().delete()
+
+    SurveyTally.objects.bulk_create([
+        SurveyTally(survey_id=row['survey_id'], shard=0, respondent_count=row['count'])
+        for row in SurveyResponse.objects.values('survey_id').annotate(count=Count('id')).order_by()
+    ], batch_size=2000)
+    ChoiceTally.objects.bulk_create([
+        ChoiceTally(
+            question_id=row['questionchoice__question_id'],
+            choice_id=row['questionchoice_id'],
+            shard=0,
+            count=row['count'],
+        )
+        for row in through_model.objects.values(
+            'questionchoice_id', 'questionchoice__question_id'
+        ).annotate(count=Count('id')).order_by()
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0007_surveyresponse_completed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_tallies, migrations.RunPython.noop),
+    ]
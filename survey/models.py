@@ -7,6 +7,7 @@
 
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 class SurveyCategory(models.Model):
@@ -39,13 +40,38 @@ class SurveyCategory(models.Model):
     def save(self, *args, **kwargs):
         """保存時に表示順を自動設定"""
         if self._state.adding:  # 新規作成時のみ
-            # 現在の最大値を取得
-            max_order = SurveyCategory.objects.aggregate(
-                models.Max('order'))['order__max']
-            # None の場合は0、それ以外は最大値+1
-            self.order = (max_order or 0) + 1
+            from .ordering import next_order
+            # 最大値+1 を INSERT 文の中で採番（並行して登録されても値を読み違えない）
+            self.order = next_order(SurveyCategory.objects.all())
+            super().save(*args, **kwargs)
+            self.refresh_from_db(fields=['order'])
+            return
         super().save(*args, **kwargs)
 
+class SurveyQuerySet(models.QuerySet):
+    """公開期間によるアンケートの絞り込み"""
+
+    def open(self, now=None):
+        """公開中のアンケート"""
+        now = now or timezone.now()
+        return self.filter(start_date__lte=now, end_date__gte=now)
+
+    def upcoming(self, now=None):
+        """公開予定のアンケート"""
+        now = now or timezone.now()
+        return self.filter(start_date__gt=now)
+
+    def closed(self, now=None):
+        """公開が終了したアンケート"""
+        now = now or timezone.now()
+        return self.filter(end_date__lt=now)
+
+    def with_status(self, status, now=None):
+        """公開状態（open / upcoming / closed）で絞り込む（それ以外の場合はすべて）"""
+        if status in ('open', 'upcoming', 'closed'):
+            return getattr(self, status)(now)
+        return self
+
 class Survey(models.Model):
     """アンケートモデル"""
     title = models.CharField(
@@ -57,7 +83,9 @@ class Survey(models.Model):
         SurveyCategory,
         verbose_name=_('カテゴリー'),
         on_delete=models.PROTECT,
-        related_name='surveys'
+        related_name='surveys',
+        null=True,
+        blank=True
     )
     description = models.TextField(
         _('説明'),
@@ -73,14 +101,48 @@ class Survey(models.Model):
     created_at = models.DateTimeField(_('作成日時'), auto_now_add=True)
     updated_at = models.DateTimeField(_('更新日時'), auto_now=True)
 
+    objects = SurveyQuerySet.as_manager()
+
     class Meta:
         verbose_name = _('アンケート')
         verbose_name_plural = _('アンケート')
         ordering = ['-created_at']
+        indexes = [
+            # カテゴリー別一覧のキーセットページネーション用
+            models.Index(
+                fields=['category', '-created_at', '-id'],
+                name='survey_category_created_idx'
+            ),
+            # カテゴリー別一覧の公開状態での絞り込み用
+            models.Index(
+                fields=['category', 'start_date', 'end_date'],
+                name='survey_category_window_idx'
+            ),
+            # 公開中・公開予定のアンケートの絞り込み用
+            models.Index(
+                fields=['start_date', 'end_date'],
+                name='survey_window_idx'
+            ),
+            # 公開終了したアンケートの絞り込み用
+            models.Index(
+                fields=['end_date'],
+                name='survey_end_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
+    @property
+    def status(self):
+        """現在の公開状態（open / upcoming / closed）"""
+        now = timezone.now()
+        if self.start_date > now:
+            return 'upcoming'
+        if self.end_date < now:
+            return 'closed'
+        return 'open'
+
 class Question(models.Model):
     """質問モデル"""
     QUESTION_TYPES = (
@@ -192,3 +254,101 @@ class Answer(models.Model):
     def __str__(self):
         """モデルの文字列表現"""
         return f'{self.question.survey.title} - {self.user.email}の回答'
+
+class SurveyResponse(models.Model):
+    """アンケート回答（提出）モデル
+
+    ユーザーとアンケートの組み合わせごとに1件だけ作成され、
+    回答済みかどうかの判定や管理画面の一覧表示に使用します。
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name=_('回答者'),
+        on_delete=models.CASCADE,
+        related_name='survey_responses'
+    )
+    survey = models.ForeignKey(
+        Survey,
+        verbose_name=_('アンケート'),
+        on_delete=models.CASCADE,
+        related_name='responses'
+    )
+    completed_at = models.DateTimeField(_('回答日時'), default=timezone.now)
+
+    class Meta:
+        verbose_name = _('回答')
+        verbose_name_plural = _('回答')
+        ordering = ['-completed_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'survey'],
+                name='unique_user_survey'
+            )
+        ]
+        indexes = [
+            # 管理画面の一覧（回答日時の降順）と期間での絞り込み用
+            models.Index(fields=['-completed_at'], name='response_completed_idx'),
+            models.Index(fields=['survey', '-completed_at'], name='response_survey_completed_idx'),
+        ]
+
+    def __str__(self):
+        """モデルの文字列表現"""
+        return f'{self.survey.title} - {self.user.email}の回答'
+
+class SurveyTally(models.Model):
+    """アンケートごとの回答者数の集計（シャード単位）
+
+    同時に回答されても同じ行の更新で競合しないよう、
+    複数のシャード行に分けて加算し、表示時に合計します。
+    """
+    survey = models.ForeignKey(
+        Survey,
+        verbose_name=_('アンケート'),
+        on_delete=models.CASCADE,
+        related_name='tallies'
+    )
+    shard = models.PositiveSmallIntegerField(_('シャード'))
+    respondent_count = models.PositiveIntegerField(_('回答者数'), default=0)
+
+    class Meta:
+        verbose_name = _('回答者数の集計')
+        verbose_name_plural = _('回答者数の集計')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['survey', 'shard'],
+                name='unique_survey_tally_shard'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.survey.title} - {self.shard}'
+
+class ChoiceTally(models.Model):
+    """選択肢ごとの選択数の集計（シャード単位）"""
+    question = models.ForeignKey(
+        Question,
+        verbose_name=_('質問'),
+        on_delete=models.CASCADE,
+        related_name='choice_tallies'
+    )
+    choice = models.ForeignKey(
+        QuestionChoice,
+        verbose_name=_('選択肢'),
+        on_delete=models.CASCADE,
+        related_name='tallies'
+    )
+    shard = models.PositiveSmallIntegerField(_('シャード'))
+    count = models.PositiveIntegerField(_('選択数'), default=0)
+
+    class Meta:
+        verbose_name = _('選択数の集計')
+        verbose_name_plural = _('選択数の集計')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['choice', 'shard'],
+                name='unique_choice_tally_shard'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.choice.text} - {self.shard}'
@@ -0,0 +1,83 @@
+"""
+表示順（order）の管理
+
+新しい行の表示順は INSERT 文の中で採番し、並べ替えは全体の新しい順序を
+1回の UPDATE ... CASE 文でまとめて反映します。
+UPDATE ではモデルのシグナルが送信されないため、表示順に依存する
+キャッシュのバージョンをここで明示的に更新します。
+"""
+
+from django.db import transaction
+from django.db.models import Case, IntegerField, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from .cache import bump_navigation_version
+from .definitions import bump_definition_version
+from .models import Question, QuestionChoice, SurveyCategory
+from .pagecache import bump_listing_version
+
+
+class InvalidOrderError(ValueError):
+    """指定された並び順が対象の行の全体と一致しない場合の例外"""
+
+
+def next_order(queryset):
+    """
+    同じ範囲の行の最大の表示順 + 1 を返す式
+
+    モデルのフィールドに代入して保存すると INSERT 文のサブクエリとして評価されるため、
+    最大値の読み取りと登録が1つの文になり、まだ行がない範囲への最初の登録どうしでも
+    読み取りと書き込みの間に別の登録が割り込むことがありません。
+    """
+    return Coalesce(
+        Subquery(queryset.order_by('-order').values('order')[:1]), Value(0)
+    ) + 1
+
+
+def apply_order(queryset, ids):
+    """
+    queryset の行の表示順を ids の順序（1始まり）に1回の UPDATE で更新する
+
+    ids は queryset の全ての行のIDを過不足なく含んでいる必要があります。
+
+    Returns:
+        int: 更新した行数
+
+    Raises:
+        InvalidOrderError: ids が queryset の行と一致しない場合
+    """
+    # bool は int のサブクラスのため明示的に除外する
+    if not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+        raise InvalidOrderError('IDは整数で指定してください。')
+    if len(set(ids)) != len(ids):
+        raise InvalidOrderError('同じIDが複数回指定されています。')
+    with transaction.atomic():
+        if set(queryset.select_for_update().values_list('pk', flat=True)) != set(ids):
+            raise InvalidOrderError('並び順には対象の全ての行のIDを1回ずつ指定してください。')
+        if not ids:
+            return 0
+        return queryset.filter(pk__in=ids).update(order=Case(
+            *[When(pk=pk, then=Value(position)) for position, pk in enumerate(ids, start=1)],
+            output_field=IntegerField(),
+        ))
+
+
+def reorder_categories(ids):
+    """カテゴリーを並べ替え、一覧ページとナビゲーションのキャッシュを更新"""
+    count = apply_order(SurveyCategory.objects.all(), ids)
+    transaction.on_commit(bump_listing_version)
+    transaction.on_commit(bump_navigation_version)
+    return count
+
+
+def reorder_questions(survey_id, ids):
+    """アンケートの質問を並べ替え、アンケート定義のキャッシュを更新"""
+    count = apply_order(Question.objects.filter(survey_id=survey_id), ids)
+    transaction.on_commit(lambda: bump_definition_version(survey_id))
+    return count
+
+
+def reorder_choices(question, ids):
+    """質問の選択肢を並べ替え、アンケート定義のキャッシュを更新"""
+    count = apply_order(QuestionChoice.objects.filter(question=question), ids)
+    transaction.on_commit(lambda: bump_definition_version(question.survey_id))
+    return count
@@ -0,0 +1,102 @@
+"""
+一覧ページのキャッシュ
+
+ホーム画面とカテゴリー別一覧画面のアンケート一覧部分を、全ユーザー共通の
+HTMLとして1回だけ描画してキャッシュします。ユーザーごとに異なる
+「回答済み」「回答する」ボタンは、描画済みHTML内の目印を置き換えて反映します。
+
+キャッシュはアンケート・カテゴリーの変更でバージョンが更新されるほか、
+次にいずれかのアンケートの公開期間が開始・終了する時刻に失効します。
+"""
+
+import math
+import re
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Min, Q
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+from .models import Survey
+
+LISTING_VERSION_KEY = 'survey:listing-version'
+LISTING_KEY = 'survey:listing:{name}:{version}'
+
+SURVEY_ACTION_MARKER = re.compile(r'<!--survey-action:(\d+)-->')
+
+
+def get_listing_version():
+    """一覧ページの現在のバージョンを取得"""
+    version = cache.get(LISTING_VERSION_KEY)
+    if version is None:
+        cache.add(LISTING_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(LISTING_VERSION_KEY)
+    return version
+
+
+def bump_listing_version():
+    """一覧ページのバージョンを更新して、キャッシュ済みのHTMLを無効化"""
+    cache.set(LISTING_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def seconds_until_window_change(now=None):
+    """
+    次にいずれかのアンケートの公開期間が開始・終了するまでの秒数
+
+    公開期間の境界を越えると表示対象が変わるため、キャッシュの有効期限に使用します。
+    """
+    now = now or timezone.now()
+    boundaries = Survey.objects.aggregate(
+        next_start=Min('start_date', filter=Q(start_date__gt=now)),
+        next_end=Min('end_date', filter=Q(end_date__gte=now)),
+    )
+    timeout = settings.SURVEY_PAGE_CACHE_TIMEOUT
+    for boundary in boundaries.values():
+        if boundary is not None:
+            timeout = min(timeout, math.floor((boundary - now).total_seconds()))
+    return max(timeout, 0)
+
+
+def get_listing_html(name, render):
+    """
+    共通部分のHTMLをキャッシュから取得
+
+    キャッシュにない場合は render() で描画し、次の公開期間の境界まで保存します。
+    SURVEY_PAGE_CACHE が無効の場合は毎回描画します。
+    """
+    if not settings.SURVEY_PAGE_CACHE:
+        return render()
+
+    key = LISTING_KEY.format(name=name, version=get_listing_version())
+    html = cache.get(key)
+    if html is None:
+        html = render()
+        timeout = seconds_until_window_change()
+        if timeout > 0:
+            cache.set(key, html, timeout)
+    return html
+
+
+def render_survey_action(survey_id, user, answered_surveys):
+    """アンケートカードのボタンをユーザーの回答状況に合わせて描画"""
+    if not user.is_authenticated:
+        return format_html(
+            '<a href="{}" class="btn btn-primary">ログインして回答</a>',
+            reverse('accounts:login')
+        )
+    if survey_id in answered_surveys:
+        return format_html('<button class="btn btn-secondary" disabled>回答済み</button>')
+    return format_html(
+        '<a href="{}" class="btn btn-primary">回答する</a>',
+        reverse('survey_detail', args=[survey_id])
+    )
+
+
+def apply_survey_actions(html, user, answered_surveys):
+    """共通HTML内のボタンの目印をユーザーごとのボタンに置き換える"""
+    return mark_safe(SURVEY_ACTION_MARKER.sub(
+        lambda match: render_survey_action(int(match.group(1)), user, answered_surveys),
+        html
+    ))
@@ -0,0 +1,85 @@
+"""
+キーセット（カーソル）方式のページネーション
+
+(created_at, id) の組をカーソルとして次・前のページを取得します。
+OFFSETを使わないため、どのページでも先頭ページと同じコストで取得できます。
+"""
+
+import base64
+from dataclasses import dataclass
+from datetime import datetime
+from django.db.models import Q
+
+
+@dataclass(frozen=True)
+class Cursor:
+    """ページの境界となるアンケートの (作成日時, ID)"""
+    created_at: datetime
+    id: int
+
+    def encode(self):
+        """URLに含められる文字列に変換"""
+        raw = f'{self.created_at.isoformat()}|{self.id}'
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @classmethod
+    def decode(cls, value):
+        """文字列からカーソルを復元（不正な値の場合はNone）"""
+        if not value:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode()
+            created_at, pk = raw.split('|')
+            return cls(created_at=datetime.fromisoformat(created_at), id=int(pk))
+        except (ValueError, UnicodeDecodeError):
+            return None
+
+    @classmethod
+    def from_object(cls, obj):
+        return cls(created_at=obj.created_at, id=obj.pk)
+
+
+@dataclass(frozen=True)
+class KeysetPage:
+    """キーセット方式で取得した1ページ分の結果"""
+    object_list: list
+    next_cursor: Cursor | None
+    previous_cursor: Cursor | None
+
+    @property
+    def has_other_pages(self):
+        return self.next_cursor is not None or self.previous_cursor is not None
+
+
+def paginate_keyset(queryset, page_size, after=None, before=None):
+    """
+    作成日時の新しい順に1ページ分を取得
+
+    after を指定した場合はそのカーソルより古いページ、
+    before を指定した場合はそのカーソルより新しいページを返します。
+    次ページの有無を判定するため page_size + 1 件だけ取得します。
+    """
+    if before is not None:
+        rows = list(queryset.filter(
+            Q(created_at__gt=before.created_at)
+            | Q(created_at=before.created_at, id__gt=before.id)
+        ).order_by('created_at', 'id')[:page_size + 1])
+        has_previous = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        has_next = True
+    else:
+        if after is not None:
+            queryset = queryset.filter(
+                Q(created_at__lt=after.created_at)
+                | Q(created_at=after.created_at, id__lt=after.id)
+            )
+        rows = list(queryset.order_by('-created_at', '-id')[:page_size + 1])
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        has_previous = after is not None
+
+    return KeysetPage(
+        object_list=rows,
+        next_cursor=Cursor.from_object(rows[-1]) if rows and has_next else None,
+        previous_cursor=Cursor.from_object(rows[0]) if rows and has_previous else None,
+    )
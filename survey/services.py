@@ -0,0 +1,111 @@
+"""
+アンケート回答の保存処理
+
+回答の保存をビューから切り離し、質問数に関係なく
+一定のクエリ数で1件の回答（提出）を登録できるようにします。
+回答の削除も、一定件数ごとのバッチで集合演算のSQLにより行います。
+回答の検証は validation モジュールで行います。
+"""
+
+from dataclasses import dataclass
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+from .models import Answer, SurveyResponse
+from .tallies import record_submission, subtract_responses
+
+DELETE_BATCH_SIZE = 1000
+
+
+class AlreadyAnsweredError(Exception):
+    """同じユーザーが同じアンケートに既に回答している場合の例外"""
+
+
+@dataclass(frozen=True)
+class DeletedResponses:
+    """回答の一括削除の結果"""
+    responses: int
+    answers: int
+    selections: int
+    user_ids: frozenset
+    survey_ids: frozenset
+
+
+def save_submission(survey, user, parsed_answers):
+    """
+    検証済みの回答を一括で保存する
+
+    最初に回答レコード（SurveyResponse）を作成して二重回答を検出し、
+    回答と選択肢の中間テーブルをそれぞれ1回のbulk_createで登録します。
+    集計テーブルへの加算も含め、全体を1つのトランザクションで実行します。
+
+    Raises:
+        AlreadyAnsweredError: 同じユーザーが同じアンケートに既に回答している場合
+            （それ以外の制約違反の IntegrityError はそのまま送出します）
+    """
+    answers = [
+        Answer(user=user, question_id=question.id, text=text)
+        for question, text, _choice_ids in parsed_answers
+    ]
+    try:
+        with transaction.atomic():
+            response = SurveyResponse.objects.create(user=user, survey=survey)
+            Answer.objects.bulk_create(answers)
+            through_model = Answer.choices.through
+            through_model.objects.bulk_create([
+                through_model(answer_id=answer.id, questionchoice_id=choice_id)
+                for answer, (_question, _text, choice_ids) in zip(answers, parsed_answers)
+                for choice_id in choice_ids
+            ])
+            record_submission(survey.id, parsed_answers)
+    except IntegrityError as e:
+        # 二重回答による制約違反かどうかは、ロールバック後に回答レコードの有無で確認する
+        if SurveyResponse.objects.filter(user=user, survey=survey).exists():
+            raise AlreadyAnsweredError from e
+        raise
+    return response
+
+
+def delete_responses(queryset, batch_size=DELETE_BATCH_SIZE):
+    """
+    回答レコードと、それに対応する回答・選択肢の中間テーブルの行をまとめて削除する
+
+    対象の回答レコードを主キーの順に batch_size 件ずつ（前回の最後の主キーより後ろから）取得し、
+    バッチごとのトランザクションで、削除する分を集計から差し引いてから
+    回答（選択肢の中間テーブルを含む）と回答レコードを QuerySet.delete() で削除します。
+    メモリに読み込むのは1バッチ分の行のみです。
+
+    Returns:
+        DeletedResponses: 削除した行数と、影響を受けたユーザー・アンケートのID
+    """
+    queryset = queryset.order_by('pk')
+    through_label = Answer.choices.through._meta.label
+    response_count = answer_count = selection_count = 0
+    user_ids = set()
+    survey_ids = set()
+    last_pk = None
+    while True:
+        batch = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(batch.values_list('pk', 'survey_id', 'user_id')[:batch_size])
+        if not rows:
+            break
+        last_pk = rows[-1][0]
+        user_ids.update(user_id for _pk, _survey_id, user_id in rows)
+        survey_ids.update(survey_id for _pk, survey_id, _user_id in rows)
+
+        with transaction.atomic():
+            responses = SurveyResponse.objects.filter(pk__in=[pk for pk, _survey_id, _user_id in rows])
+            subtract_responses(responses)
+            _total, answer_counts = Answer.objects.filter(Exists(responses.filter(
+                survey_id=OuterRef('question__survey_id'), user_id=OuterRef('user_id')
+            ))).delete()
+            selection_count += answer_counts.get(through_label, 0)
+            answer_count += answer_counts.get(Answer._meta.label, 0)
+            _total, response_counts = responses.delete()
+            response_count += response_counts.get(SurveyResponse._meta.label, 0)
+    return DeletedResponses(
+        responses=response_count,
+        answers=answer_count,
+        selections=selection_count,
+        user_ids=frozenset(user_ids),
+        survey_ids=frozenset(survey_ids),
+    )
@@ -0,0 +1,57 @@
+"""
+アンケートのシグナル
+
+モデルの保存・削除に合わせてキャッシュのバージョンを更新します。
+ユーザーの削除時には、連鎖削除される回答の分を集計から差し引きます。
+管理画面（nested-adminのインラインを含む）からの保存もここで検知されます。
+"""
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from .cache import bump_navigation_version
+from .definitions import bump_definition_version
+from .models import Question, QuestionChoice, Survey, SurveyCategory, SurveyResponse
+from .pagecache import bump_listing_version
+from .tallies import subtract_responses
+
+
+@receiver([post_save, post_delete], sender=Survey)
+def survey_changed(sender, instance, **kwargs):
+    """アンケートの変更時に定義・一覧ページ・ナビゲーションのバージョンを更新"""
+    bump_definition_version(instance.pk)
+    bump_listing_version()
+    bump_navigation_version()
+
+
+@receiver([post_save, post_delete], sender=SurveyCategory)
+def survey_category_changed(sender, instance, **kwargs):
+    """カテゴリーの変更（並べ替えを含む）時に一覧ページとナビゲーションのバージョンを更新"""
+    bump_listing_version()
+    bump_navigation_version()
+
+
+@receiver([post_save, post_delete], sender=Question)
+def question_changed(sender, instance, **kwargs):
+    """質問の変更時に定義のバージョンを更新"""
+    bump_definition_version(instance.survey_id)
+
+
+@receiver([post_save, post_delete], sender=QuestionChoice)
+def question_choice_changed(sender, instance, **kwargs):
+    """選択肢の変更時に定義のバージョンを更新"""
+    if QuestionChoice.question.is_cached(instance):
+        survey_id = instance.question.survey_id
+    else:
+        # 質問ごと削除される場合は質問側のシグナルで更新される
+        survey_id = Question.objects.filter(
+            pk=instance.question_id
+        ).values_list('survey_id', flat=True).first()
+    if survey_id is not None:
+        bump_definition_version(survey_id)
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def user_deleted(sender, instance, **kwargs):
+    """ユーザーの削除で連鎖削除される回答の分を、削除前に集計から差し引く"""
+    subtract_responses(SurveyResponse.objects.filter(user=instance))
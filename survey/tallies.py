@@ -0,0 +1,219 @@
+"""
+回答の集計
+
+回答の保存と同じトランザクションで、選択肢ごとの選択数と
+アンケートごとの回答者数を加算します。集計行はシャードに分かれており、
+同時に回答されても同じ行の更新を待ち合わせずに済みます。
+回答を削除する場合（ユーザーの削除による連鎖削除を含む）は、その分を差し引きます。
+"""
+
+import random
+from dataclasses import dataclass
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Sum
+from .definitions import get_survey_definition
+from .models import Answer, ChoiceTally, QuestionChoice, SurveyResponse, SurveyTally
+
+
+@dataclass(frozen=True)
+class ChoiceResult:
+    """選択肢ごとの集計結果"""
+    choice: object
+    count: int
+    percentage: float
+
+
+@dataclass(frozen=True)
+class QuestionResult:
+    """質問ごとの集計結果"""
+    question: object
+    choices: tuple
+
+
+def record_submission(survey_id, parsed_answers):
+    """
+    1件の回答を集計に加算する
+
+    無作為に選んだシャードの行を確保してから、
+    回答者数と選択された選択肢の選択数をそれぞれ1回のUPDATEで加算します。
+    呼び出し元のトランザクション内で実行してください。
+    """
+    shard = random.randrange(settings.SURVEY_TALLY_SHARDS)
+
+    SurveyTally.objects.bulk_create(
+        [SurveyTally(survey_id=survey_id, shard=shard)], ignore_conflicts=True
+    )
+    SurveyTally.objects.filter(survey_id=survey_id, shard=shard).update(
+        respondent_count=F('respondent_count') + 1
+    )
+
+    selected = [
+        (question.id, choice_id)
+        for question, _text, choice_ids in parsed_answers
+        for choice_id in choice_ids
+    ]
+    if selected:
+        ChoiceTally.objects.bulk_create([
+            ChoiceTally(question_id=question_id, choice_id=choice_id, shard=shard)
+            for question_id, choice_id in selected
+        ], ignore_conflicts=True)
+        ChoiceTally.objects.filter(
+            choice_id__in=[choice_id for _question_id, choice_id in selected],
+            shard=shard
+        ).update(count=F('count') + 1)
+
+
+def rebuild_tallies(survey_ids):
+    """
+    回答データから集計を作り直す
+
+    対象アンケートの全てのシャードの集計行を用意して行ロックをかけてから、
+    回答レコードと選択肢の中間テーブルを集計した結果をシャード0に書き込み、
+    他のシャードは0にします。集計中に回答が保存されても、その加算は行ロックの解放を
+    待ってから作り直した値に加わるため、回答数がずれることはありません。
+    """
+    through_model = Answer.choices.through
+    shards = range(settings.SURVEY_TALLY_SHARDS)
+    with transaction.atomic():
+        SurveyTally.objects.bulk_create([
+            SurveyTally(survey_id=survey_id, shard=shard)
+            for survey_id in survey_ids for shard in shards
+        ], ignore_conflicts=True)
+        ChoiceTally.objects.bulk_create([
+            ChoiceTally(question_id=question_id, choice_id=choice_id, shard=shard)
+            for choice_id, question_id in QuestionChoice.objects.filter(
+                question__survey_id__in=survey_ids
+            ).values_list('id', 'question_id')
+            for shard in shards
+        ], ignore_conflicts=True, batch_size=1000)
+
+        survey_rows = list(SurveyTally.objects.select_for_update().filter(
+            survey_id__in=survey_ids
+        ).order_by('survey_id', 'shard'))
+        choice_rows = list(ChoiceTally.objects.select_for_update().filter(
+            question__survey_id__in=survey_ids
+        ).order_by('choice_id', 'shard'))
+
+        respondents = dict(
+            SurveyResponse.objects.filter(survey_id__in=survey_ids).values(
+                'survey_id'
+            ).annotate(count=Count('id')).values_list('survey_id', 'count').order_by()
+        )
+        selections = dict(
+            through_model.objects.filter(
+                questionchoice__question__survey_id__in=survey_ids
+            ).values('questionchoice_id').annotate(
+                count=Count('id')
+            ).values_list('questionchoice_id', 'count').order_by()
+        )
+        for row in survey_rows:
+            row.respondent_count = respondents.get(row.survey_id, 0) if row.shard == 0 else 0
+        for row in choice_rows:
+            row.count = selections.get(row.choice_id, 0) if row.shard == 0 else 0
+        SurveyTally.objects.bulk_update(survey_rows, ['respondent_count'], batch_size=1000)
+        ChoiceTally.objects.bulk_update(choice_rows, ['count'], batch_size=1000)
+
+
+def count_responses(responses):
+    """
+    回答レコードのクエリセットに対応する、アンケートごとの回答者数と選択肢ごとの選択数
+
+    Returns:
+        tuple: ({アンケートID: 回答者数}, {選択肢ID: 選択数})
+    """
+    respondents = dict(
+        responses.order_by().values('survey_id').annotate(
+            count=Count('id')
+        ).values_list('survey_id', 'count')
+    )
+    answers = Answer.objects.filter(Exists(responses.filter(
+        survey_id=OuterRef('question__survey_id'), user_id=OuterRef('user_id')
+    )))
+    selections = dict(
+        Answer.choices.through.objects.filter(answer__in=answers.values('pk')).values(
+            'questionchoice_id'
+        ).annotate(count=Count('id')).values_list('questionchoice_id', 'count').order_by()
+    )
+    return respondents, selections
+
+
+def subtract_tallies(respondents, selections):
+    """
+    削除した回答の分を集計から差し引く
+
+    対象の集計行に行ロックをかけ、シャードの順に0を下回らない範囲で差し引きます。
+
+    Args:
+        respondents (dict): {アンケートID: 差し引く回答者数}
+        selections (dict): {選択肢ID: 差し引く選択数}
+    """
+    with transaction.atomic():
+        _subtract(
+            SurveyTally.objects.filter(survey_id__in=respondents),
+            'survey_id', 'respondent_count', respondents
+        )
+        _subtract(
+            ChoiceTally.objects.filter(choice_id__in=selections),
+            'choice_id', 'count', selections
+        )
+
+
+def _subtract(queryset, key, field, amounts):
+    remaining = dict(amounts)
+    rows = list(queryset.select_for_update().order_by(key, 'shard'))
+    for row in rows:
+        value = getattr(row, field)
+        amount = min(remaining.get(getattr(row, key), 0), value)
+        setattr(row, field, value - amount)
+        remaining[getattr(row, key)] = remaining.get(getattr(row, key), 0) - amount
+    queryset.model.objects.bulk_update(rows, [field], batch_size=1000)
+
+
+def subtract_responses(responses):
+    """回答レコードを削除する前に、その分を集計から差し引く"""
+    respondents, selections = count_responses(responses)
+    subtract_tallies(respondents, selections)
+
+
+def get_respondent_count(survey_id):
+    """アンケートの回答者数（シャードの合計）"""
+    return SurveyTally.objects.filter(survey_id=survey_id).aggregate(
+        total=Sum('respondent_count')
+    )['total'] or 0
+
+
+def get_survey_results(survey_id):
+    """
+    集計テーブルだけを読んで質問ごとの集計結果を組み立てる
+
+    Returns:
+        tuple: (回答者数, QuestionResultのリスト)
+    """
+    definition = get_survey_definition(survey_id)
+    respondent_count = get_respondent_count(survey_id)
+    counts = dict(
+        ChoiceTally.objects.filter(question__survey_id=survey_id).values(
+            'choice_id'
+        ).annotate(total=Sum('count')).values_list('choice_id', 'total').order_by()
+    )
+
+    results = []
+    for question in definition.questions:
+        if not question.is_choice:
+            continue
+        results.append(QuestionResult(
+            question=question,
+            choices=tuple(
+                ChoiceResult(
+                    choice=choice,
+                    count=counts.get(choice.id, 0),
+                    percentage=(
+                        counts.get(choice.id, 0) * 100 / respondent_count
+                        if respondent_count else 0
+                    ),
+                )
+                for choice in question.choices
+            ),
+        ))
+    return respondent_count, results
@@ -1,3 +1,1284 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from importlib import import_module
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.db.models import QuerySet, Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .analytics import build_report, load_choice_matrix
+from .bulk import clone_surveys
+from .cache import get_answered_survey_ids, get_navigation_categories
+from .definitions import get_survey_definition
+from .exports import iter_response_rows
+from .matrix import build_response_matrix, decode_text_column, write_response_matrix
+from .models import (
+    Answer, ChoiceTally, Question, QuestionChoice, Survey, SurveyCategory, SurveyResponse,
+    SurveyTally,
+)
+from .pagecache import seconds_until_window_change
+from .services import AlreadyAnsweredError, delete_responses, save_submission
+from .tallies import get_respondent_count
+from .transfer import SurveyImportError, import_surveys, stream_surveys_csv, stream_surveys_json
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def create_survey(question_count=3, **kwargs):
+    """テスト用のアンケートを作成（質問タイプを順番に割り当てる）"""
+    now = timezone.now()
+    category = kwargs.pop('category', None) or SurveyCategory.objects.create(name='カテゴリー')
+    survey = Survey.objects.create(
+        title=kwargs.pop('title', 'アンケート'),
+        category=category,
+        description='説明',
+        summary='概要',
+        start_date=kwargs.pop('start_date', now - timedelta(days=1)),
+        end_date=kwargs.pop('end_date', now + timedelta(days=1)),
+    )
+    question_types = [question_type for question_type, _label in Question.QUESTION_TYPES]
+    for i in range(question_count):
+        question = Question.objects.create(
+            survey=survey,
+            text=f'質問{i + 1}',
+            question_type=question_types[i % len(question_types)],
+            order=i + 1,
+        )
+        if question.question_type in ('radio', 'checkbox', 'select'):
+            for j in range(3):
+                QuestionChoice.objects.create(question=question, text=f'選択肢{j + 1}', order=j + 1)
+    return survey
+
+
+def build_post_data(survey):
+    """全ての質問に回答するPOSTデータを作成"""
+    data = {}
+    for question in survey.questions.prefetch_related('choices'):
+        choice_ids = [str(choice.id) for choice in question.choices.all()]
+        key = f'question_{question.id}'
+        if question.question_type == 'checkbox':
+            data[key] = choice_ids[:2]
+        elif question.question_type in ('radio', 'select'):
+            data[key] = choice_ids[0]
+        else:
+            data[key] = '回答'
+    return data
+
+
+class SurveyAnswerViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='pass', is_active=True
+        )
+        self.client.force_login(self.user)
+
+    def post_answers(self, survey):
+        return self.client.post(
+            reverse('survey_answer', args=[survey.id]), build_post_data(survey)
+        )
+
+    def test_saves_answers_and_choices(self):
+        survey = create_survey(question_count=5)
+        response = self.post_answers(survey)
+
+        self.assertRedirects(response, reverse('survey_complete'), fetch_redirect_response=False)
+        self.assertEqual(Answer.objects.filter(user=self.user).count(), 5)
+        checkbox_answer = Answer.objects.get(user=self.user, question__question_type='checkbox')
+        self.assertEqual(checkbox_answer.choices.count(), 2)
+        self.assertTrue(SurveyResponse.objects.filter(user=self.user, survey=survey).exists())
+
+    def test_query_count_does_not_depend_on_question_count(self):
+        small_survey = create_survey(question_count=5)
+        large_survey = create_survey(question_count=40)
+
+        with CaptureQueriesContext(connection) as small_queries:
+            self.post_answers(small_survey)
+        with CaptureQueriesContext(connection) as large_queries:
+            self.post_answers(large_survey)
+
+        self.assertEqual(len(small_queries), len(large_queries))
+
+    def test_non_ascii_digits_are_invalid_choices(self):
+        survey = create_survey(question_count=3)
+        data = build_post_data(survey)
+        radio = survey.questions.get(question_type='radio')
+        data[f'question_{radio.id}'] = '²'
+
+        response = self.client.post(reverse('survey_answer', args=[survey.id]), data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '選択肢が正しくありません。')
+        self.assertFalse(SurveyResponse.objects.filter(user=self.user).exists())
+
+    def test_only_duplicate_submission_is_already_answered(self):
+        survey = create_survey(question_count=3)
+        self.post_answers(survey)
+
+        with self.assertRaises(AlreadyAnsweredError):
+            save_submission(survey, self.user, [])
+
+        other_survey = create_survey(question_count=3)
+        with mock.patch('survey.services.record_submission', side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                save_submission(other_survey, self.user, [])
+        self.assertFalse(SurveyResponse.objects.filter(user=self.user, survey=other_survey).exists())
+
+    def test_invalid_choice_id_is_reported(self):
+        survey = create_survey(question_count=3)
+        other_choice = create_survey(question_count=3).questions.get(question_type='radio').choices.first()
+        data = build_post_data(survey)
+        radio = survey.questions.get(question_type='radio')
+        data[f'question_{radio.id}'] = str(other_choice.id)
+
+        response = self.client.post(reverse('survey_answer', args=[survey.id]), data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '選択肢が正しくありません。')
+        self.assertFalse(Answer.objects.filter(user=self.user).exists())
+        self.assertFalse(SurveyResponse.objects.filter(user=self.user).exists())
+
+    def test_required_and_length_errors_rerender_form(self):
+        survey = create_survey(question_count=2)
+        text_question, textarea_question = survey.questions.order_by('order')
+        data = {
+            f'question_{text_question.id}': 'あ' * 256,
+            f'question_{textarea_question.id}': ' ',
+        }
+
+        response = self.client.post(reverse('survey_answer', args=[survey.id]), data)
+
+        self.assertContains(response, '255文字以内で入力してください。')
+        self.assertContains(response, 'この質問は必須です。')
+        field = response.context['questions'][0]
+        self.assertEqual(field.text, 'あ' * 256)
+
+    def test_invalid_post_does_not_query_per_question(self):
+        small_survey = create_survey(question_count=5)
+        large_survey = create_survey(question_count=40)
+        self.client.get(reverse('home'))
+
+        with CaptureQueriesContext(connection) as small_queries:
+            self.client.post(reverse('survey_answer', args=[small_survey.id]), {})
+        with CaptureQueriesContext(connection) as large_queries:
+            self.client.post(reverse('survey_answer', args=[large_survey.id]), {})
+
+        self.assertEqual(len(small_queries), len(large_queries))
+
+    def test_second_submission_is_rejected_without_partial_writes(self):
+        survey = create_survey(question_count=3)
+        self.post_answers(survey)
+
+        response = self.post_answers(survey)
+
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        self.assertEqual(Answer.objects.filter(user=self.user).count(), 3)
+
+    def test_detail_redirects_when_already_answered(self):
+        survey = create_survey(question_count=3)
+        self.post_answers(survey)
+
+        response = self.client.get(reverse('survey_detail', args=[survey.id]))
+
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+
+    def test_answered_cache_is_invalidated_on_submission(self):
+        survey = create_survey(question_count=3)
+        self.assertEqual(get_answered_survey_ids(self.user), frozenset())
+
+        self.post_answers(survey)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(get_answered_survey_ids(self.user), {survey.id})
+        with self.assertNumQueries(0):
+            self.assertEqual(get_answered_survey_ids(self.user), {survey.id})
+
+
+class AnswerAdminTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = get_user_model().objects.create_superuser(
+            email='admin@example.com', password='pass'
+        )
+        self.survey = create_survey(question_count=3)
+        self.respondent = get_user_model().objects.create_user(
+            email='user@example.com', password='pass', is_active=True
+        )
+        self.client.force_login(self.respondent)
+        self.client.post(reverse('survey_answer', args=[self.survey.id]), build_post_data(self.survey))
+        self.client.force_login(self.admin)
+
+    def test_changelist_shows_one_row_per_submission(self):
+        response = self.client.get(reverse('admin:survey_surveyresponse_changelist'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+    def test_search_matches_answer_text(self):
+        response = self.client.get(
+            reverse('admin:survey_surveyresponse_changelist'), {'q': '回答'}
+        )
+
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+    def test_delete_removes_answers(self):
+        survey_response = SurveyResponse.objects.get()
+
+        self.client.post(
+            reverse('admin:survey_surveyresponse_delete', args=[survey_response.id]),
+            {'post': 'yes'}
+        )
+
+        self.assertFalse(SurveyResponse.objects.exists())
+        self.assertFalse(Answer.objects.exists())
+        self.assertEqual(get_answered_survey_ids(self.respondent), frozenset())
+
+    def add_respondents(self, count, prefix='extra'):
+        for i in range(count):
+            user = get_user_model().objects.create_user(
+                email=f'{prefix}{i}@example.com', password='pass', is_active=True
+            )
+            self.client.force_login(user)
+            self.client.post(reverse('survey_answer', args=[self.survey.id]), build_post_data(self.survey))
+        self.client.force_login(self.admin)
+
+    def test_changelist_query_count_does_not_grow_with_rows(self):
+        url = reverse('admin:survey_surveyresponse_changelist')
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(url)
+        self.add_respondents(4)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        self.assertEqual(response.context['cl'].result_count, 5)
+        self.assertEqual(len(queries), len(before))
+        # 件数は集計テーブルから求め、回答テーブルのCOUNTや日付のDISTINCTは実行しない
+        response_queries = [
+            query['sql'] for query in queries.captured_queries
+            if 'FROM "survey_surveyresponse"' in query['sql']
+        ]
+        self.assertFalse([sql for sql in response_queries if 'COUNT(' in sql])
+        self.assertFalse([sql for sql in response_queries if 'DISTINCT' in sql])
+
+    def test_survey_filter_uses_tally_count(self):
+        self.add_respondents(2)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('admin:survey_surveyresponse_changelist'),
+                {'survey__id__exact': self.survey.id}
+            )
+
+        self.assertEqual(response.context['cl'].result_count, 3)
+        self.assertFalse([
+            query['sql'] for query in queries.captured_queries
+            if 'FROM "survey_surveyresponse"' in query['sql'] and 'COUNT(' in query['sql']
+        ])
+
+    def test_unbuilt_tally_falls_back_to_count(self):
+        self.add_respondents(2)
+        SurveyTally.objects.filter(survey=self.survey).delete()
+
+        for params in ({}, {'survey__id__exact': self.survey.id}):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('admin:survey_surveyresponse_changelist'), params)
+
+            self.assertEqual(response.context['cl'].result_count, 3)
+            self.assertTrue([
+                query['sql'] for query in queries.captured_queries
+                if 'FROM "survey_surveyresponse"' in query['sql'] and 'COUNT(' in query['sql']
+            ])
+
+    def test_filter_by_email(self):
+        self.add_respondents(2)
+
+        response = self.client.get(
+            reverse('admin:survey_surveyresponse_changelist'), {'email': 'user@example.com'}
+        )
+
+        self.assertEqual(response.context['cl'].result_count, 1)
+        self.assertNotContains(response, 'extra0@example.com')
+
+    def test_filter_by_month(self):
+        month = timezone.localtime().strftime('%Y-%m')
+
+        response = self.client.get(
+            reverse('admin:survey_surveyresponse_changelist'), {'completed_month': month}
+        )
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+        response = self.client.get(
+            reverse('admin:survey_surveyresponse_changelist'), {'completed_month': '2000-01'}
+        )
+        self.assertEqual(response.context['cl'].result_count, 0)
+
+    def bulk_delete(self, responses):
+        return self.client.post(reverse('admin:survey_surveyresponse_changelist'), {
+            'action': 'delete_selected',
+            '_selected_action': [response.id for response in responses],
+            'post': 'yes',
+        }, follow=True)
+
+    def test_bulk_delete_uses_constant_queries(self):
+        other_survey = create_survey(question_count=3, title='別のアンケート')
+        self.client.force_login(self.respondent)
+        self.client.post(reverse('survey_answer', args=[other_survey.id]), build_post_data(other_survey))
+        self.add_respondents(2)
+        with CaptureQueriesContext(connection) as few:
+            self.bulk_delete(SurveyResponse.objects.filter(user__email='extra0@example.com'))
+
+        self.add_respondents(5, prefix='more')
+        responses = list(SurveyResponse.objects.filter(survey=self.survey).exclude(user=self.respondent))
+        with CaptureQueriesContext(connection) as many:
+            response = self.bulk_delete(responses)
+
+        self.assertEqual(len(many), len(few))
+        # Django の delete_selected の完了メッセージに加え、削除した行数の内訳を表示する
+        sent = [str(message) for message in response.context['messages']]
+        self.assertEqual(len(sent), 2)
+        self.assertIn('回答レコード6件、回答18件、', sent[0])
+        self.assertEqual(
+            set(SurveyResponse.objects.values_list('user__email', 'survey_id')),
+            {('user@example.com', self.survey.id), ('user@example.com', other_survey.id)}
+        )
+        self.assertEqual(Answer.objects.count(), 6)
+        self.assertEqual(get_respondent_count(self.survey.id), 1)
+        self.assertEqual(get_answered_survey_ids(self.respondent), frozenset({self.survey.id, other_survey.id}))
+
+    def test_detail_prefetches_choices(self):
+        survey = create_survey(question_count=10, title='質問の多いアンケート')
+        self.client.force_login(self.respondent)
+        self.client.post(reverse('survey_answer', args=[survey.id]), build_post_data(survey))
+        self.client.force_login(self.admin)
+        survey_response = SurveyResponse.objects.get(survey=survey)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('admin:survey_surveyresponse_change', args=[survey_response.id])
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '選択肢1, 選択肢2')
+        choice_queries = [
+            query['sql'] for query in queries.captured_queries
+            if 'survey_answer_choices' in query['sql']
+        ]
+        self.assertEqual(len(choice_queries), 1)
+
+
+class SurveyDefinitionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.survey = create_survey(question_count=5)
+
+    def test_definition_is_served_from_cache(self):
+        definition = get_survey_definition(self.survey.id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_survey_definition(self.survey.id), definition)
+        self.assertEqual(
+            [question.text for question in definition.questions],
+            ['質問1', '質問2', '質問3', '質問4', '質問5']
+        )
+
+    def test_choice_change_invalidates_definition(self):
+        get_survey_definition(self.survey.id)
+        question = self.survey.questions.get(question_type='radio')
+
+        choice = QuestionChoice.objects.create(question=question, text='追加', order=4)
+
+        definition = get_survey_definition(self.survey.id)
+        radio = next(q for q in definition.questions if q.id == question.id)
+        self.assertIn(choice.id, radio.choice_ids)
+        self.assertEqual(radio.choices[-1].text, '追加')
+
+    def test_detail_view_renders_choices_without_per_question_queries(self):
+        user = get_user_model().objects.create_user(
+            email='user@example.com', password='pass', is_active=True
+        )
+        self.client.force_login(user)
+        url = reverse('survey_detail', args=[self.survey.id])
+        self.client.get(url)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        self.assertContains(response, '選択肢1')
+        self.assertFalse(any('survey_questionchoice' in q['sql'] for q in queries.captured_queries))
+
+
+class HomeViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_shows_top_open_surveys_per_category(self):
+        category = SurveyCategory.objects.create(name='カテゴリー')
+        now = timezone.now()
+        for i in range(3):
+            create_survey(question_count=0, category=category, title=f'公開中{i}')
+        create_survey(
+            question_count=0, category=category, title='終了済み',
+            start_date=now - timedelta(days=3), end_date=now - timedelta(days=2)
+        )
+
+        response = self.client.get(reverse('home'))
+
+        (section_category, surveys), = response.context['category_sections']
+        self.assertEqual(section_category.id, category.id)
+        self.assertEqual([survey.title for survey in surveys], ['公開中2', '公開中1'])
+
+    def test_query_count_does_not_depend_on_category_count(self):
+        create_survey(question_count=0)
+        with CaptureQueriesContext(connection) as few_categories:
+            self.client.get(reverse('home'))
+
+        for _ in range(5):
+            create_survey(question_count=0)
+        with CaptureQueriesContext(connection) as many_categories:
+            self.client.get(reverse('home'))
+
+        self.assertEqual(len(few_categories), len(many_categories))
+
+
+class ListingPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='pass', is_active=True
+        )
+        self.survey = create_survey(question_count=3)
+
+    def test_listing_is_rendered_once_and_overlaid_per_user(self):
+        self.client.get(reverse('home'))
+        self.client.force_login(self.user)
+        self.client.post(reverse('survey_answer', args=[self.survey.id]), build_post_data(self.survey))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('home'))
+
+        self.assertContains(response, '回答済み')
+        self.assertFalse(any('"survey_survey"' in q['sql'] for q in queries.captured_queries))
+        self.client.logout()
+        self.assertContains(self.client.get(reverse('home')), 'ログインして回答')
+
+    def test_survey_change_invalidates_listing(self):
+        self.client.get(reverse('category_survey_list', args=[self.survey.category_id]))
+
+        self.survey.title = '新しいタイトル'
+        self.survey.save()
+
+        response = self.client.get(reverse('category_survey_list', args=[self.survey.category_id]))
+        self.assertContains(response, '新しいタイトル')
+
+    def test_listing_expires_when_publication_window_changes(self):
+        now = timezone.now()
+        create_survey(
+            question_count=0, category=self.survey.category,
+            start_date=now + timedelta(seconds=30), end_date=now + timedelta(days=1)
+        )
+
+        self.assertLessEqual(seconds_until_window_change(now), 30)
+
+
+class NavigationCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.survey = create_survey(question_count=0)
+
+    def test_categories_include_open_survey_counts(self):
+        now = timezone.now()
+        create_survey(
+            question_count=0, category=self.survey.category,
+            start_date=now - timedelta(days=3), end_date=now - timedelta(days=2)
+        )
+
+        category, = get_navigation_categories()
+
+        self.assertEqual(category.open_survey_count, 1)
+        with self.assertNumQueries(0):
+            get_navigation_categories()
+
+    def test_category_save_invalidates_navigation(self):
+        get_navigation_categories()
+
+        self.survey.category.name = '新しい名前'
+        self.survey.category.save()
+
+        self.assertEqual(get_navigation_categories()[0].name, '新しい名前')
+
+    def test_survey_pages_do_not_query_categories_when_cached(self):
+        self.client.get(reverse('home'))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('home'))
+
+        self.assertFalse(any('survey_surveycategory' in q['sql'] for q in queries.captured_queries))
+
+
+@override_settings(SURVEY_CATEGORY_PAGE_SIZE=2)
+class CategorySurveyListViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = SurveyCategory.objects.create(name='カテゴリー')
+        now = timezone.now()
+        self.surveys = [
+            create_survey(question_count=0, category=self.category, title=f'アンケート{i}')
+            for i in range(5)
+        ]
+        self.closed = create_survey(
+            question_count=0, category=self.category, title='終了済み',
+            start_date=now - timedelta(days=3), end_date=now - timedelta(days=2)
+        )
+        self.url = reverse('category_survey_list', args=[self.category.id])
+
+    def test_keyset_pages_cover_all_surveys(self):
+        titles = []
+        response = self.client.get(self.url, {'status': 'open'})
+        while True:
+            page = response.context['page']
+            titles += [survey.title for survey in page.object_list]
+            if page.next_cursor is None:
+                break
+            response = self.client.get(self.url, {'status': 'open', 'after': page.next_cursor.encode()})
+
+        self.assertEqual(titles, [f'アンケート{i}' for i in reversed(range(5))])
+
+    def test_previous_page_returns_to_first_page(self):
+        first = self.client.get(self.url).context['page']
+        second = self.client.get(self.url, {'after': first.next_cursor.encode()}).context['page']
+
+        back = self.client.get(self.url, {'before': second.previous_cursor.encode()}).context['page']
+
+        self.assertEqual(back.object_list, first.object_list)
+
+    def test_closed_filter(self):
+        response = self.client.get(self.url, {'status': 'closed'})
+
+        self.assertEqual(list(response.context['surveys']), [self.closed])
+
+    def test_default_lists_only_open_surveys(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.context['status'], 'open')
+        self.assertNotIn(self.closed, response.context['surveys'])
+
+    def test_closed_surveys_are_not_linked(self):
+        response = self.client.get(self.url, {'status': 'all'})
+
+        self.assertContains(response, '終了済み')
+        self.assertContains(response, '受付終了')
+        self.assertNotContains(response, reverse('survey_detail', args=[self.closed.id]))
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        response = self.client.get(self.url, {'after': 'invalid'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['surveys']), 2)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLiteの実行計画を前提としたテスト')
+class SurveyQuerySetPlanTests(TestCase):
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {index_name}', plan)
+        self.assertNotIn('SCAN survey_survey', plan)
+
+    def test_open_uses_end_date_index(self):
+        self.assertUsesIndex(Survey.objects.open(), 'survey_end_date_idx')
+
+    def test_upcoming_uses_window_index(self):
+        self.assertUsesIndex(Survey.objects.upcoming(), 'survey_window_idx')
+
+    def test_closed_uses_end_date_index(self):
+        self.assertUsesIndex(Survey.objects.closed(), 'survey_end_date_idx')
+
+    def test_category_status_uses_category_window_index(self):
+        for status in ('open', 'upcoming'):
+            with self.subTest(status=status):
+                self.assertUsesIndex(
+                    Survey.objects.filter(category_id=1).with_status(status),
+                    'survey_category_window_idx'
+                )
+
+    def test_category_listing_page_uses_category_window_index(self):
+        # 公開期間の範囲条件のあとに作成日時の順序を index で満たすことはできないため、
+        # カテゴリー内で期間に該当する行だけを並べ替える（USE TEMP B-TREE）ことは許容する
+        for status in ('open', 'upcoming'):
+            with self.subTest(status=status):
+                self.assertUsesIndex(
+                    Survey.objects.filter(category_id=1).with_status(status).order_by('-created_at', '-id')[:11],
+                    'survey_category_window_idx'
+                )
+
+    def test_category_keyset_uses_created_index(self):
+        self.assertUsesIndex(
+            Survey.objects.filter(category_id=1).order_by('-created_at', '-id'),
+            'survey_category_created_idx'
+        )
+
+
+class SurveyTallyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.survey = create_survey(question_count=5)
+        self.users = [
+            get_user_model().objects.create_user(
+                email=f'user{i}@example.com', password='pass', is_active=True
+            )
+            for i in range(3)
+        ]
+        for user in self.users:
+            self.client.force_login(user)
+            self.client.post(reverse('survey_answer', args=[self.survey.id]), build_post_data(self.survey))
+
+    def choice_counts(self):
+        # 作り直しで作成される選択数0のシャード行は除く
+        return dict(
+            ChoiceTally.objects.values('choice_id').annotate(
+                total=Sum('count')
+            ).filter(total__gt=0).values_list('choice_id', 'total')
+        )
+
+    def test_submissions_update_tallies(self):
+        self.assertEqual(get_respondent_count(self.survey.id), 3)
+        checkbox = self.survey.questions.get(question_type='checkbox')
+        first, second, third = checkbox.choices.order_by('order')
+        counts = self.choice_counts()
+        self.assertEqual(counts[first.id], 3)
+        self.assertEqual(counts[second.id], 3)
+        self.assertNotIn(third.id, counts)
+
+    def test_rebuild_matches_incremental_tallies(self):
+        counts = self.choice_counts()
+        ChoiceTally.objects.update(count=0)
+
+        call_command('rebuild_survey_tallies', self.survey.id, stdout=StringIO())
+
+        self.assertEqual(self.choice_counts(), counts)
+        self.assertEqual(get_respondent_count(self.survey.id), 3)
+
+    def test_deleting_user_subtracts_tallies(self):
+        checkbox = self.survey.questions.get(question_type='checkbox')
+        first = checkbox.choices.order_by('order').first()
+
+        self.users[0].delete()
+
+        self.assertEqual(get_respondent_count(self.survey.id), 2)
+        self.assertEqual(self.choice_counts()[first.id], 2)
+
+    def test_delete_responses_subtracts_tallies_in_batches(self):
+        checkbox = self.survey.questions.get(question_type='checkbox')
+        first = checkbox.choices.order_by('order').first()
+
+        with CaptureQueriesContext(connection) as queries:
+            deleted = delete_responses(
+                SurveyResponse.objects.exclude(user=self.users[0]), batch_size=1
+            )
+
+        self.assertEqual((deleted.responses, deleted.answers), (2, 10))
+        self.assertEqual(deleted.user_ids, {self.users[1].id, self.users[2].id})
+        self.assertEqual(get_respondent_count(self.survey.id), 1)
+        self.assertEqual(self.choice_counts()[first.id], 1)
+        self.assertEqual(Answer.objects.filter(user=self.users[0]).count(), 5)
+        # 集計は作り直さずに差し引く
+        self.assertFalse([
+            query['sql'] for query in queries.captured_queries if query['sql'].startswith('INSERT')
+        ])
+
+    def test_backfill_migration_builds_tallies(self):
+        counts = self.choice_counts()
+        ChoiceTally.objects.all().delete()
+        SurveyTally.objects.all().delete()
+
+        import_module('survey.migrations.0008_backfill_tallies').backfill_tallies(apps, None)
+
+        self.assertEqual(self.choice_counts(), counts)
+        self.assertEqual(get_respondent_count(self.survey.id), 3)
+
+    def test_results_page_reads_only_tallies(self):
+        admin_user = get_user_model().objects.create_superuser(
+            email='admin@example.com', password='pass'
+        )
+        self.client.force_login(admin_user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:survey_survey_results', args=[self.survey.id]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '回答者数: <strong>3</strong>', html=False)
+        self.assertFalse(any('survey_answer' in q['sql'] for q in queries.captured_queries))
+
+
+class ResponseCsvExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.survey = create_survey(question_count=5)
+        for i in range(5):
+            user = get_user_model().objects.create_user(
+                email=f'user{i}@example.com', password='pass', is_active=True, full_name=f'回答者{i}'
+            )
+            self.client.force_login(user)
+            self.client.post(reverse('survey_answer', args=[self.survey.id]), build_post_data(self.survey))
+        self.admin = get_user_model().objects.create_superuser(
+            email='admin@example.com', password='pass'
+        )
+        self.client.force_login(self.admin)
+
+    def read_csv(self, response):
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        return list(csv.reader(content.splitlines()))
+
+    def test_streams_one_row_per_respondent(self):
+        response = self.client.get(reverse('admin:survey_survey_export_csv', args=[self.survey.id]))
+
+        rows = self.read_csv(response)
+        self.assertEqual(rows[0][4:], ['質問1', '質問2', '質問3', '質問4', '質問5'])
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[1][2], 'user0@example.com')
+        self.assertEqual(rows[1][4:], ['回答', '回答', '選択肢1', '選択肢1, 選択肢2', '選択肢1'])
+
+    def test_formula_cells_are_escaped(self):
+        text_question = self.survey.questions.get(question_type='text')
+        Answer.objects.filter(question=text_question, user__email='user0@example.com').update(text='=HYPERLINK("x")')
+        get_user_model().objects.filter(email='user0@example.com').update(full_name='@SUM(A1)')
+        text_question.text = '+質問1'
+        text_question.save()
+
+        response = self.client.get(reverse('admin:survey_survey_export_csv', args=[self.survey.id]))
+
+        rows = self.read_csv(response)
+        self.assertEqual(rows[0][4], "'+質問1")
+        self.assertEqual(rows[1][1], "'@SUM(A1)")
+        self.assertEqual(rows[1][4], "'=HYPERLINK(\"x\")")
+        self.assertEqual(rows[2][4], '回答')
+
+    def test_query_count_grows_per_chunk_not_per_row(self):
+        get_survey_definition(self.survey.id)
+
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(iter_response_rows(self.survey.id, chunk_size=2))
+
+        self.assertEqual(len(rows), 6)
+        # 3チャンク × (回答レコード + 回答 + 選択肢) + 終端の空チャンク
+        self.assertEqual(len(queries), 3 * 3 + 1)
+
+    def test_admin_action_streams_csv_for_single_survey(self):
+        response = self.client.post(reverse('admin:survey_survey_changelist'), {
+            'action': 'export_responses_csv',
+            '_selected_action': [self.survey.id],
+        })
+
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(len(self.read_csv(response)), 6)
+
+
+@skipUnless(numpy, 'NumPyが必要です')
+class ResponseMatrixTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.survey = create_survey(question_count=5)
+        self.users = []
+        for i in range(3):
+            user = get_user_model().objects.create_user(
+                email=f'user{i}@example.com', password='pass', is_active=True,
+                organization_name=f'団体{i}'
+            )
+            self.client.force_login(user)
+            self.client.post(reverse('survey_answer', args=[self.survey.id]), build_post_data(self.survey))
+            self.users.append(user)
+
+    def test_encodes_choices_as_integers_and_bitmasks(self):
+        columns = build_response_matrix(self.survey.id, include_user_fields=True, chunk_size=2)
+
+        questions = {question.question_type: question for question in self.survey.questions.all()}
+        self.assertEqual(columns['respondent_id'].tolist(), [user.id for user in self.users])
+        self.assertEqual(columns[f'q{questions["radio"].id}'].tolist(), [0, 0, 0])
+        self.assertEqual(columns[f'q{questions["checkbox"].id}'][:, 0].tolist(), [0b11] * 3)
+        text_key = f'q{questions["text"].id}'
+        self.assertEqual(columns[text_key].dtype, numpy.uint8)
+        self.assertEqual(decode_text_column(columns[text_key], columns[f'{text_key}_offsets']), ['回答'] * 3)
+        self.assertEqual(
+            decode_text_column(columns['user_organization_name'], columns['user_organization_name_offsets']),
+            ['団体0', '団体1', '団体2']
+        )
+
+    def test_rows_deleted_after_count_are_not_left_empty(self):
+        # 件数の取得後に2件の回答が削除された場合を再現する
+        with mock.patch.object(QuerySet, 'count', return_value=5):
+            columns = build_response_matrix(self.survey.id)
+
+        self.assertEqual(columns['respondent_id'].tolist(), [user.id for user in self.users])
+        self.assertEqual(len(columns['completed_at']), 3)
+        text_key = f'q{self.survey.questions.get(question_type="text").id}'
+        self.assertEqual(decode_text_column(columns[text_key], columns[f'{text_key}_offsets']), ['回答'] * 3)
+
+    def test_streamed_file_matches_in_memory_columns(self):
+        expected = build_response_matrix(self.survey.id, include_user_fields=True)
+        file = BytesIO()
+
+        write_response_matrix(file, self.survey.id, include_user_fields=True, chunk_size=2)
+
+        file.seek(0)
+        with numpy.load(file) as data:
+            self.assertEqual(set(data.files), set(expected))
+            for name, column in expected.items():
+                self.assertEqual(data[name].dtype, column.dtype, name)
+                numpy.testing.assert_array_equal(data[name], column, err_msg=name)
+
+    def test_survey_without_responses_writes_empty_columns(self):
+        survey = create_survey(question_count=3, title='回答なし')
+        file = BytesIO()
+
+        write_response_matrix(file, survey.id)
+
+        file.seek(0)
+        text_key = f'q{survey.questions.get(question_type="text").id}'
+        with numpy.load(file) as data:
+            self.assertEqual(len(data['respondent_id']), 0)
+            self.assertEqual(data[f'{text_key}_offsets'].tolist(), [0])
+
+    def test_command_writes_npz(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'responses.npz')
+            call_command('export_survey_matrix', self.survey.id, path, stdout=StringIO())
+
+            with numpy.load(path) as data:
+                self.assertEqual(len(data['respondent_id']), 3)
+                self.assertNotIn('user_email', data.files)
+
+
+@skipUnless(numpy, 'NumPyが必要です')
+class SurveyAnalyticsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.survey = create_survey(question_count=5)
+        questions = {question.question_type: question for question in self.survey.questions.all()}
+        self.radio = questions['radio']
+        self.checkbox = questions['checkbox']
+        radio_choices = list(self.radio.choices.order_by('order'))
+        checkbox_choices = list(self.checkbox.choices.order_by('order'))
+        # (ラジオの選択肢, チェックボックスの選択肢, 団体名)
+        selections = [
+            (0, [0, 1], '団体A'),
+            (0, [0], '団体A'),
+            (1, [1, 2], '団体B'),
+        ]
+        for i, (radio_index, checkbox_indexes, organization_name) in enumerate(selections):
+            user = get_user_model().objects.create_user(
+                email=f'user{i}@example.com', password='pass', is_active=True,
+                organization_name=organization_name
+            )
+            data = build_post_data(self.survey)
+            data[f'question_{self.radio.id}'] = str(radio_choices[radio_index].id)
+            data[f'question_{self.checkbox.id}'] = [
+                str(checkbox_choices[index].id) for index in checkbox_indexes
+            ]
+            self.client.force_login(user)
+            self.client.post(reverse('survey_answer', args=[self.survey.id]), data)
+
+    def test_choice_matrix_has_one_row_per_respondent(self):
+        choice_matrix = load_choice_matrix(self.survey.id, chunk_size=2)
+
+        self.assertEqual(choice_matrix.matrix.shape, (3, 9))
+        self.assertEqual(
+            choice_matrix.question_columns(self.checkbox.id).tolist(),
+            [[True, True, False], [True, False, False], [False, True, True]]
+        )
+
+    def test_report_counts(self):
+        report = build_report(
+            self.survey.id,
+            row_question_id=self.radio.id,
+            column_question_id=self.checkbox.id,
+            cooccurrence_question_id=self.checkbox.id,
+            segment_field='organization_name',
+        )
+
+        self.assertEqual(report['respondent_count'], 3)
+        self.assertEqual(
+            [counts for _label, counts in report['crosstab']['rows']],
+            [[2, 1, 0], [0, 1, 1], [0, 0, 0]]
+        )
+        self.assertEqual(
+            [counts for _label, counts in report['cooccurrence']['rows']],
+            [[2, 1, 0], [1, 2, 1], [0, 1, 1]]
+        )
+        segments = {segment: (size, counts) for segment, size, counts in report['segments']['rows']}
+        self.assertEqual(segments['団体A'][0], 2)
+        self.assertEqual(segments['団体A'][1][3:6], [2, 1, 0])
+
+    def test_report_is_cached_until_new_response(self):
+        build_report(self.survey.id, row_question_id=self.radio.id, column_question_id=self.checkbox.id)
+
+        with CaptureQueriesContext(connection) as queries:
+            build_report(self.survey.id, row_question_id=self.radio.id, column_question_id=self.checkbox.id)
+        self.assertEqual(len(queries), 1)
+
+        user = get_user_model().objects.create_user(
+            email='late@example.com', password='pass', is_active=True
+        )
+        self.client.force_login(user)
+        self.client.post(reverse('survey_answer', args=[self.survey.id]), build_post_data(self.survey))
+
+        report = build_report(self.survey.id, row_question_id=self.radio.id, column_question_id=self.checkbox.id)
+        self.assertEqual(report['respondent_count'], 4)
+
+    def test_admin_page(self):
+        admin_user = get_user_model().objects.create_superuser(
+            email='admin@example.com', password='pass'
+        )
+        self.client.force_login(admin_user)
+
+        response = self.client.get(
+            reverse('admin:survey_survey_analytics', args=[self.survey.id]),
+            {'row': self.radio.id, 'column': self.checkbox.id, 'segment': 'organization_name'}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('crosstab', response.context['report'])
+        self.assertContains(response, '団体B')
+
+    def test_admin_page_ignores_non_ascii_digits(self):
+        admin_user = get_user_model().objects.create_superuser(
+            email='admin@example.com', password='pass'
+        )
+        self.client.force_login(admin_user)
+
+        response = self.client.get(
+            reverse('admin:survey_survey_analytics', args=[self.survey.id]),
+            {'row': '²', 'column': '١', 'cooccurrence': '３'}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('crosstab', response.context['report'])
+
+
+class SurveyTransferTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = SurveyCategory.objects.create(name='イベント')
+
+    def build_data(self, question_count=50):
+        return {'surveys': [{
+            'title': f'インポート{i}',
+            'category': 'イベント',
+            'description': '説明',
+            'summary': '概要',
+            'start_date': '2025-01-01T10:00:00+09:00',
+            'end_date': '2025-01-31T18:00:00+09:00',
+            'questions': [
+                {
+                    'text': f'質問{j}',
+                    'question_type': 'radio' if j % 2 else 'text',
+                    'is_required': bool(j % 3),
+                    'choices': ['はい', 'いいえ', 'どちらでもない'] if j % 2 else [],
+                }
+                for j in range(1, question_count + 1)
+            ],
+        } for i in range(2)]}
+
+    def test_import_uses_one_insert_per_level(self):
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            surveys = import_surveys(StringIO(json.dumps(self.build_data())), 'json')
+
+        self.assertEqual(len(surveys), 2)
+        inserts = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 3)
+        survey = Survey.objects.get(title='インポート1')
+        self.assertEqual(survey.category, self.category)
+        self.assertEqual(
+            list(survey.questions.order_by('order').values_list('text', flat=True)[:3]),
+            ['質問1', '質問2', '質問3']
+        )
+        self.assertEqual(
+            list(survey.questions.get(order=1).choices.order_by('order').values_list('text', flat=True)),
+            ['はい', 'いいえ', 'どちらでもない']
+        )
+        self.assertEqual(len(get_survey_definition(survey.id).questions), 50)
+
+    def test_invalid_data_is_rejected_without_saving(self):
+        data = self.build_data(question_count=3)
+        data['surveys'][0]['questions'][0]['question_type'] = 'unknown'
+        data['surveys'][1]['category'] = '存在しないカテゴリー'
+        data['surveys'][1]['questions'][0]['choices'] = []
+
+        with self.assertRaises(SurveyImportError) as context:
+            import_surveys(StringIO(json.dumps(data)), 'json')
+
+        self.assertEqual(len(context.exception.errors), 3)
+        self.assertFalse(Survey.objects.exists())
+
+    def test_non_string_values_are_reported(self):
+        data = self.build_data(question_count=3)
+        data['surveys'][0]['category'] = ['イベント']
+        data['surveys'][1]['questions'][0]['question_type'] = ['radio']
+
+        with self.assertRaises(SurveyImportError) as context:
+            import_surveys(StringIO(json.dumps(data)), 'json')
+
+        self.assertEqual(len(context.exception.errors), 2)
+        self.assertFalse(Survey.objects.exists())
+
+    def test_string_is_required_is_parsed(self):
+        data = self.build_data(question_count=2)
+        data['surveys'][0]['questions'][0]['is_required'] = 'false'
+        data['surveys'][0]['questions'][1]['is_required'] = 'true'
+
+        with self.captureOnCommitCallbacks(execute=True):
+            import_surveys(StringIO(json.dumps(data)), 'json')
+
+        survey = Survey.objects.get(title='インポート0')
+        self.assertEqual(
+            list(survey.questions.order_by('order').values_list('is_required', flat=True)), [False, True]
+        )
+
+    def test_non_utf8_csv_is_rejected(self):
+        content = 'kind,text\nsurvey,タイトル\n'.encode('shift_jis')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'surveys.csv')
+            with open(path, 'wb') as file:
+                file.write(content)
+            with self.assertRaisesMessage(CommandError, 'UTF-8'):
+                call_command('import_surveys', path, stdout=StringIO())
+
+        admin_user = get_user_model().objects.create_superuser(email='admin@example.com', password='pass')
+        self.client.force_login(admin_user)
+        response = self.client.post(
+            reverse('admin:survey_survey_import'), {'file': SimpleUploadedFile('surveys.csv', content)}
+        )
+        self.assertEqual(response.context['errors'], ['ファイルをUTF-8のテキストとして読み込めません。'])
+
+    def test_csv_round_trip(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            import_surveys(StringIO(json.dumps(self.build_data(question_count=4))), 'json')
+        exported = ''.join(stream_surveys_csv(Survey.objects.all()))
+        Survey.objects.all().delete()
+
+        import_surveys(StringIO(exported.lstrip('\ufeff')), 'csv')
+
+        survey = Survey.objects.get(title='インポート0')
+        self.assertEqual(survey.questions.count(), 4)
+        self.assertEqual(QuestionChoice.objects.filter(question__survey=survey).count(), 6)
+        self.assertFalse(survey.questions.get(order=3).is_required)
+
+    def test_json_export_is_valid(self):
+        survey = create_survey(question_count=3)
+
+        data = json.loads(''.join(stream_surveys_json(Survey.objects.filter(pk=survey.pk))))
+
+        self.assertEqual(data['surveys'][0]['title'], survey.title)
+        self.assertEqual(data['surveys'][0]['questions'][2]['choices'], ['選択肢1', '選択肢2', '選択肢3'])
+
+    def test_commands(self):
+        create_survey(question_count=3, title='コマンド')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'surveys.json')
+            call_command('export_surveys', path, stdout=StringIO())
+            call_command('import_surveys', path, stdout=StringIO())
+
+        self.assertEqual(Survey.objects.filter(title='コマンド').count(), 2)
+
+    def test_admin_upload(self):
+        admin_user = get_user_model().objects.create_superuser(email='admin@example.com', password='pass')
+        self.client.force_login(admin_user)
+        self.assertContains(
+            self.client.get(reverse('admin:survey_survey_changelist')),
+            reverse('admin:survey_survey_import')
+        )
+        upload = SimpleUploadedFile(
+            'surveys.json', json.dumps(self.build_data(question_count=2)).encode('utf-8')
+        )
+
+        response = self.client.post(reverse('admin:survey_survey_import'), {'file': upload})
+
+        self.assertRedirects(response, reverse('admin:survey_survey_changelist'))
+        self.assertEqual(Survey.objects.count(), 2)
+
+
+class SurveyCloneTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_clone_uses_constant_queries(self):
+        small = [create_survey(question_count=3, title='小')]
+        large = [create_survey(question_count=20, title=f'大{i}') for i in range(3)]
+
+        with CaptureQueriesContext(connection) as few:
+            clone_surveys(small)
+        with CaptureQueriesContext(connection) as many, self.captureOnCommitCallbacks(execute=True):
+            clones = clone_surveys(large, date_shift=timedelta(days=365), title_suffix='（2026）')
+
+        self.assertEqual(len(many), len(few))
+        clone = clones[1]
+        original = large[1]
+        self.assertEqual(clone.title, '大1（2026）')
+        self.assertEqual(clone.start_date, original.start_date + timedelta(days=365))
+        self.assertEqual(
+            list(clone.questions.values_list('text', 'question_type', 'order')),
+            list(original.questions.values_list('text', 'question_type', 'order'))
+        )
+        self.assertEqual(
+            list(QuestionChoice.objects.filter(question__survey=clone).values_list('question__order', 'text', 'order')),
+            list(QuestionChoice.objects.filter(question__survey=original).values_list('question__order', 'text', 'order'))
+        )
+        self.assertEqual(len(get_survey_definition(clone.id).questions), 20)
+
+    def test_admin_action(self):
+        admin_user = get_user_model().objects.create_superuser(email='admin@example.com', password='pass')
+        self.client.force_login(admin_user)
+        surveys = [create_survey(question_count=3, title=f'元{i}') for i in range(2)]
+        data = {
+            'action': 'duplicate_surveys',
+            '_selected_action': [survey.id for survey in surveys],
+        }
+
+        response = self.client.post(reverse('admin:survey_survey_changelist'), data)
+        self.assertContains(response, 'アンケートの複製')
+        self.assertEqual(Survey.objects.count(), 2)
+
+        response = self.client.post(
+            reverse('admin:survey_survey_changelist'),
+            {**data, 'apply': '1', 'shift_days': '7', 'title_suffix': '（次回）'},
+            follow=True
+        )
+        self.assertContains(response, '2件のアンケートを複製しました。')
+        self.assertEqual(
+            Survey.objects.get(title='元0（次回）').end_date, surveys[0].end_date + timedelta(days=7)
+        )
+
+
+class OrderingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        admin_user = get_user_model().objects.create_superuser(email='admin@example.com', password='pass')
+        self.client.force_login(admin_user)
+
+    def post_json(self, url, data):
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+    def test_new_categories_are_appended(self):
+        first = SurveyCategory.objects.create(name='A')
+        second = SurveyCategory.objects.create(name='B')
+
+        self.assertEqual((first.order, second.order), (1, 2))
+        response = self.client.get(reverse('admin:survey_surveycategory_add'))
+        self.assertNotIn('order', response.context['adminform'].form.fields)
+
+    def test_reorder_categories_in_one_update(self):
+        categories = [SurveyCategory.objects.create(name=name) for name in 'ABC']
+        get_navigation_categories()
+
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            response = self.post_json(
+                reverse('admin:survey_surveycategory_reorder'),
+                {'ids': [categories[2].id, categories[0].id, categories[1].id]}
+            )
+
+        self.assertEqual(response.json(), {'updated': 3})
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(list(SurveyCategory.objects.values_list('name', flat=True)), ['C', 'A', 'B'])
+        self.assertEqual([category.name for category in get_navigation_categories()], ['C', 'A', 'B'])
+
+    def test_first_category_order_is_allocated_in_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            category = SurveyCategory.objects.create(name='A')
+
+        self.assertEqual(category.order, 1)
+        inserts = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 1)
+        self.assertIn('SELECT', inserts[0])
+        self.assertFalse(any(query['sql'].startswith('SELECT MAX') for query in queries.captured_queries))
+
+    def test_reorder_questions_and_choices(self):
+        survey = create_survey(question_count=3)
+        questions = list(survey.questions.order_by('order'))
+        get_survey_definition(survey.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_json(
+                reverse('admin:survey_survey_reorder_questions', args=[survey.id]),
+                {'ids': [question.id for question in reversed(questions)]}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [question.id for question in get_survey_definition(survey.id).questions],
+            [question.id for question in reversed(questions)]
+        )
+
+        choice_question = questions[2]
+        choices = list(choice_question.choices.order_by('order'))
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            response = self.post_json(
+                reverse('admin:survey_survey_reorder_choices', args=[survey.id, choice_question.id]),
+                {'ids': [choices[1].id, choices[2].id, choices[0].id]}
+            )
+        self.assertEqual(response.json(), {'updated': 3})
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        definition = get_survey_definition(survey.id)
+        self.assertEqual(
+            [choice.text for choice in definition.questions[0].choices],
+            ['選択肢2', '選択肢3', '選択肢1']
+        )
+
+    def test_reorder_choices_of_other_survey_is_not_found(self):
+        survey = create_survey(question_count=3)
+        other = create_survey(question_count=3)
+        question = other.questions.order_by('order').last()
+
+        response = self.post_json(
+            reverse('admin:survey_survey_reorder_choices', args=[survey.id, question.id]),
+            {'ids': list(question.choices.values_list('id', flat=True))}
+        )
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_changelist_wires_reorder_endpoint(self):
+        SurveyCategory.objects.create(name='A')
+
+        response = self.client.get(reverse('admin:survey_surveycategory_changelist'))
+        self.assertContains(response, reverse('admin:survey_surveycategory_reorder'))
+        self.assertContains(response, 'js/category_reorder.js')
+
+        # 一部のカテゴリーしか表示されない場合は並べ替えできない
+        response = self.client.get(reverse('admin:survey_surveycategory_changelist'), {'q': 'A'})
+        self.assertNotContains(response, reverse('admin:survey_surveycategory_reorder'))
+
+    def test_bool_ids_are_rejected(self):
+        categories = [SurveyCategory.objects.create(name=name) for name in 'AB']
+
+        response = self.post_json(
+            reverse('admin:survey_surveycategory_reorder'), {'ids': [categories[1].id, True]}
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(SurveyCategory.objects.values_list('name', flat=True)), ['A', 'B'])
+
+    def test_incomplete_order_is_rejected(self):
+        categories = [SurveyCategory.objects.create(name=name) for name in 'ABC']
+
+        response = self.post_json(
+            reverse('admin:survey_surveycategory_reorder'),
+            {'ids': [categories[2].id, categories[0].id]}
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(SurveyCategory.objects.values_list('name', flat=True)), ['A', 'B', 'C'])
@@ -0,0 +1,297 @@
+"""
+アンケート定義のインポート・エクスポート
+
+アンケート・質問・選択肢の定義を JSON または CSV で入出力します。
+インポートは全体を検証してからエラーがない場合にのみ、
+bulk モジュールで階層ごとに一括登録します（1つのトランザクション）。
+エクスポートはアンケートを少しずつ読み込みながら文字列を順に返すため、
+StreamingHttpResponse やファイルへの書き出しにそのまま使えます。
+
+JSON の形式:
+    {"surveys": [{"title": ..., "category": カテゴリー名またはnull,
+                  "description": ..., "summary": ...,
+                  "start_date": ISO 8601, "end_date": ISO 8601,
+                  "questions": [{"text": ..., "question_type": ..., "is_required": true,
+                                 "choices": ["選択肢1", ...]}]}]}
+
+CSV の形式（1行が1つのアンケート・質問・選択肢。質問・選択肢は直前のアンケート・質問に属する）:
+    kind,text,question_type,is_required,category,description,summary,start_date,end_date
+    survey,タイトル,,,カテゴリー名,説明,概要,2025-01-01T10:00:00+09:00,2025-01-31T18:00:00+09:00
+    question,質問文,radio,1,,,,,
+    choice,選択肢,,,,,,,
+"""
+
+import csv
+import io
+import json
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .bulk import QuestionTree, SurveyTree, bulk_create_surveys
+from .definitions import CHOICE_QUESTION_TYPES
+from .exports import Echo
+from .models import Question, QuestionChoice, Survey, SurveyCategory
+
+CSV_FIELDS = (
+    'kind', 'text', 'question_type', 'is_required', 'category',
+    'description', 'summary', 'start_date', 'end_date',
+)
+
+EXPORT_CHUNK_SIZE = 50
+
+QUESTION_TYPES = {question_type for question_type, _label in Question.QUESTION_TYPES}
+TRUE_VALUES = {'1', 'true', 'yes', 'y', '必須'}
+DECODE_ERROR = 'ファイルをUTF-8のテキストとして読み込めません。'
+
+
+class SurveyImportError(Exception):
+    """インポートするデータに誤りがある場合の例外（全てのエラーを保持する）"""
+
+    def __init__(self, errors):
+        super().__init__('\n'.join(errors))
+        self.errors = errors
+
+
+def load_json(file):
+    """JSON を検証前のアンケート定義（辞書）のリストとして読み込む"""
+    try:
+        data = json.load(file)
+    except UnicodeDecodeError:
+        raise SurveyImportError([DECODE_ERROR])
+    except ValueError as e:
+        raise SurveyImportError([f'JSONを読み込めません: {e}'])
+    if isinstance(data, dict):
+        data = data.get('surveys', [data])
+    if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+        raise SurveyImportError(['JSONはアンケートのリスト、または "surveys" キーを持つオブジェクトにしてください。'])
+    return data
+
+
+def load_csv(file):
+    """CSV を検証前のアンケート定義（辞書）のリストとして読み込む"""
+    try:
+        rows = list(csv.DictReader(file))
+    except UnicodeDecodeError:
+        raise SurveyImportError([DECODE_ERROR])
+    except csv.Error as e:
+        raise SurveyImportError([f'CSVを読み込めません: {e}'])
+    surveys = []
+    errors = []
+    for line_number, row in enumerate(rows, start=2):
+        kind = (row.get('kind') or '').strip()
+        text = row.get('text') or ''
+        if kind == 'survey':
+            surveys.append({
+                'title': text,
+                'category': row.get('category') or None,
+                'description': row.get('description') or '',
+                'summary': row.get('summary') or '',
+                'start_date': row.get('start_date') or '',
+                'end_date': row.get('end_date') or '',
+                'questions': [],
+            })
+        elif kind == 'question' and surveys:
+            surveys[-1]['questions'].append({
+                'text': text,
+                'question_type': (row.get('question_type') or '').strip(),
+                'is_required': _parse_bool(row.get('is_required') or ''),
+                'choices': [],
+            })
+        elif kind == 'choice' and surveys and surveys[-1]['questions']:
+            surveys[-1]['questions'][-1]['choices'].append(text)
+        else:
+            errors.append(f'{line_number}行目: kind "{kind}" の行をこの位置に置くことはできません。')
+    if errors:
+        raise SurveyImportError(errors)
+    return surveys
+
+
+def _parse_bool(value):
+    """真偽値に変換（文字列は TRUE_VALUES に含まれる場合のみ真）"""
+    if isinstance(value, str):
+        return value.strip().lower() in TRUE_VALUES
+    return bool(value)
+
+
+def _parse_date(value):
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = parse_datetime(value.strip())
+    except ValueError:
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _check_length(errors, location, label, value, max_length=None):
+    if not isinstance(value, str) or not value.strip():
+        errors.append(f'{location}: {label}を入力してください。')
+    elif max_length is not None and len(value) > max_length:
+        errors.append(f'{location}: {label}は{max_length}文字以内で入力してください。')
+
+
+def build_survey_trees(data):
+    """
+    読み込んだ定義を検証し、未保存のモデルの木構造に変換する
+
+    全てのアンケート・質問・選択肢を検証してから、まとめてエラーを報告します。
+    カテゴリーは名前で指定し、既存のカテゴリーのみ使用できます。
+
+    Raises:
+        SurveyImportError: 1件以上のエラーがある場合
+    """
+    category_names = {
+        item.get('category') for item in data if isinstance(item.get('category'), str)
+    }
+    categories = {
+        category.name: category
+        for category in SurveyCategory.objects.filter(name__in=category_names)
+    }
+
+    errors = []
+    trees = []
+    for survey_index, item in enumerate(data, start=1):
+        location = f'アンケート{survey_index}'
+        _check_length(errors, location, 'タイトル', item.get('title'), 200)
+        _check_length(errors, location, '説明', item.get('description'))
+        _check_length(errors, location, '概要', item.get('summary'), 500)
+        category = None
+        if item.get('category') and not isinstance(item['category'], str):
+            errors.append(f'{location}: カテゴリーはカテゴリー名の文字列で指定してください。')
+        elif item.get('category'):
+            category = categories.get(item['category'])
+            if category is None:
+                errors.append(f'{location}: カテゴリー「{item["category"]}」が見つかりません。')
+        start_date = _parse_date(item.get('start_date'))
+        end_date = _parse_date(item.get('end_date'))
+        if start_date is None or end_date is None:
+            errors.append(f'{location}: 公開開始日時・公開終了日時を ISO 8601 形式で入力してください。')
+        elif start_date > end_date:
+            errors.append(f'{location}: 公開終了日時は公開開始日時より後にしてください。')
+
+        tree = SurveyTree(survey=Survey(
+            title=item.get('title') or '',
+            category=category,
+            description=item.get('description') or '',
+            summary=item.get('summary') or '',
+            start_date=start_date,
+            end_date=end_date,
+        ))
+        questions = item.get('questions') or []
+        if not isinstance(questions, list):
+            errors.append(f'{location}: questions はリストにしてください。')
+            questions = []
+        for question_index, question in enumerate(questions, start=1):
+            question_location = f'{location} 質問{question_index}'
+            if not isinstance(question, dict):
+                errors.append(f'{question_location}: 質問の形式が正しくありません。')
+                continue
+            _check_length(errors, question_location, '質問文', question.get('text'), 200)
+            question_type = question.get('question_type') or 'text'
+            choices = question.get('choices') or []
+            if not isinstance(choices, list):
+                errors.append(f'{question_location}: choices はリストにしてください。')
+                choices = []
+            if not isinstance(question_type, str) or question_type not in QUESTION_TYPES:
+                errors.append(f'{question_location}: 質問タイプ「{question_type}」は使用できません。')
+            elif question_type in CHOICE_QUESTION_TYPES and not choices:
+                errors.append(f'{question_location}: 選択式の質問には選択肢が必要です。')
+            elif question_type not in CHOICE_QUESTION_TYPES and choices:
+                errors.append(f'{question_location}: テキストの質問に選択肢は設定できません。')
+            for choice_index, choice in enumerate(choices, start=1):
+                _check_length(errors, f'{question_location} 選択肢{choice_index}', '選択肢', choice, 200)
+
+            tree.questions.append(QuestionTree(
+                question=Question(
+                    text=question.get('text') or '',
+                    question_type=question_type if isinstance(question_type, str) else '',
+                    is_required=_parse_bool(question.get('is_required', True)),
+                    order=question_index,
+                ),
+                choices=[
+                    QuestionChoice(text=choice, order=choice_index)
+                    for choice_index, choice in enumerate(choices, start=1)
+                    if isinstance(choice, str)
+                ],
+            ))
+        trees.append(tree)
+
+    if errors:
+        raise SurveyImportError(errors)
+    return trees
+
+
+def import_surveys(file, file_format):
+    """
+    JSON または CSV のアンケート定義を検証して一括登録する
+
+    Args:
+        file: テキストモードのファイルオブジェクト
+        file_format (str): 'json' または 'csv'
+
+    Returns:
+        list: 登録したアンケート
+    """
+    data = load_json(file) if file_format == 'json' else load_csv(file)
+    return bulk_create_surveys(build_survey_trees(data))
+
+
+def iter_survey_definitions(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """アンケートを質問・選択肢とともにチャンク単位で読み込み、辞書として順に返す"""
+    surveys = queryset.select_related('category').prefetch_related(
+        Prefetch('questions', queryset=Question.objects.order_by('order', 'id')),
+        Prefetch('questions__choices', queryset=QuestionChoice.objects.order_by('order', 'id')),
+    ).order_by('id')
+    for survey in surveys.iterator(chunk_size=chunk_size):
+        yield {
+            'title': survey.title,
+            'category': survey.category.name if survey.category else None,
+            'description': survey.description,
+            'summary': survey.summary,
+            'start_date': timezone.localtime(survey.start_date).isoformat(),
+            'end_date': timezone.localtime(survey.end_date).isoformat(),
+            'questions': [
+                {
+                    'text': question.text,
+                    'question_type': question.question_type,
+                    'is_required': question.is_required,
+                    'choices': [choice.text for choice in question.choices.all()],
+                }
+                for question in survey.questions.all()
+            ],
+        }
+
+
+def stream_surveys_json(queryset):
+    """アンケート定義をJSONとして少しずつ返すジェネレーター"""
+    yield '{"surveys": ['
+    for index, definition in enumerate(iter_survey_definitions(queryset)):
+        yield (',\n' if index else '\n') + json.dumps(definition, ensure_ascii=False, indent=2)
+    yield '\n]}\n'
+
+
+def stream_surveys_csv(queryset):
+    """アンケート定義をCSVとして1行ずつ返すジェネレーター（先頭にBOMを出力）"""
+    writer = csv.writer(Echo())
+    yield '\ufeff'
+    yield writer.writerow(CSV_FIELDS)
+    for definition in iter_survey_definitions(queryset):
+        yield writer.writerow([
+            'survey', definition['title'], '', '', definition['category'] or '',
+            definition['description'], definition['summary'],
+            definition['start_date'], definition['end_date'],
+        ])
+        for question in definition['questions']:
+            yield writer.writerow([
+                'question', question['text'], question['question_type'],
+                '1' if question['is_required'] else '0', '', '', '', '', '',
+            ])
+            for choice in question['choices']:
+                yield writer.writerow(['choice', choice, '', '', '', '', '', '', ''])
+
+
+def open_upload(uploaded_file):
+    """アップロードされたファイルをテキストとして開く（BOM付きUTF-8にも対応）"""
+    return io.TextIOWrapper(uploaded_file.file, encoding='utf-8-sig', newline='')
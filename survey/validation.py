@@ -0,0 +1,99 @@
+"""
+アンケート回答の検証
+
+アンケート定義をもとに、送信された回答全体を1回の走査で検証します。
+データベースへの問い合わせは行わず、質問ごとのエラーを返します。
+"""
+
+from dataclasses import dataclass
+
+TEXT_MAX_LENGTHS = {
+    'text': 255,
+    'textarea': 5000,
+}
+
+REQUIRED_MESSAGE = 'この質問は必須です。'
+INVALID_CHOICE_MESSAGE = '選択肢が正しくありません。'
+MULTIPLE_CHOICES_MESSAGE = '選択肢は1つだけ選択してください。'
+MAX_LENGTH_MESSAGE = '{max_length}文字以内で入力してください。'
+
+
+@dataclass(frozen=True)
+class BoundQuestion:
+    """入力値とエラーを結び付けた質問（フォームの再表示用）"""
+    question: object
+    text: str
+    selected_ids: frozenset
+    errors: tuple
+
+
+def _field_name(question):
+    return f'question_{question.id}'
+
+
+def _is_id(value):
+    """ID として解釈できる文字列か（"²" などの ASCII 以外の数字は int() で変換できないため除く）"""
+    return value.isascii() and value.isdigit()
+
+
+def validate_answers(definition, data):
+    """
+    送信された回答をアンケート定義に照らして検証する
+
+    必須チェック、選択肢IDが質問に属しているかどうか、
+    テキストの文字数制限をまとめて確認します。
+
+    Returns:
+        tuple: (解析済みの回答のリスト, {質問ID: エラーメッセージのリスト})
+            解析済みの回答は (質問の定義, 回答テキスト, 選択肢IDのリスト) のタプル
+    """
+    parsed = []
+    errors = {}
+    for question in definition.questions:
+        key = _field_name(question)
+        question_errors = []
+        text = ''
+        choice_ids = []
+
+        if question.is_choice:
+            raw_values = [value for value in data.getlist(key) if value]
+            if question.question_type != 'checkbox' and len(raw_values) > 1:
+                question_errors.append(MULTIPLE_CHOICES_MESSAGE)
+            for value in raw_values:
+                if not _is_id(value) or int(value) not in question.choice_ids:
+                    question_errors.append(INVALID_CHOICE_MESSAGE)
+                    break
+                if int(value) not in choice_ids:
+                    choice_ids.append(int(value))
+            # 選択肢が未設定の質問は回答できないため必須チェックの対象外
+            if question.is_required and question.choices and not raw_values:
+                question_errors.append(REQUIRED_MESSAGE)
+        else:  # text, textarea
+            text = data.get(key, '')
+            max_length = TEXT_MAX_LENGTHS[question.question_type]
+            if question.is_required and not text.strip():
+                question_errors.append(REQUIRED_MESSAGE)
+            elif len(text) > max_length:
+                question_errors.append(MAX_LENGTH_MESSAGE.format(max_length=max_length))
+
+        if question_errors:
+            errors[question.id] = question_errors
+        parsed.append((question, text, choice_ids))
+    return parsed, errors
+
+
+def bind_questions(definition, data=None, errors=None):
+    """質問ごとに入力値とエラーを結び付ける（未送信の場合は空の入力値）"""
+    errors = errors or {}
+    bound = []
+    for question in definition.questions:
+        key = _field_name(question)
+        bound.append(BoundQuestion(
+            question=question,
+            text=data.get(key, '') if data is not None and not question.is_choice else '',
+            selected_ids=frozenset(
+                int(value) for value in data.getlist(key) if _is_id(value)
+            ) if data is not None and question.is_choice else frozenset(),
+            errors=tuple(errors.get(question.id, ())),
+        ))
+    return bound
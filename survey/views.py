@@ -1,8 +1,18 @@
-from django.views.generic import TemplateView, ListView, DetailView, View
+from django.views.generic import TemplateView, DetailView, View
+from django.views.generic.base import ContextMixin, TemplateResponseMixin
 from django.shortcuts import get_object_or_404, redirect
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.utils import timezone
-from .models import Survey, SurveyCategory, Question, Answer, QuestionChoice
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.template.loader import render_to_string
+from .cache import get_answered_survey_ids, get_navigation_categories, invalidate_answered_surveys
+from .definitions import get_survey_definition
+from .models import Survey, SurveyCategory
+from .pagecache import apply_survey_actions, get_listing_html
+from .pagination import Cursor, paginate_keyset
+from .services import AlreadyAnsweredError, save_submission
+from .validation import bind_questions, validate_answers
 
 class BaseContextMixin:
     """
@@ -10,16 +20,11 @@ class BaseContextMixin:
     """
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['survey_categories'] = SurveyCategory.objects.all().order_by('order', 'name')
+        context['survey_categories'] = get_navigation_categories()
 
         # ログインユーザーの回答済みアンケートを取得
         if self.request.user.is_authenticated:
-            answered_surveys = set(
-                Answer.objects.filter(
-                    user=self.request.user
-                ).values_list('question__survey_id', flat=True).distinct()
-            )
-            context['answered_surveys'] = answered_surveys
+            context['answered_surveys'] = get_answered_survey_ids(self.request.user)
         return context
 
 class HomeView(BaseContextMixin, TemplateView):
@@ -28,24 +33,102 @@ class HomeView(BaseContextMixin, TemplateView):
     """
     template_name = 'survey/home.html'
 
-class CategorySurveyListView(BaseContextMixin, ListView):
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        html = get_listing_html('home', lambda: render_to_string(
+            'survey/_home_listing.html',
+            {'category_sections': self.get_category_sections(context['survey_categories'])}
+        ))
+        context['listing_html'] = apply_survey_actions(
+            html, self.request.user, context.get('answered_surveys', frozenset())
+        )
+        return context
+
+    def get_category_sections(self, categories):
+        """
+        カテゴリーごとに公開中の新しいアンケートを上位N件ずつ取得
+
+        ROW_NUMBER() をカテゴリー単位で計算し、1回のクエリで全カテゴリー分を取得します。
+        """
+        per_category = settings.SURVEY_HOME_SURVEYS_PER_CATEGORY
+        surveys = Survey.objects.open().filter(
+            category__isnull=False
+        ).annotate(
+            rank=Window(
+                expression=RowNumber(),
+                partition_by=F('category_id'),
+                order_by=[F('created_at').desc(), F('id').desc()]
+            )
+        ).filter(rank__lte=per_category).order_by('category_id', 'rank')
+
+        surveys_by_category = {}
+        for survey in surveys:
+            surveys_by_category.setdefault(survey.category_id, []).append(survey)
+        return [
+            (category, surveys_by_category.get(category.id, []))
+            for category in categories
+        ]
+
+class CategorySurveyListView(BaseContextMixin, TemplateView):
     """
     カテゴリー別のアンケート一覧を表示するビュー
+
+    (created_at, id) のキーセットでページ分割し、
+    公開状態（公開中・公開予定・終了）で絞り込むことができます。
+    指定がない場合は、回答できる公開中のアンケートのみを表示します。
     """
-    model = Survey
     template_name = 'survey/category_survey_list.html'
-    context_object_name = 'surveys'
-
-    def get_queryset(self):
-        """カテゴリーに属するアンケートを取得"""
-        self.category = get_object_or_404(SurveyCategory, pk=self.kwargs.get('category_id'))
-        return self.category.surveys.all()
+    STATUS_CHOICES = (
+        ('open', '公開中'),
+        ('upcoming', '公開予定'),
+        ('closed', '終了'),
+        ('all', 'すべて'),
+    )
+    DEFAULT_STATUS = 'open'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['category'] = self.category
+        category_id = self.kwargs.get('category_id')
+        status = self.request.GET.get('status', self.DEFAULT_STATUS)
+        if status not in dict(self.STATUS_CHOICES):
+            status = self.DEFAULT_STATUS
+        after = Cursor.decode(self.request.GET.get('after'))
+        before = Cursor.decode(self.request.GET.get('before')) if after is None else None
+
+        cache_name = ':'.join([
+            'category', str(category_id), status,
+            after.encode() if after else '', before.encode() if before else '',
+        ])
+        html = get_listing_html(
+            cache_name, lambda: self.render_listing(category_id, status, after, before)
+        )
+        context['listing_html'] = apply_survey_actions(
+            html, self.request.user, context.get('answered_surveys', frozenset())
+        )
         return context
 
+    def get_queryset(self, category, status):
+        """カテゴリーに属するアンケートを公開状態で絞り込んで取得"""
+        return category.surveys.with_status(status)
+
+    def render_listing(self, category_id, status, after, before):
+        """カテゴリーに属するアンケート一覧（全ユーザー共通部分）を描画"""
+        category = get_object_or_404(SurveyCategory, pk=category_id)
+        page = paginate_keyset(
+            self.get_queryset(category, status),
+            settings.SURVEY_CATEGORY_PAGE_SIZE,
+            after=after,
+            before=before
+        )
+        return render_to_string('survey/_category_listing.html', {
+            'category': category,
+            'surveys': page.object_list,
+            'page': page,
+            'status': status,
+            'status_choices': self.STATUS_CHOICES,
+            'default_status': self.DEFAULT_STATUS,
+        })
+
 class SurveyDetailView(LoginRequiredMixin, BaseContextMixin, DetailView):
     """
     アンケート詳細・回答ページを表示するビュー
@@ -58,62 +141,49 @@ class SurveyDetailView(LoginRequiredMixin, BaseContextMixin, DetailView):
     def get(self, request, *args, **kwargs):
         # ユーザーがすでにこのアンケートに回答済みか確認
         survey_id = self.kwargs['pk']
-        if Answer.objects.filter(user=request.user, question__survey_id=survey_id).exists():
+        if survey_id in get_answered_survey_ids(request.user):
             return redirect('home')  # 回答済みの場合はホームにリダイレクト
         return super().get(request, *args, **kwargs)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['questions'] = self.object.questions.all().order_by('order')
+        context['questions'] = bind_questions(get_survey_definition(self.object.pk))
         return context
 
     def get_queryset(self):
         """公開期間中のアンケートのみ取得"""
-        now = timezone.now()
-        return Survey.objects.filter(
-            pk=self.kwargs['pk'],
-            start_date__lte=now,
-            end_date__gte=now
+        return Survey.objects.open().select_related('category').filter(
+            pk=self.kwargs['pk']
         )
 
-class SurveyAnswerView(LoginRequiredMixin, View):
+class SurveyAnswerView(LoginRequiredMixin, BaseContextMixin, TemplateResponseMixin, ContextMixin, View):
     """
     アンケートの回答を処理するビュー
+
+    回答に誤りがある場合は、質問ごとのエラーとともに回答ページを再表示します。
     """
+    template_name = 'survey/survey_detail.html'
+
     def post(self, request, *args, **kwargs):
-        survey = get_object_or_404(Survey, pk=self.kwargs['pk'])
+        survey = get_object_or_404(
+            Survey.objects.open().select_related('category'), pk=self.kwargs['pk']
+        )
         user = request.user
 
+        definition = get_survey_definition(survey.id)
+        parsed_answers, errors = validate_answers(definition, request.POST)
+        if errors:
+            return self.render_to_response(self.get_context_data(
+                survey=survey,
+                questions=bind_questions(definition, request.POST, errors),
+                has_errors=True
+            ))
+
         try:
-            for question in survey.questions.all():
-                # 質問タイプに応じて回答データを取得
-                if question.question_type in ['radio', 'select']:
-                    answer_text = ''
-                    answer_choices = [request.POST.get(f'question_{question.id}')]
-                elif question.question_type == 'checkbox':
-                    answer_text = ''
-                    answer_choices = request.POST.getlist(f'question_{question.id}')
-                else:  # text, textarea
-                    answer_text = request.POST.get(f'question_{question.id}', '')
-                    answer_choices = []
-
-                # 回答を保存
-                answer = Answer.objects.create(
-                    user=user,
-                    question=question,
-                    text=answer_text
-                )
-
-                # 選択肢がある場合は保存
-                if answer_choices and any(answer_choices):
-                    choices = QuestionChoice.objects.filter(
-                        id__in=answer_choices,
-                        question=question
-                    )
-                    answer.choices.set(choices)
-
-        except Exception as e:
-            return redirect('survey_detail', survey.id)
+            save_submission(survey, user, parsed_answers)
+        except AlreadyAnsweredError:
+            return redirect('home')  # 回答済みの場合はホームにリダイレクト
+        invalidate_answered_surveys([user.id])
 
         return redirect('survey_complete')
 